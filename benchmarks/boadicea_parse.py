@@ -0,0 +1,70 @@
+"""
+Time and peak memory to get the cancer rates out of a BOADICEA response body:
+loading all of it (as r.json() does) then extract_cancer_rates, against
+extract_cancer_rates_stream. There's no recorded response to hand, so the
+body is the stub's response padded out to roughly the size and shape of a
+real one: risks for every cancer CanRisk reports, ten year and lifetime
+risks, and the incidence rates it was run with.
+
+    python -m benchmarks.boadicea_parse [--age 46] [--number 50]
+"""
+import argparse
+import io
+import json
+import tracemalloc
+from typing import Callable
+
+from benchmarks.utils import best_time
+from premeno.risk_api.canrisk.stub import MAX_AGE, boadicea_response
+from premeno.risk_api.canrisk.utils import extract_cancer_rates, extract_cancer_rates_stream
+
+CANCERS = ("pancreatic", "prostate", "contralateral breast", "male breast")
+
+
+def realistic_response(age: int) -> bytes:
+    response = boadicea_response(age)
+    result = response["pedigree_result"][0]
+    for risks in (result["cancer_risks"], result["baseline_cancer_risks"]):
+        for risk in risks:
+            for cancer in CANCERS:
+                risk[f"{cancer} cancer risk"] = {"decimal": 0.000123, "percent": 0.0123}
+
+    result["ten_yr_cancer_risk"] = result["cancer_risks"][:10]
+    result["lifetime_cancer_risk"] = result["cancer_risks"][-1:]
+    incidence_rates: list[dict[str, float]] = [
+        {"age": at_age, **{cancer: 1.23e-5 * at_age for cancer in CANCERS}}
+        for at_age in range(1, MAX_AGE + 21)
+    ]
+    result["cancer_incidence_rates"] = incidence_rates
+    return json.dumps(response, indent=2).encode()
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--age", type=int, default=46)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    body = realistic_response(args.age)
+    parsers = {
+        "json.loads + extract": lambda: extract_cancer_rates(json.loads(body)),
+        "stream": lambda: extract_cancer_rates_stream(io.BytesIO(body)),
+    }
+    assert parsers["stream"]() == parsers["json.loads + extract"]()
+
+    print(f"{len(body) / 1024:.0f} KiB response")
+    for name, parse in parsers.items():
+        elapsed = best_time(parse, number=args.number)
+        print(f"{name}: {elapsed * 1000:.3f}ms, peak {peak_memory(parse) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
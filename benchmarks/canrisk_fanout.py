@@ -0,0 +1,85 @@
+"""
+Wall-clock time of CanRiskCalc.predict against a local server that takes
+--delay seconds to answer each call, making the three BOADICEA calls (one
+per MHT type) one after another and at the same time. At the same time
+should take about one round trip. Then makes --in-flight predictions at
+once with predict_async (for different women, so each needs its own
+calls), which should also take about one round trip. Cached results are
+cleared first, so every prediction calls the server.
+
+    python -m benchmarks.canrisk_fanout [--delay 0.2] [--requests 5] [--in-flight 200]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.utils import QUESTIONNAIRE, setup_django
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--in-flight", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+    from django.core.cache import caches
+
+    from premeno.risk_api.canrisk.api import reset_canrisk_clients
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import CanRiskCalc
+
+    settings.CANRISK_API_CACHE = False
+    settings.CANRISK_API_TOKEN = ""
+    data = Questionnaire(**QUESTIONNAIRE)
+
+    with running_stub_server(StubConfig(latency=f"fixed:{args.delay}")) as base_url:
+        calc = CanRiskCalc(base_url)
+        calc.predict(data, 5)  # logs in
+
+        for concurrent in (False, True):
+            calc.concurrent = concurrent
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                caches[settings.CANRISK_RESULT_CACHE].clear()
+                results = calc.predict(data, 5)
+            per_request = (time.perf_counter() - start) / args.requests
+
+            assert None not in results.values()
+            print(
+                f"{'concurrent' if concurrent else 'sequential':>10}: {per_request:6.3f}s"
+                f" per request ({per_request / args.delay:4.2f} round trips)"
+            )
+
+        women = [
+            Questionnaire(
+                **dict(QUESTIONNAIRE, height=str(140 + i % 60), weight=str(50 + i // 60))
+            )
+            for i in range(args.in_flight)
+        ]
+
+        async def predict_at_once() -> tuple[float, list]:
+            await calc.predict_async(data, 5)  # logs this event loop's client in
+            await sync_to_async(caches[settings.CANRISK_RESULT_CACHE].clear)()
+            start = time.perf_counter()
+            results = await asyncio.gather(*(calc.predict_async(woman, 5) for woman in women))
+            return time.perf_counter() - start, results
+
+        elapsed, all_results = asyncio.run(predict_at_once())
+
+        assert all(None not in results.values() for results in all_results)
+        print(
+            f"{'async':>10}: {elapsed:6.3f}s for {args.in_flight} requests at once"
+            f" ({elapsed / args.delay:4.2f} round trips)"
+        )
+
+    reset_canrisk_clients()
+
+
+if __name__ == "__main__":
+    main()
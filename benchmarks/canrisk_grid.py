@@ -0,0 +1,91 @@
+"""
+Time for CanRiskGridCalc.predict (interpolating all three MHT types from a
+memory-mapped grid of CanRisk's risks), and how much of the grid file is
+resident after predicting for a spread of questionnaires (all the memory a
+worker needs, and shared with any other worker mapping the same file). The
+grid is DEFAULT_AXES, filled with the stub's risks without calling it.
+
+    python -m benchmarks.canrisk_grid [--number 1000]
+"""
+import argparse
+import os
+import random
+import tempfile
+from typing import Optional
+
+from benchmarks.utils import QUESTIONNAIRE, best_time, setup_django
+
+
+def resident_kib(path: str) -> Optional[int]:
+    """KiB of the mapping of path in memory, where /proc says"""
+    try:
+        with open("/proc/self/smaps") as stream:
+            lines = stream.read().splitlines()
+    except OSError:
+        return None
+
+    resident, in_mapping = 0, False
+    for line in lines:
+        fields = line.split()
+        if "-" in fields[0] and not fields[0].endswith(":"):
+            in_mapping = fields[-1] == path
+        elif in_mapping and fields[0] == "Rss:":
+            resident += int(fields[1])
+
+    return resident
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    import numpy as np
+
+    from premeno.risk_api.canrisk.grid import DEFAULT_AXES, GRID_MHT_STATUSES, CanRiskGrid
+    from premeno.risk_api.canrisk.stub import MAX_AGE, MHT_USE_SCALE
+    from premeno.risk_api.canrisk.surrogate import MAX_HORIZON
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import CanRiskGridCalc
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "canrisk.grid")
+        grid = CanRiskGrid.create(path, DEFAULT_AXES)
+        horizons = np.arange(1, MAX_HORIZON + 1)
+        for i, age in enumerate(DEFAULT_AXES["age"]):
+            for j, mht_status in enumerate(GRID_MHT_STATUSES):
+                risks = 0.3 * MHT_USE_SCALE[mht_status.value] * horizons / 100
+                grid.risks[i, ..., j, :] = np.where(age + horizons <= MAX_AGE, risks, np.nan)
+        grid.flush()
+        del grid
+
+        calc = CanRiskGridCalc(path)
+        data = Questionnaire(**QUESTIONNAIRE)
+        elapsed = best_time(lambda: calc.predict(data, 5), number=args.number)
+
+        rng = random.Random(0)
+        for _ in range(args.number):
+            calc.predict(
+                Questionnaire(
+                    **dict(
+                        QUESTIONNAIRE,
+                        height=rng.uniform(155, 170),
+                        weight=rng.uniform(60, 75),
+                        alcohol_use=rng.uniform(0, 14),
+                        age_at_menarche=rng.randint(11, 15),
+                    )
+                ),
+                5,
+            )
+
+        print(f"grid file: {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        print(f"CanRisk grid: {elapsed * 1e6:.1f}us per prediction, {calc.predict(data, 5)}")
+        resident = resident_kib(path)
+        if resident is not None:
+            print(f"resident after {args.number} varied predictions: {resident} KiB")
+
+
+if __name__ == "__main__":
+    main()
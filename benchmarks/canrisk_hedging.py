@@ -0,0 +1,70 @@
+"""
+Latency of BOADICEA calls, one after another, to a local server whose
+latency is heavy-tailed (--latency, pareto by default), without hedging and
+then hedging calls slower than the --percentile of recent ones (up to
+--budget of calls). Hedging should cut the tail (p99, max) for a few more
+calls made.
+
+    python -m benchmarks.canrisk_hedging [--latency pareto:0.01,1.5] [--calls 300]
+"""
+import argparse
+import time
+from typing import Optional
+
+from benchmarks.utils import QUESTIONNAIRE, setup_django
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+
+
+def percentile(times: list[float], percent: float) -> float:
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(percent / 100 * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", default="pareto:0.01,1.5")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--percentile", type=float, default=90.0)
+    parser.add_argument("--budget", type=float, default=0.1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+
+    from premeno.risk_api.canrisk.api import CanRiskAPI
+    from premeno.risk_api.canrisk.file import create_canrisk_file
+    from premeno.risk_api.canrisk.hedge import Hedger
+    from premeno.risk_api.canrisk.risk_factors import MhtStatus
+    from premeno.risk_api.metrics import COUNTERS
+    from premeno.risk_api.questionnaire import Questionnaire
+
+    settings.CANRISK_API_CACHE = False
+    settings.CANRISK_API_TOKEN = StubConfig().token  # no logging in
+    pedigree = str(create_canrisk_file(Questionnaire(**QUESTIONNAIRE), MhtStatus.Never))
+    hedgers: dict[str, Optional[Hedger]] = {
+        "unhedged": None,
+        "hedged": Hedger("canrisk", args.percentile, args.budget),
+    }
+    for name, hedger in hedgers.items():
+        COUNTERS.reset()
+        # latencies drawn from the same seed each time
+        with running_stub_server(StubConfig(latency=args.latency, seed=0)) as base_url:
+            canrisk = CanRiskAPI("bench", "bench", base_url, hedger=hedger)
+            times = []
+            for _ in range(args.calls):
+                start = time.perf_counter()
+                canrisk.boadicea(pedigree)
+                times.append(time.perf_counter() - start)
+
+        calls = args.calls + COUNTERS.get("canrisk.hedge.sent")
+        print(
+            f"{name:>8}: p50 {percentile(times, 50) * 1e3:6.1f}ms,"
+            f" p90 {percentile(times, 90) * 1e3:6.1f}ms,"
+            f" p99 {percentile(times, 99) * 1e3:6.1f}ms, max {max(times) * 1e3:6.1f}ms;"
+            f" {calls} calls made ({COUNTERS.get('canrisk.hedge.won')} hedges won)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Latency of risk_predictions while CanRisk is slow (a local server that takes
+--delay seconds to answer) and while it's down (answering 503s), with the
+latency budget set to --budget seconds. Requests should take no longer than
+the budget while it's slow, and fall back to Gail; once the circuit opens
+while it's down, requests shouldn't call it at all.
+
+    python -m benchmarks.canrisk_outage [--delay 2] [--budget 0.5] [--requests 10]
+"""
+import argparse
+import functools
+import time
+from unittest.mock import patch
+
+from benchmarks.utils import QUESTIONNAIRE, setup_django
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--delay", type=float, default=2.0)
+    parser.add_argument("--budget", type=float, default=0.5)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.core.cache import caches
+
+    from premeno.risk_api.canrisk.api import reset_canrisk_clients
+    from premeno.risk_api.metrics import COUNTERS
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import CanRiskCalc, Risk, risk_predictions
+
+    settings.CANRISK_API_CACHE = False
+    settings.CANRISK_API_TOKEN = StubConfig().token  # no logging in
+    settings.CANRISK_LATENCY_BUDGET = args.budget
+    data = Questionnaire(**QUESTIONNAIRE)
+
+    outages = {
+        "slow": StubConfig(latency=f"fixed:{args.delay}"),
+        "down": StubConfig(error_rate=1.0),
+    }
+    for outage, config in outages.items():
+        reset_canrisk_clients()
+        COUNTERS.reset()
+
+        with running_stub_server(config) as base_url:
+            models = {Risk.BREAST_CANCER: functools.partial(CanRiskCalc, base_url)}
+            with patch.dict("premeno.risk_api.risk.RISK_MODELS", models):
+                times, sources = [], set()
+                for _ in range(args.requests):
+                    caches[settings.CANRISK_RESULT_CACHE].clear()
+                    start = time.perf_counter()
+                    results = risk_predictions(data, 5)
+                    times.append(time.perf_counter() - start)
+                    sources.add(results["sources"]["breast_cancer"])
+
+        print(
+            f"{outage:>5}: max {max(times):6.3f}s, mean {sum(times) / len(times):6.3f}s"
+            f" per request from {', '.join(sorted(sources))};"
+            f" {COUNTERS.get('canrisk.requests')} calls made,"
+            f" {COUNTERS.get('canrisk.breaker.rejected')} stopped by the breaker"
+        )
+
+    reset_canrisk_clients()
+
+
+if __name__ == "__main__":
+    main()
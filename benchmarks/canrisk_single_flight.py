@@ -0,0 +1,58 @@
+"""
+Upstream calls made for --requests identical predictions made at once (as a
+burst of double-submits or retries would), against a local CanRisk server
+that takes --delay seconds to answer. With single-flight there should be
+one call per MHT type, however many requests there are.
+
+    python -m benchmarks.canrisk_single_flight [--delay 0.2] [--requests 20]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import QUESTIONNAIRE, setup_django
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.core.cache import caches
+
+    from premeno.risk_api.canrisk.api import reset_canrisk_clients
+    from premeno.risk_api.metrics import COUNTERS
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import CanRiskCalc
+
+    settings.CANRISK_API_CACHE = False
+    settings.CANRISK_API_TOKEN = StubConfig().token  # no logging in
+    data = Questionnaire(**QUESTIONNAIRE)
+
+    with running_stub_server(StubConfig(latency=f"fixed:{args.delay}")) as base_url:
+        calc = CanRiskCalc(base_url)
+        caches[settings.CANRISK_RESULT_CACHE].clear()
+        COUNTERS.reset()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.requests) as pool:
+            all_results = list(pool.map(lambda _: calc.predict(data, 5), range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    assert all(None not in results.values() for results in all_results)
+    print(
+        f"{args.requests} identical requests in {elapsed:.3f}s:"
+        f" {COUNTERS.get('canrisk.requests')} upstream calls,"
+        f" {COUNTERS.get('canrisk.single_flight.shared')} shared"
+    )
+
+    reset_canrisk_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Time for CanRiskSurrogateCalc.predict (all three MHT types from the local
+surrogate) against CanRiskCalc.predict with the CanRisk API replaced by an
+instant fake, so the surrogate's own cost is compared with our side of a
+CanRisk prediction (a real one adds seconds of network round trips). The
+surrogate is fitted to the stub's responses for the built-in warming grid.
+
+    python -m benchmarks.canrisk_surrogate [--number 1000]
+"""
+import argparse
+import os
+import tempfile
+from unittest.mock import patch
+
+from benchmarks.utils import QUESTIONNAIRE, FakeCanRiskAPI, best_time, setup_django
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    import numpy as np
+
+    from premeno.risk_api.canrisk.stub import MHT_USE_SCALE, boadicea_response
+    from premeno.risk_api.canrisk.surrogate import (
+        CanRiskSurrogate,
+        horizon_risks,
+        surrogate_features,
+    )
+    from premeno.risk_api.canrisk.utils import extract_cancer_rates
+    from premeno.risk_api.management.commands.warm_canrisk_cache import DEFAULT_GRID, grid_profiles
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import MHT_TO_STATUS, CanRiskCalc, CanRiskSurrogateCalc
+
+    features, risks = [], []
+    for profile in grid_profiles(DEFAULT_GRID):
+        data = Questionnaire(**profile)
+        for mht_status in MHT_TO_STATUS.values():
+            rates = extract_cancer_rates(boadicea_response(int(data.age), mht_status.value))
+            features.append(surrogate_features(data, mht_status))
+            risks.append(horizon_risks(rates, int(data.age)))
+    surrogate = CanRiskSurrogate.fit(np.array(features), np.array(risks))
+
+    data = Questionnaire(**QUESTIONNAIRE)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "surrogate.npz")
+        surrogate.save(path)
+        surrogate_calc = CanRiskSurrogateCalc(path)
+        predicted = surrogate_calc.predict(data, 5)
+
+        with patch("premeno.risk_api.risk.get_canrisk_api", lambda url: FakeCanRiskAPI("", "")):
+            with patch("premeno.risk_api.risk.get_or_fetch_rates", lambda key, fetch: fetch()):
+                timings = {
+                    "CanRisk (instant fake API)": best_time(
+                        lambda: CanRiskCalc().predict(data, 5), number=args.number // 10
+                    ),
+                    "CanRisk surrogate": best_time(
+                        lambda: surrogate_calc.predict(data, 5), number=args.number
+                    ),
+                }
+
+    for name, elapsed in timings.items():
+        print(f"{name:>28}: {elapsed * 1e6:8.1f}us per prediction")
+
+    expected = {
+        mht_type.value: 0.3 * 5 * MHT_USE_SCALE[mht_status.value] / 100
+        for mht_type, mht_status in MHT_TO_STATUS.items()
+    }
+    print(f"5 year risks: surrogate {predicted}, stub {expected}")
+
+
+if __name__ == "__main__":
+    main()
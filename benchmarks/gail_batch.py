@@ -0,0 +1,82 @@
+"""
+Compares GailModel.predict (one woman at a time) with GailModel.predict_batch
+on random cohorts. The scalar path is timed on a sample of each cohort and
+scaled up, as a million rows one at a time takes minutes.
+
+    python -m benchmarks.gail_batch [--rows 10000 1000000] [--sample 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from premeno.risk_api.gail.factors import GAIL_FACTORS_DTYPE, GailFactors
+from premeno.risk_api.gail.model import GailModel
+from premeno.risk_api.gail.race import Race
+
+HYPERPLASIA_FACTORS = np.array([1.0, 0.93, 1.82])
+
+
+def random_cohort(rows: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    factors = np.empty(rows, dtype=GAIL_FACTORS_DTYPE)
+    factors["age"] = rng.uniform(35, 70, rows)
+    factors["number_of_biopsies"] = rng.integers(0, 3, rows)
+    factors["age_at_menarche"] = rng.integers(0, 3, rows)
+    factors["age_at_first_child"] = rng.integers(0, 4, rows)
+    factors["number_of_relatives"] = rng.integers(0, 3, rows)
+    factors["relative_risk_factor"] = rng.choice(HYPERPLASIA_FACTORS, rows)
+    factors["race"] = rng.integers(0, len(Race), rows)
+    return factors
+
+
+def scalar_predict(factors: np.ndarray, years: float) -> np.ndarray:
+    races = list(Race)
+    return np.array(
+        [
+            GailModel(
+                GailFactors(
+                    float(row["age"]),
+                    int(row["number_of_biopsies"]),
+                    int(row["age_at_menarche"]),
+                    int(row["age_at_first_child"]),
+                    int(row["number_of_relatives"]),
+                    float(row["relative_risk_factor"]),
+                    races[row["race"]],
+                )
+            ).predict(years)
+            for row in factors
+        ]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--sample", type=int, default=10_000)
+    parser.add_argument("--years", type=float, default=5)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        factors = random_cohort(rows)
+        sample = factors[: args.sample]
+
+        start = time.perf_counter()
+        scalar = scalar_predict(sample, args.years)
+        scalar_time = (time.perf_counter() - start) * rows / len(sample)
+
+        start = time.perf_counter()
+        batch = GailModel.predict_batch(factors, args.years)
+        batch_time = time.perf_counter() - start
+
+        max_diff = np.max(np.abs(batch[: len(sample)] - scalar))
+        print(
+            f"{rows:>9} rows: scalar {scalar_time:8.3f}s"
+            f"{' (scaled)' if len(sample) < rows else '         '}"
+            f"  batch {batch_time:7.3f}s  speedup {scalar_time / batch_time:7.1f}x"
+            f"  max abs diff {max_diff:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
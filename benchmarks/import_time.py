@@ -0,0 +1,39 @@
+"""
+Cold import time of the Gail model on its own, and of the whole risk module
+(which pulls in Django, pydantic and requests). Each import is timed in a
+fresh interpreter so nothing is already in sys.modules.
+
+    python -m benchmarks.import_time
+"""
+import statistics
+import subprocess
+import sys
+
+MODULES = ("premeno.risk_api.gail.model", "premeno.risk_api.risk")
+
+TIMER = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def import_time(module: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout)
+
+
+def main(repeat: int = 7) -> None:
+    for module in MODULES:
+        times = [import_time(module) for _ in range(repeat)]
+        print(f"{module}: {statistics.median(times) * 1e3:.1f} ms (median of {repeat})")
+
+
+if __name__ == "__main__":
+    main()
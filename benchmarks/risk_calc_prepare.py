@@ -0,0 +1,45 @@
+"""
+Per-request cost of RiskCalc.predict, which prepares each questionnaire once
+for all the MHT types, against calling predict_mht_type for each type (how
+predict used to work). The CanRisk API is replaced by an instant fake, so
+only our side of the work is timed, and a new client is made for each
+prepare (as before clients were shared) to count the logins.
+
+    python -m benchmarks.risk_calc_prepare
+"""
+from unittest.mock import patch
+
+from benchmarks.utils import QUESTIONNAIRE, FakeCanRiskAPI, best_time, setup_django
+
+
+def main() -> None:
+    setup_django()
+
+    from premeno.risk_api.questionnaire import MhtType, Questionnaire
+    from premeno.risk_api.risk import CanRiskCalc, GailRiskCalc
+
+    data = Questionnaire(**QUESTIONNAIRE)
+    with patch("premeno.risk_api.risk.get_canrisk_api", lambda url: FakeCanRiskAPI("", "")):
+        for calc in (GailRiskCalc(), CanRiskCalc()):
+            FakeCanRiskAPI.logins = 0
+            per_type = best_time(
+                lambda: [calc.predict_mht_type(data, 5, mht_type) for mht_type in MhtType]
+            )
+            logins_per_type = FakeCanRiskAPI.logins
+
+            FakeCanRiskAPI.logins = 0
+            prepared = best_time(lambda: calc.predict(data, 5))
+            logins_prepared = FakeCanRiskAPI.logins
+
+            logins = ""
+            if logins_per_type:
+                logins = f"  (logins per request {logins_per_type // logins_prepared} -> 1)"
+            print(
+                f"{calc.name:>8}: per MHT type {per_type * 1e6:8.1f}us"
+                f"  prepared once {prepared * 1e6:8.1f}us"
+                f"  speedup {per_type / prepared:4.1f}x{logins}"
+            )
+
+
+if __name__ == "__main__":
+    main()
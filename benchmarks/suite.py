@@ -0,0 +1,151 @@
+"""
+Times each stage of a /api/risk/ request on its own, and the whole request
+end to end, with the CanRisk API replaced by an instant fake. Results are
+written as JSON, and can be compared with a baseline written by an earlier
+run (e.g. on main) to catch regressions:
+
+    python -m benchmarks.suite --output benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+Exits with status 1 if any stage got slower than the baseline by more than
+the tolerance.
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime, timezone
+from typing import Callable
+from unittest.mock import patch
+
+from benchmarks.utils import QUESTIONNAIRE, FakeCanRiskAPI, setup_django
+from premeno.risk_api.canrisk.stub import boadicea_response
+
+
+def stages() -> dict[str, Callable[[], object]]:
+    """The function to time for each stage, in the order a request runs them"""
+    from rest_framework.test import APIRequestFactory
+
+    from premeno.risk_api.canrisk.file import create_canrisk_file
+    from premeno.risk_api.canrisk.risk_factors import MhtStatus
+    from premeno.risk_api.canrisk.utils import extract_cancer_rates, interpolate_rate
+    from premeno.risk_api.gail import model as gail_model
+    from premeno.risk_api.gail.factors import GailFactors
+    from premeno.risk_api.gail.model import GailModel
+    from premeno.risk_api.questionnaire import Questionnaire
+    from premeno.risk_api.risk import risk_predictions
+    from premeno.risk_api.views import RiskPredictionsViewSet
+
+    data = Questionnaire(**QUESTIONNAIRE)
+    factors = GailFactors.from_questionnaire(data)
+    boadicea = boadicea_response(int(data.age))
+
+    def gail_predict_uncached() -> float:
+        return gail_model._predict(factors, 5)
+
+    def canrisk_rates() -> float:
+        rates = extract_cancer_rates(boadicea)
+        return interpolate_rate(rates["age"], rates["individual"], int(data.age) + 5)
+
+    view = RiskPredictionsViewSet.as_view({"post": "create"})
+    factory = APIRequestFactory()
+
+    def request() -> object:
+        return view(factory.post("/api/risk/", QUESTIONNAIRE, format="json"))
+
+    return {
+        "questionnaire": lambda: Questionnaire(**QUESTIONNAIRE),
+        "gail_factors": lambda: GailFactors.from_questionnaire(data),
+        "gail_predict": lambda: GailModel(factors).predict(5),
+        "gail_predict_uncached": gail_predict_uncached,
+        "canrisk_file": lambda: str(create_canrisk_file(data, MhtStatus.Never)),
+        "canrisk_rates": canrisk_rates,
+        "risk_predictions": lambda: risk_predictions(data, 5),
+        "request": request,
+    }
+
+
+def time_stage(func: Callable[[], object], repeat: int) -> dict:
+    """Best time per call over repeats of about 0.2s each"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    return {"seconds": best, "number": number, "repeat": repeat}
+
+
+def run(repeat: int) -> dict:
+    from premeno.risk_api.canrisk.api import reset_canrisk_clients
+
+    reset_canrisk_clients()
+    with patch("premeno.risk_api.canrisk.api.CanRiskAPI", FakeCanRiskAPI):
+        results = {name: time_stage(func, repeat) for name, func in stages().items()}
+    reset_canrisk_clients()
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints each stage against the baseline, returning the ones that regressed"""
+    regressions = []
+    for name, result in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            print(f"{name:>22}: {result['seconds'] * 1e6:10.1f}us  (not in baseline)")
+            continue
+
+        ratio = result["seconds"] / before["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:>22}: {result['seconds'] * 1e6:10.1f}us"
+            f"  baseline {before['seconds'] * 1e6:10.1f}us  {ratio:5.2f}x{flag}"
+        )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results written by an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction a stage may slow down before it counts as a regression",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        for name, result in results["stages"].items():
+            print(f"{name:>22}: {result['seconds'] * 1e6:10.1f}us")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import time
+from typing import Callable
+
+from premeno.risk_api.canrisk.stub import boadicea_response
+from premeno.risk_api.canrisk.utils import extract_cancer_rates
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [],
+}
+
+
+def setup_django() -> None:
+    """Benchmarks that touch settings need Django configured (the test settings will do)"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.test")
+
+    import django
+
+    django.setup()
+
+
+class FakeCanRiskAPI:
+    """Stands in for CanRiskAPI, answering instantly so only our side of the work is timed"""
+
+    logins = 0
+
+    def __init__(self, username: str, password: str, *args) -> None:
+        FakeCanRiskAPI.logins += 1
+
+    def boadicea(self, pedigree_data: str) -> dict:
+        return boadicea_response(47)
+
+    def boadicea_rates(self, pedigree_data: str) -> dict:
+        return extract_cancer_rates(self.boadicea(pedigree_data))
+
+
+def best_time(func: Callable[[], object], repeat: int = 5, number: int = 100) -> float:
+    """Best mean time per call (in seconds) over a few repeats"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+
+    return best
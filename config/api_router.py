@@ -1,7 +1,12 @@
 from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
-from premeno.risk_api.views import RiskPredictionsViewSet
+from premeno.risk_api.views import (
+    RiskJobViewSet,
+    RiskPredictionsViewSet,
+    risk_predictions_async_view,
+)
 from premeno.symptoms.views import RiskReportViewSet, SymptomReportViewSet
 from premeno.users.api.views import UserViewSet
 
@@ -11,10 +16,14 @@ else:
     router = SimpleRouter()
 
 router.register("users", UserViewSet)
+router.register("risk/jobs", RiskJobViewSet, basename="risk-jobs")
 router.register("risk", RiskPredictionsViewSet, basename="risk")
 router.register("symptoms/risk_report", RiskReportViewSet, basename="symptoms")
 router.register("symptoms/questionnaire", SymptomReportViewSet, basename="symptoms")
 
 
 app_name = "api"
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    # django-stubs doesn't know views can be async
+    path("risk/async/", risk_predictions_async_view, name="risk-async"),  # type: ignore[arg-type]
+]
@@ -0,0 +1,26 @@
+"""
+ASGI config for Premeno project.
+
+This module contains the ASGI application used by ASGI servers (e.g. uvicorn,
+or gunicorn with uvicorn workers). It should expose a module-level variable
+named ``application``. Under ASGI, async views such as the async risk
+predictions view keep many CanRisk calls in flight on one event loop, and
+job event streams are served without blocking it.
+
+"""
+import os
+import sys
+from pathlib import Path
+
+import django
+
+ROOT_DIR = Path(__file__).resolve(strict=True).parent.parent
+sys.path.append(str(ROOT_DIR / "premeno"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.production")
+
+# as get_asgi_application, but with our handler
+django.setup(set_prefix=False)
+
+from premeno.risk_api.asgi import EventLoopASGIHandler  # noqa: E402
+
+application = EventLoopASGIHandler()
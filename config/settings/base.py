@@ -62,11 +62,69 @@ WSGI_APPLICATION = "config.wsgi.application"
 # API KEYS
 # -----------------------------------------------------------------------------
 #
+# where the CanRisk API is (e.g. a local stand-in from manage.py canrisk_stub)
+CANRISK_API_URL = env.str("CANRISK_API_URL", "https://www.canrisk.org")
 CANRISK_API_TOKEN = env.str("CANRISK_API_TOKEN", "")
 CANRISK_API_USERNAME = env.str("CANRISK_API_USERNAME", "")
 CANRISK_API_PASSWORD = env.str("CANRISK_API_PASSWORD", "")
 CANRISK_API_CACHE = env.str("CANRISK_API_CACHE", True)
 CANRISK_API_CACHE_DAYS = env.str("CANRISK_API_CACHE_DAYS", 7)
+CANRISK_API_POOL_SIZE = env.int("CANRISK_API_POOL_SIZE", 10)
+CANRISK_API_ASYNC_POOL_SIZE = env.int("CANRISK_API_ASYNC_POOL_SIZE", 100)
+CANRISK_API_TIMEOUT = env.float("CANRISK_API_TIMEOUT", 30.0)
+# cache (an alias in CACHES) shared by all workers for CanRisk results, and for how long (seconds)
+CANRISK_RESULT_CACHE = env.str("CANRISK_RESULT_CACHE", "default")
+CANRISK_RESULT_CACHE_TTL = env.int("CANRISK_RESULT_CACHE_TTL", 60 * 60 * 24 * 7)
+# longest (seconds) a worker waits for another to fetch the same CanRisk result (predictions
+# wait no longer than what is left of CANRISK_LATENCY_BUDGET)
+CANRISK_SINGLE_FLIGHT_TIMEOUT = env.float("CANRISK_SINGLE_FLIGHT_TIMEOUT", 30.0)
+# CanRisk isn't called for CANRISK_BREAKER_RESET_TIMEOUT seconds after this many failures in a row
+CANRISK_BREAKER_FAILURES = env.int("CANRISK_BREAKER_FAILURES", 5)
+CANRISK_BREAKER_RESET_TIMEOUT = env.float("CANRISK_BREAKER_RESET_TIMEOUT", 30.0)
+# seconds a request waits for CanRisk predictions before using the fallback model
+CANRISK_LATENCY_BUDGET = env.float("CANRISK_LATENCY_BUDGET", 10.0)
+# most CanRisk calls a second across all workers, shared through the Redis of
+# CANRISK_RATE_LIMIT_CACHE (a django-redis cache), 0 for no limit
+CANRISK_RATE_LIMIT = env.float("CANRISK_RATE_LIMIT", 0.0)
+CANRISK_RATE_LIMIT_BURST = env.int("CANRISK_RATE_LIMIT_BURST", 5)
+CANRISK_RATE_LIMIT_CACHE = env.str("CANRISK_RATE_LIMIT_CACHE", "default")
+# each worker's CanRisk calls in flight adapt between these, backing off when calls fail or
+# take longer than CANRISK_TARGET_LATENCY seconds
+CANRISK_CONCURRENCY_MIN = env.int("CANRISK_CONCURRENCY_MIN", 1)
+CANRISK_CONCURRENCY_MAX = env.int("CANRISK_CONCURRENCY_MAX", 20)
+CANRISK_TARGET_LATENCY = env.float("CANRISK_TARGET_LATENCY", 5.0)
+# longest (seconds) a CanRisk call waits for the limits, before the fallback model is used
+CANRISK_QUEUE_TIMEOUT = env.float("CANRISK_QUEUE_TIMEOUT", 5.0)
+# a BOADICEA call that's taken longer than this percentile of recent calls (but at least
+# CANRISK_HEDGE_MIN_DELAY seconds) is hedged with an identical one, the first answer winning, for
+# up to CANRISK_HEDGE_BUDGET of calls (if the limits allow). 0 for no hedging
+CANRISK_HEDGE_PERCENTILE = env.float("CANRISK_HEDGE_PERCENTILE", 0.0)
+CANRISK_HEDGE_BUDGET = env.float("CANRISK_HEDGE_BUDGET", 0.1)
+CANRISK_HEDGE_MIN_DELAY = env.float("CANRISK_HEDGE_MIN_DELAY", 0.1)
+# most CanRisk calls a second manage.py warm_canrisk_cache makes
+CANRISK_WARM_RATE_LIMIT = env.float("CANRISK_WARM_RATE_LIMIT", 2.0)
+# the CanRisk surrogate manage.py train_canrisk_surrogate saved, for CanRiskSurrogateCalc
+CANRISK_SURROGATE_PATH = env.str("CANRISK_SURROGATE_PATH", "")
+# CanRisk's risks over a grid of its inputs saved by manage.py build_canrisk_grid, for
+# CanRiskGridCalc (memory-mapped, so shared by the workers on a machine)
+CANRISK_GRID_PATH = env.str("CANRISK_GRID_PATH", "")
+
+# RISK MODELS
+# -----------------------------------------------------------------------------
+# number of Gail predictions each process keeps (0 to turn off)
+GAIL_PREDICTION_CACHE_SIZE = env.int("GAIL_PREDICTION_CACHE_SIZE", 4096)
+
+# RISK JOBS
+# -----------------------------------------------------------------------------
+# cache (a django-redis one) whose Redis holds the job queue for manage.py risk_worker, and jobs
+RISK_JOBS_CACHE = env.str("RISK_JOBS_CACHE", "default")
+# run jobs in the web process as they're submitted, rather than queueing them (e.g. without Redis)
+RISK_JOBS_EAGER = env.bool("RISK_JOBS_EAGER", False)
+# seconds a job (and its result) is kept
+RISK_JOB_TTL = env.int("RISK_JOB_TTL", 60 * 60)
+# seconds a job's event stream waits for it to finish, and between checks
+RISK_JOB_EVENTS_TIMEOUT = env.float("RISK_JOB_EVENTS_TIMEOUT", 60.0)
+RISK_JOB_EVENTS_POLL_INTERVAL = env.float("RISK_JOB_EVENTS_POLL_INTERVAL", 0.25)
 # APPS
 # -----------------------------------------------------------------------------
 WKHTMLTOPDF = env.str("WKHTMLTOPDF", "/usr/bin/wkhtmltopdf")
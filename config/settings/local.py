@@ -60,3 +60,5 @@ INSTALLED_APPS += ["django_extensions"]  # noqa F405
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# the local cache is in-process, so there is no Redis for the job queue: run jobs as submitted
+RISK_JOBS_EAGER = True
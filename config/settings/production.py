@@ -29,6 +29,11 @@ CACHES = {
     }
 }
 
+# CANRISK
+# ------------------------------------------------------------------------------
+# shared through the Redis behind the default cache
+CANRISK_RATE_LIMIT = env.float("CANRISK_RATE_LIMIT", 5.0)
+
 # SECURITY
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#secure-proxy-ssl-header
@@ -27,3 +27,5 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# no Redis for the job queue, so run jobs as they're submitted
+RISK_JOBS_EAGER = True
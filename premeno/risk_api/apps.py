@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RiskAPIConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "premeno.risk_api"
+
+    def ready(self) -> None:
+        from premeno.risk_api.gail.model import set_prediction_cache_size
+
+        set_prediction_cache_size(settings.GAIL_PREDICTION_CACHE_SIZE)
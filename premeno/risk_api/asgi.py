@@ -0,0 +1,52 @@
+from typing import AsyncIterator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    A streaming response that also has its content as an async iterator,
+    which EventLoopASGIHandler streams instead. (WSGI, and Django's own
+    ASGI handler, iterate streaming_content)
+    """
+
+    def __init__(
+        self, streaming_content: Iterator, async_content: AsyncIterator, *args, **kwargs
+    ) -> None:
+        super().__init__(streaming_content, *args, **kwargs)
+        self.async_content = async_content
+
+
+class EventLoopASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, but streaming AsyncStreamingHttpResponses from
+    their async content. Django 3.2 iterates a streaming response's content
+    on the event loop, so a stream that waits (e.g. for a job's events) would
+    hold up every other request on the worker
+    """
+
+    async def send_response(self, response, send) -> None:
+        if not isinstance(response, AsyncStreamingHttpResponse):
+            return await super().send_response(response, send)
+
+        # as ASGIHandler.send_response
+        headers = [
+            (
+                header.encode("ascii") if isinstance(header, str) else header,
+                value.encode("latin1") if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append((b"Set-Cookie", cookie.output(header="").encode("ascii").strip()))
+        await send(
+            {"type": "http.response.start", "status": response.status_code, "headers": headers}
+        )
+
+        async for part in response.async_content:
+            for chunk, _ in self.chunk_bytes(response.make_bytes(part)):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -1,16 +1,49 @@
+import asyncio
+import io
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import timedelta
 from enum import Enum
 from http import client
+from typing import Any, Awaitable, Callable, Optional
 
+import httpx
 import requests
 import requests_cache
 from django.conf import settings
+from django_redis import get_redis_connection
+from requests.adapters import HTTPAdapter
+
+from premeno.risk_api.canrisk.breaker import CircuitBreaker
+from premeno.risk_api.canrisk.hedge import Hedger
+from premeno.risk_api.canrisk.ratelimit import (
+    AdaptiveConcurrencyLimit,
+    OutboundLimiter,
+    Permit,
+    RedisTokenBucket,
+)
+from premeno.risk_api.canrisk.utils import (
+    extract_cancer_rates_async_stream,
+    extract_cancer_rates_stream,
+)
+from premeno.risk_api.metrics import COUNTERS
 
 
 class CanRiskAPIError(Exception):
     """Errors using or contacting the canrisk API"""
 
 
+class CircuitOpenError(CanRiskAPIError):
+    """The CanRisk API has been failing, so isn't being called for now"""
+
+
+class RateLimitedError(CanRiskAPIError):
+    """A call to the CanRisk API waited too long for the rate or concurrency limit"""
+
+
 class CancerRateSource(Enum):
     """Cancer Incidence Rates data source country"""
 
@@ -26,8 +59,154 @@ class MutationFreqSource(Enum):
 BASE_URL = "https://www.canrisk.org"
 
 
+def _boadicea_data(
+    user_id: str,
+    pedigree_data: str,
+    cancer_rates: CancerRateSource,
+    mut_freq: MutationFreqSource,
+) -> dict:
+    return {
+        "user_id": user_id,
+        "cancer_rates": cancer_rates.value,
+        "mut_freq": mut_freq.value,
+        "pedigree_data": pedigree_data,
+    }
+
+
+def _bad_response_error(status_code: int, text: str) -> CanRiskAPIError:
+    return CanRiskAPIError(
+        f"Bad response from CanRisk API: '{client.responses[status_code]}': {text}"
+    )
+
+
+def _circuit_open_error(base_url: str) -> CircuitOpenError:
+    COUNTERS.increment("canrisk.circuit_open")
+    return CircuitOpenError(f"Not calling CanRisk API at {base_url}: it has been failing")
+
+
+def _rate_limited_error(base_url: str) -> RateLimitedError:
+    COUNTERS.increment("canrisk.rate_limited")
+    return RateLimitedError(f"Not calling CanRisk API at {base_url}: over the limit for too long")
+
+
+def _coping(status_code: int) -> bool:
+    """Whether a response shows CanRisk is coping with how hard it's being called"""
+    if status_code == 429:
+        COUNTERS.increment("canrisk.throttled")
+        return False
+
+    return status_code < 500
+
+
+def _token(json: dict) -> str:
+    try:
+        return json["token"]
+    except KeyError:
+        raise CanRiskAPIError("Unable to parse CanRisk API token.")
+
+
+def _hedge_permit(limiter: OutboundLimiter, hedger: Hedger) -> Optional[Permit]:
+    """A permit for a hedge, if the limits allow one without waiting and the budget has one"""
+    permit = limiter.try_acquire()
+    if permit is None:
+        COUNTERS.increment("canrisk.hedge.limited")
+        return None
+
+    if not hedger.try_spend():
+        limiter.release(permit, sent=False)
+        return None
+
+    return permit
+
+
+def _first_answer(first: Future, hedge: Future) -> Future:
+    """Whichever call answers first, or if both fail, raises the first error"""
+    pending = {first, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    COUNTERS.increment("canrisk.hedge.won")
+                return future
+
+            error = error or future.exception()
+
+    assert error is not None
+    raise error
+
+
+def _record_hedged(hedger: Hedger, started: float, hedged_at: float, hedge_won: bool) -> None:
+    """
+    Notes how long a hedged call's first call took (until the hedge beat it,
+    if it did: it took at least that long) and the hedge's, if it won. The
+    call that lost isn't waited for, so both clients note the same
+    """
+    settled = time.monotonic()
+    hedger.record(settled - started)
+    if hedge_won:
+        hedger.record(settled - hedged_at)
+
+
+class _AsyncBody:
+    """A streamed httpx response body, read a chunk at a time (as ijson reads async files)"""
+
+    def __init__(self, r: httpx.Response) -> None:
+        self._chunks = r.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson reads nothing first, to see whether it's bytes
+        if size == 0:
+            return b""
+
+        # an empty chunk would read as the end of the body
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+
+        return b""
+
+
+async def _read_rates_async(r: httpx.Response) -> dict:
+    return await extract_cancer_rates_async_stream(_AsyncBody(r))
+
+
 class CanRiskAPI:
-    def __init__(self, username: str, password: str) -> None:
+    """
+    CanRisk API client. Safe to share between threads: connections are kept
+    alive and pooled (up to pool_size at once), and the auth token is fetched
+    once and only fetched again if the API stops accepting it. Requests give
+    up after timeout seconds (connecting, or waiting for data). Requests that
+    fail to get a response, or get a server error, count against breaker (a
+    new one by default), and requests aren't made while it's open. Requests
+    are admitted by limiter (no limits by default), raising RateLimitedError
+    if they wait too long. BOADICEA calls are hedged as hedger says (not at
+    all by default)
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        base_url: str = BASE_URL,
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[OutboundLimiter] = None,
+        hedger: Optional[Hedger] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker("canrisk")
+        self.limiter = limiter if limiter is not None else OutboundLimiter("canrisk")
+        self.hedger = hedger
+        # hedged calls are made on threads of their own, up to two each
+        self._hedge_pool = (
+            ThreadPoolExecutor(2 * pool_size, thread_name_prefix="canrisk-hedge")
+            if hedger is not None
+            else None
+        )
         if settings.CANRISK_API_CACHE:
             self.session = requests_cache.CachedSession(
                 "canrisk_cache",
@@ -38,48 +217,546 @@ class CanRiskAPI:
         else:
             self.session = requests.Session()
 
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
         self.user_id = username
-        self.api_key = self._get_api_key(username, password)
+        self._password = password
+        self._token_lock = threading.Lock()
+        self._set_api_key(self._get_api_key(username, password))
+
+    def boadicea(
+        self,
+        pedigree_data: str,
+        cancer_rates: CancerRateSource = CancerRateSource.UK,
+        mut_freq: MutationFreqSource = MutationFreqSource.UK,
+    ) -> dict:
+        data = _boadicea_data(self.user_id, pedigree_data, cancer_rates, mut_freq)
+        return self._hedged(
+            lambda permit: self._get_post_response("boadicea/", data=data, permit=permit)
+        )
+
+    def boadicea_rates(
+        self,
+        pedigree_data: str,
+        cancer_rates: CancerRateSource = CancerRateSource.UK,
+        mut_freq: MutationFreqSource = MutationFreqSource.UK,
+    ) -> dict:
+        """
+        extract_cancer_rates(self.boadicea(...)), but reading just the rates
+        from the response as it arrives, rather than the whole of it into memory
+        """
+        data = _boadicea_data(self.user_id, pedigree_data, cancer_rates, mut_freq)
+        return self._hedged(
+            lambda permit: self._get_post_response(
+                "boadicea/", data=data, read_body=self._read_rates, permit=permit
+            )
+        )
+
+    def connection_stats(self) -> dict[str, int]:
+        """Connections opened, and requests sent over them, by this client"""
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+
+        return {
+            "connections": sum(pool.num_connections for pool in pools),
+            "requests": sum(pool.num_requests for pool in pools),
+        }
+
+    def _hedged(self, call: Callable[[Optional[Permit]], Any]) -> Any:
+        """
+        call(None), hedged with call(permit) (with a permit for the hedge) if
+        it hasn't answered within the hedger's delay. The first answer wins,
+        and the other call is left to finish on its own. The hedger is told
+        how long calls took to answer
+        """
+        if self.hedger is None or self._hedge_pool is None:
+            return call(None)
+
+        delay = self.hedger.delay()
+        started = time.monotonic()
+        if delay is None:
+            result = call(None)
+        else:
+            first = self._hedge_pool.submit(call, None)
+            done, _ = wait([first], timeout=delay)
+            permit = None if done else _hedge_permit(self.limiter, self.hedger)
+            if permit is not None:
+                COUNTERS.increment("canrisk.hedge.sent")
+                hedged_at = time.monotonic()
+                winner = _first_answer(first, self._hedge_pool.submit(call, permit))
+                _record_hedged(self.hedger, started, hedged_at, winner is not first)
+                return winner.result()
+
+            result = first.result()
+
+        self.hedger.record(time.monotonic() - started)
+        return result
+
+    def _read_rates(self, r: requests.Response) -> dict:
+        if isinstance(self.session, requests_cache.CachedSession):
+            # the cache has already read all of it in
+            return extract_cancer_rates_stream(io.BytesIO(r.content))
+
+        r.raw.decode_content = True
+        return extract_cancer_rates_stream(r.raw)
+
+    def _set_api_key(self, api_key: str) -> None:
+        self.api_key = api_key
         self.session.headers.update(
             {
                 "Authorization": f"token {self.api_key}",
             }
         )
 
-    def boadicea(
+    def _refresh_api_key(self, rejected_key: Optional[str]) -> None:
+        with self._token_lock:
+            # another thread may have got a new one while we waited
+            if self.api_key == rejected_key:
+                COUNTERS.increment("canrisk.token_refreshes")
+                self._set_api_key(self._get_api_key(self.user_id, self._password))
+
+    def _get_api_key(self, username: str, password: str) -> str:
+        if settings.CANRISK_API_TOKEN != "":
+            return settings.CANRISK_API_TOKEN
+
+        COUNTERS.increment("canrisk.logins")
+        data = {"username": username, "password": password}
+        return _token(self._get_post_response("auth-token/", data=data, retry_unauthorized=False))
+
+    def _get_post_response(
+        self,
+        route: str,
+        data: dict = {},
+        retry_unauthorized: bool = True,
+        read_body: Optional[Callable[[requests.Response], Any]] = None,
+        permit: Optional[Permit] = None,
+    ) -> Any:
+        """
+        The JSON response to a post to route, or what read_body makes of the
+        response (streamed, so read_body can read it as it arrives) if given.
+        Made with permit, if already admitted by the limiter
+        """
+        permit = permit or self.limiter.acquire()
+        if permit is None:
+            raise _rate_limited_error(self.base_url)
+        if not self.breaker.allow():
+            self.limiter.release(permit, sent=False)
+            raise _circuit_open_error(self.base_url)
+
+        api_key = getattr(self, "api_key", None)
+        try:
+            r = self.session.post(
+                f"{self.base_url}/{route}",
+                data=data,
+                timeout=self.timeout,
+                stream=read_body is not None,
+            )
+        except requests.RequestException:
+            self.breaker.record_failure()
+            self.limiter.release(permit, ok=False)
+            raise
+
+        self.limiter.release(permit, ok=_coping(r.status_code))
+        with r:
+            COUNTERS.increment("canrisk.requests")
+            if r.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if getattr(r, "from_cache", False):
+                COUNTERS.increment("canrisk.cache_hits")
+
+            if r.status_code == requests.codes.unauthorized and retry_unauthorized:
+                r.close()  # not holding on to its connection while retrying
+                self._refresh_api_key(api_key)
+                return self._get_post_response(route, data, False, read_body)
+
+            if r.status_code != requests.codes.ok:
+                raise _bad_response_error(r.status_code, r.text)
+
+            return r.json() if read_body is None else read_body(r)
+
+
+class AsyncCanRiskAPI:
+    """
+    asyncio version of CanRiskAPI, for async views. Its connection pool holds
+    up to pool_size connections, so that many calls can be in flight at once.
+    Logs in on the first call rather than when made. Responses aren't cached.
+    Can share a breaker, limiter and hedger with sync clients. A hedged call
+    that loses is cancelled
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        base_url: str = BASE_URL,
+        pool_size: int = 100,
+        timeout: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[OutboundLimiter] = None,
+        hedger: Optional[Hedger] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker if breaker is not None else CircuitBreaker("canrisk")
+        self.limiter = limiter if limiter is not None else OutboundLimiter("canrisk")
+        self.hedger = hedger
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
+        )
+
+        self.user_id = username
+        self._password = password
+        self.api_key: Optional[str] = None
+        self._token_lock = asyncio.Lock()
+
+    async def boadicea(
         self,
         pedigree_data: str,
         cancer_rates: CancerRateSource = CancerRateSource.UK,
         mut_freq: MutationFreqSource = MutationFreqSource.UK,
     ) -> dict:
-        data = {
-            "user_id": self.user_id,
-            "cancer_rates": cancer_rates.value,
-            "mut_freq": mut_freq.value,
-            "pedigree_data": pedigree_data,
-        }
+        if self.api_key is None:
+            await self._refresh_api_key(None)
 
-        return self._get_post_response("boadicea/", data=data)
+        data = _boadicea_data(self.user_id, pedigree_data, cancer_rates, mut_freq)
+        return await self._hedged(
+            lambda permit: self._get_post_response("boadicea/", data=data, permit=permit)
+        )
 
-    def _get_api_key(self, username: str, password: str) -> str:
+    async def boadicea_rates(
+        self,
+        pedigree_data: str,
+        cancer_rates: CancerRateSource = CancerRateSource.UK,
+        mut_freq: MutationFreqSource = MutationFreqSource.UK,
+    ) -> dict:
+        """CanRiskAPI.boadicea_rates, for async code"""
+        if self.api_key is None:
+            await self._refresh_api_key(None)
+
+        data = _boadicea_data(self.user_id, pedigree_data, cancer_rates, mut_freq)
+        return await self._hedged(
+            lambda permit: self._get_post_response(
+                "boadicea/", data=data, read_body=_read_rates_async, permit=permit
+            )
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def _hedged(self, call: Callable[[Optional[Permit]], Awaitable[Any]]) -> Any:
+        """CanRiskAPI._hedged, for async code. The call that loses is cancelled"""
+        if self.hedger is None:
+            return await call(None)
+
+        delay = self.hedger.delay()
+        started = time.monotonic()
+        if delay is None:
+            result = await call(None)
+            self.hedger.record(time.monotonic() - started)
+            return result
+
+        first = asyncio.ensure_future(call(None))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            permit = None if done else await self._hedge_permit()
+            if permit is None:
+                result = await first
+                self.hedger.record(time.monotonic() - started)
+                return result
+
+            COUNTERS.increment("canrisk.hedge.sent")
+            hedged_at = time.monotonic()
+            tasks.append(asyncio.ensure_future(call(permit)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            COUNTERS.increment("canrisk.hedge.won")
+                        _record_hedged(self.hedger, started, hedged_at, task is not first)
+                        return task.result()
+
+                    error = error or task.exception()
+
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _hedge_permit(self) -> Optional[Permit]:
+        """
+        _hedge_permit, in a thread (it may ask Redis for a token). If cancelled
+        while waiting, the permit (and the hedge it took from the budget) is
+        given back once it comes
+        """
+        loop = asyncio.get_running_loop()
+        acquiring = loop.run_in_executor(None, _hedge_permit, self.limiter, self.hedger)
+        try:
+            return await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(self._give_back_hedge_permit)
+            raise
+
+    def _give_back_hedge_permit(self, acquiring: asyncio.Future) -> None:
+        if acquiring.cancelled() or acquiring.exception() is not None:
+            return
+
+        permit = acquiring.result()
+        if permit is not None:
+            self.limiter.release(permit, sent=False)
+            if self.hedger is not None:
+                self.hedger.refund()
+
+    async def _refresh_api_key(self, rejected_key: Optional[str]) -> None:
+        async with self._token_lock:
+            # another task may have got a new one while we waited
+            if self.api_key == rejected_key:
+                if rejected_key is not None:
+                    COUNTERS.increment("canrisk.token_refreshes")
+                self.api_key = await self._get_api_key(self.user_id, self._password)
+
+    async def _get_api_key(self, username: str, password: str) -> str:
         if settings.CANRISK_API_TOKEN != "":
             return settings.CANRISK_API_TOKEN
 
+        COUNTERS.increment("canrisk.logins")
         data = {"username": username, "password": password}
-        json = self._get_post_response("auth-token/", data=data)
+        return _token(
+            await self._get_post_response("auth-token/", data=data, retry_unauthorized=False)
+        )
+
+    async def _get_post_response(
+        self,
+        route: str,
+        data: dict = {},
+        retry_unauthorized: bool = True,
+        read_body: Optional[Callable[[httpx.Response], Awaitable[Any]]] = None,
+        permit: Optional[Permit] = None,
+    ) -> Any:
+        """CanRiskAPI._get_post_response, for async code"""
+        permit = permit or await self.limiter.acquire_async()
+        if permit is None:
+            raise _rate_limited_error(self.base_url)
+        if not self.breaker.allow():
+            self.limiter.release(permit, sent=False)
+            raise _circuit_open_error(self.base_url)
 
+        api_key = self.api_key
+        headers = {"Authorization": f"token {api_key}"} if api_key is not None else {}
+        request = self.client.build_request(
+            "POST", f"{self.base_url}/{route}", data=data, headers=headers
+        )
         try:
-            return json["token"]
-        except KeyError:
-            raise CanRiskAPIError("Unable to parse CanRisk API token.")
-
-    def _get_post_response(self, route: str, data: dict = {}) -> dict:
-        r = self.session.post(f"{BASE_URL}/{route}", data=data)
-        if r.status_code != requests.codes.ok:
-            raise CanRiskAPIError(
-                "Bad response from CanRisk API: "
-                f"'{client.responses[r.status_code]}': "
-                f"{r.text}"
+            r = await self.client.send(request, stream=read_body is not None)
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            self.limiter.release(permit, ok=False)
+            raise
+        except asyncio.CancelledError:
+            # e.g. out of time: says nothing about how CanRisk is coping
+            self.breaker.record_abandoned()
+            self.limiter.release(permit, sent=False)
+            raise
+
+        self.limiter.release(permit, ok=_coping(r.status_code))
+
+        try:
+            COUNTERS.increment("canrisk.requests")
+            if r.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+            if r.status_code == httpx.codes.UNAUTHORIZED and retry_unauthorized:
+                await self._refresh_api_key(api_key)
+                return await self._get_post_response(route, data, False, read_body)
+
+            if r.status_code != httpx.codes.OK:
+                await r.aread()
+                raise _bad_response_error(r.status_code, r.text)
+
+            return r.json() if read_body is None else await read_body(r)
+        finally:
+            await r.aclose()
+
+
+_clients: dict[tuple[int, str], CanRiskAPI] = {}
+_clients_lock = threading.Lock()
+# held while each client is made (logging in)
+_making_client: dict[tuple[int, str], threading.Lock] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+_limiters: dict[str, OutboundLimiter] = {}
+_hedgers: dict[str, Hedger] = {}
+
+
+def circuit_breaker(base_url: Optional[str] = None) -> CircuitBreaker:
+    """
+    The breaker shared by this process's clients (sync and async) for the
+    CanRisk API at base_url (CANRISK_API_URL by default), set up from the
+    CANRISK_BREAKER settings
+    """
+    base_url = base_url or settings.CANRISK_API_URL
+    with _clients_lock:
+        if base_url not in _breakers:
+            _breakers[base_url] = CircuitBreaker(
+                "canrisk",
+                settings.CANRISK_BREAKER_FAILURES,
+                settings.CANRISK_BREAKER_RESET_TIMEOUT,
+            )
+
+        return _breakers[base_url]
+
+
+def outbound_limiter(base_url: Optional[str] = None) -> OutboundLimiter:
+    """
+    The limiter shared by this process's clients for the CanRisk API at
+    base_url (CANRISK_API_URL by default): CANRISK_RATE_LIMIT calls a second
+    across every process sharing CANRISK_RATE_LIMIT_CACHE's Redis, and
+    calls in flight adapting within the CANRISK_CONCURRENCY settings
+    """
+    base_url = base_url or settings.CANRISK_API_URL
+    with _clients_lock:
+        if base_url not in _limiters:
+            tokens = None
+            if settings.CANRISK_RATE_LIMIT > 0:
+                tokens = RedisTokenBucket(
+                    get_redis_connection(settings.CANRISK_RATE_LIMIT_CACHE),
+                    f"canrisk:rate:{base_url}",
+                    settings.CANRISK_RATE_LIMIT,
+                    settings.CANRISK_RATE_LIMIT_BURST,
+                )
+
+            _limiters[base_url] = OutboundLimiter(
+                "canrisk",
+                tokens,
+                AdaptiveConcurrencyLimit(
+                    "canrisk",
+                    settings.CANRISK_CONCURRENCY_MIN,
+                    settings.CANRISK_CONCURRENCY_MAX,
+                    settings.CANRISK_TARGET_LATENCY,
+                ),
+                settings.CANRISK_QUEUE_TIMEOUT,
             )
 
-        return r.json()
+        return _limiters[base_url]
+
+
+def request_hedger(base_url: Optional[str] = None) -> Optional[Hedger]:
+    """
+    The hedger shared by this process's clients for the CanRisk API at
+    base_url (CANRISK_API_URL by default), set up from the CANRISK_HEDGE
+    settings. None if CANRISK_HEDGE_PERCENTILE is 0, for no hedging
+    """
+    base_url = base_url or settings.CANRISK_API_URL
+    if settings.CANRISK_HEDGE_PERCENTILE <= 0:
+        return None
+
+    with _clients_lock:
+        if base_url not in _hedgers:
+            _hedgers[base_url] = Hedger(
+                "canrisk",
+                settings.CANRISK_HEDGE_PERCENTILE,
+                settings.CANRISK_HEDGE_BUDGET,
+                settings.CANRISK_HEDGE_MIN_DELAY,
+            )
+
+        return _hedgers[base_url]
+
+
+def get_canrisk_api(base_url: Optional[str] = None) -> CanRiskAPI:
+    """
+    This process's client for the CanRisk API at base_url (CANRISK_API_URL by
+    default), logged in with the CANRISK_API settings the first time it's
+    asked for
+    """
+    base_url = base_url or settings.CANRISK_API_URL
+    key = (os.getpid(), base_url)
+    with _clients_lock:
+        if key in _clients:
+            return _clients[key]
+
+        # clients (and locks) inherited from a parent process share its connections, so start
+        # afresh
+        inherited: list[dict[tuple[int, str], Any]] = [_clients, _making_client]
+        for clients in inherited:
+            for other in [other for other in clients if other[0] != key[0]]:
+                del clients[other]
+        making = _making_client.setdefault(key, threading.Lock())
+
+    # logging in can be slow, so only holds up threads wanting this client
+    with making:
+        with _clients_lock:
+            if key in _clients:
+                return _clients[key]
+
+        client = CanRiskAPI(
+            settings.CANRISK_API_USERNAME,
+            settings.CANRISK_API_PASSWORD,
+            base_url,
+            settings.CANRISK_API_POOL_SIZE,
+            settings.CANRISK_API_TIMEOUT,
+            circuit_breaker(base_url),
+            outbound_limiter(base_url),
+            request_hedger(base_url),
+        )
+        with _clients_lock:
+            if key not in _clients:
+                _clients[key] = client
+                COUNTERS.increment("canrisk.clients")
+
+            return _clients[key]
+
+
+# async clients belong to the event loop they were made in
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_async_canrisk_api(base_url: Optional[str] = None) -> AsyncCanRiskAPI:
+    """get_canrisk_api for async code: the running event loop's client for base_url"""
+    base_url = base_url or settings.CANRISK_API_URL
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if base_url not in clients:
+        clients[base_url] = AsyncCanRiskAPI(
+            settings.CANRISK_API_USERNAME,
+            settings.CANRISK_API_PASSWORD,
+            base_url,
+            settings.CANRISK_API_ASYNC_POOL_SIZE,
+            settings.CANRISK_API_TIMEOUT,
+            circuit_breaker(base_url),
+            outbound_limiter(base_url),
+            request_hedger(base_url),
+        )
+        COUNTERS.increment("canrisk.async_clients")
+
+    return clients[base_url]
+
+
+def canrisk_clients() -> dict[str, CanRiskAPI]:
+    """This process's clients, by base URL"""
+    pid = os.getpid()
+    with _clients_lock:
+        return {
+            base_url: api for (client_pid, base_url), api in _clients.items() if pid == client_pid
+        }
+
+
+def reset_canrisk_clients() -> None:
+    """
+    Drops the clients (and their breakers, limiters and hedgers), so the next
+    get_canrisk_api logs in again
+    """
+    with _clients_lock:
+        _clients.clear()
+        _making_client.clear()
+        _breakers.clear()
+        _limiters.clear()
+        _hedgers.clear()
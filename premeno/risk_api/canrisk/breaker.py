@@ -0,0 +1,87 @@
+import threading
+import time
+from enum import Enum
+from typing import Callable
+
+from premeno.risk_api.metrics import COUNTERS
+
+
+class CircuitState(Enum):
+    """States of a CircuitBreaker"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a service that keeps failing. After failure_threshold
+    failures in a row the circuit opens, and calls aren't allowed for
+    reset_timeout seconds. Then one trial call is allowed: the circuit
+    closes again if it succeeds, and opens for another reset_timeout if not.
+    Safe to share between threads. Counters are prefixed with name
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        # when the circuit last opened, only read while it is open
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call can be made now. Each allowed call must record its outcome"""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+
+            if (
+                self._state == CircuitState.OPEN
+                and self._clock() - self._opened_at >= self.reset_timeout
+            ):
+                self._state = CircuitState.HALF_OPEN
+                return True
+
+            COUNTERS.increment(f"{self.name}.breaker.rejected")
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = CircuitState.OPEN
+                self._opened_at = self._clock()
+                COUNTERS.increment(f"{self.name}.breaker.opened")
+
+    def record_abandoned(self) -> None:
+        """
+        For an allowed call given up on before it was answered (cancelled),
+        which says nothing about the service. If it was the trial, another
+        can be made
+        """
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._state = CircuitState.OPEN
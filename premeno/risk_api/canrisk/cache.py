@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import struct
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future
+from dataclasses import replace
+from typing import Awaitable, Callable, Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from premeno.risk_api.canrisk.api import CancerRateSource, CanRiskAPIError, MutationFreqSource
+from premeno.risk_api.canrisk.file import CanRiskFile
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.metrics import COUNTERS
+
+"""
+    Version of the cached results. Bump it when what's sent to CanRisk, or
+    what's kept from its response (or how it's packed), changes, so old
+    entries are ignored
+"""
+RESULT_CACHE_VERSION = 2
+
+"""
+    Packed rates start with the number of ages, followed by the ages (one
+    byte each) then the baseline and individual rates (float32s, which is
+    plenty for risks), all little-endian
+"""
+_RATES_HEADER = struct.Struct("<H")
+
+"""
+    Seconds between looking for the rates another worker is fetching
+"""
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+def _canonical_content(canrisk_file: CanRiskFile) -> str:
+    """
+    The file, less what doesn't come from the questionnaire: the MHT status
+    (keyed separately) and the mother's year of birth (worked out from
+    today's date)
+    """
+    canonical = replace(
+        canrisk_file,
+        risk_factors=replace(canrisk_file.risk_factors, mht_use=MhtStatus.Never),
+        pedigrees=[
+            replace(person, year_of_birth=0) if person.individ_id == "mum" else person
+            for person in canrisk_file.pedigrees
+        ],
+    )
+
+    return str(canonical)
+
+
+def result_cache_keys(
+    canrisk_file: CanRiskFile,
+    mht_statuses: Iterable[MhtStatus],
+    cancer_rates: CancerRateSource = CancerRateSource.UK,
+    mut_freq: MutationFreqSource = MutationFreqSource.UK,
+) -> dict[MhtStatus, str]:
+    """
+    Cache key for the CanRisk result for each MHT status of the file, the same
+    for any questionnaires that CanRisk would see as the same woman
+    """
+    content = hashlib.sha256(_canonical_content(canrisk_file).encode()).hexdigest()
+    return {
+        mht_status: "canrisk:"
+        + hashlib.sha256(
+            f"{content}|{mht_status.value}|{cancer_rates.value}|{mut_freq.value}".encode()
+        ).hexdigest()
+        for mht_status in mht_statuses
+    }
+
+
+def pack_rates(rates: dict) -> bytes:
+    """
+    Packs the ages and the baseline and individual rates from
+    extract_cancer_rates. Raises ValueError if they can't be packed
+    """
+    count = len(rates["age"])
+    if not len(rates["baseline"]) == len(rates["individual"]) == count:
+        raise ValueError("Rates must have one value for each age")
+
+    try:
+        return _RATES_HEADER.pack(count) + struct.pack(
+            f"<{count}B{count}f{count}f", *rates["age"], *rates["baseline"], *rates["individual"]
+        )
+    except struct.error as err:
+        raise ValueError(f"Can't pack rates: {err}")
+
+
+def unpack_rates(packed: bytes) -> dict:
+    """The rates dict that pack_rates packed"""
+    (count,) = _RATES_HEADER.unpack_from(packed)
+    ages_at = _RATES_HEADER.size
+    baseline_at = ages_at + count
+    individual_at = baseline_at + 4 * count
+
+    return {
+        "age": list(struct.unpack_from(f"<{count}B", packed, ages_at)),
+        "baseline": list(struct.unpack_from(f"<{count}f", packed, baseline_at)),
+        "individual": list(struct.unpack_from(f"<{count}f", packed, individual_at)),
+    }
+
+
+def _get_packed(key: str) -> Optional[bytes]:
+    return caches[settings.CANRISK_RESULT_CACHE].get(key, version=RESULT_CACHE_VERSION)
+
+
+def get_cached_rates(key: str) -> Optional[dict]:
+    """Cancer rates (as from extract_cancer_rates) cached under the key, or None"""
+    packed = _get_packed(key)
+    COUNTERS.increment(
+        "canrisk.result_cache.misses" if packed is None else "canrisk.result_cache.hits"
+    )
+
+    return unpack_rates(packed) if packed is not None else None
+
+
+def cache_rates(key: str, rates: dict) -> None:
+    """Caches the rates under the key, unless they can't be packed"""
+    try:
+        packed = pack_rates(rates)
+    except ValueError:
+        return
+
+    caches[settings.CANRISK_RESULT_CACHE].set(
+        key, packed, timeout=settings.CANRISK_RESULT_CACHE_TTL, version=RESULT_CACHE_VERSION
+    )
+
+
+def _claim(key: str) -> Optional[str]:
+    """
+    Takes the lock (an entry in the cache, so shared by every worker) on
+    fetching the rates for the key. A token to release it with, or None if
+    another worker has it
+    """
+    token = uuid.uuid4().hex
+    claimed = caches[settings.CANRISK_RESULT_CACHE].add(
+        f"{key}:lock",
+        token,
+        timeout=settings.CANRISK_SINGLE_FLIGHT_TIMEOUT,
+        version=RESULT_CACHE_VERSION,
+    )
+
+    return token if claimed else None
+
+
+def _record_failure(key: str, token: str, err: Exception) -> None:
+    """
+    Notes that the fetch under the lock with the token failed, so the workers
+    waiting for it raise its error rather than each trying again in turn
+    """
+    caches[settings.CANRISK_RESULT_CACHE].set(
+        f"{key}:failed",
+        (token, str(err)),
+        timeout=settings.CANRISK_SINGLE_FLIGHT_TIMEOUT,
+        version=RESULT_CACHE_VERSION,
+    )
+
+
+def _failure(key: str, holder: Optional[str]) -> Optional[str]:
+    """The error from the fetch under the lock with the token holder, if it failed"""
+    if holder is None:
+        return None
+
+    failed = caches[settings.CANRISK_RESULT_CACHE].get(
+        f"{key}:failed", version=RESULT_CACHE_VERSION
+    )
+    return failed[1] if failed is not None and failed[0] == holder else None
+
+
+def _failed_elsewhere(error: str) -> CanRiskAPIError:
+    COUNTERS.increment("canrisk.single_flight.failed_elsewhere")
+    return CanRiskAPIError(f"CanRisk failed for another worker: {error}")
+
+
+def _release(key: str, token: str) -> None:
+    cache = caches[settings.CANRISK_RESULT_CACHE]
+    # it may have expired and been taken by another worker
+    if cache.get(f"{key}:lock", version=RESULT_CACHE_VERSION) == token:
+        cache.delete(f"{key}:lock", version=RESULT_CACHE_VERSION)
+
+
+def _lookup(key: str) -> tuple[Optional[bytes], Optional[str]]:
+    """
+    The packed rates cached under the key, and the token of whoever held its
+    lock just before (so rates cached as it was let go of aren't missed)
+    """
+    holder = caches[settings.CANRISK_RESULT_CACHE].get(f"{key}:lock", version=RESULT_CACHE_VERSION)
+    return _get_packed(key), holder
+
+
+def _wait_for_rates(key: str, deadline: float) -> Optional[dict]:
+    """
+    The rates for the key, once the worker holding its lock has cached them.
+    None if it lets go of the lock without caching any (e.g. it died), or
+    they don't come by deadline (as time.monotonic). Raises CanRiskAPIError
+    if its fetch failed
+    """
+    holder = None
+    while time.monotonic() < deadline:
+        packed, locked_by = _lookup(key)
+        if packed is not None:
+            COUNTERS.increment("canrisk.single_flight.waited")
+            return unpack_rates(packed)
+        if locked_by is None:
+            error = _failure(key, holder)
+            if error is not None:
+                raise _failed_elsewhere(error)
+            return None
+
+        holder = locked_by
+        time.sleep(min(SINGLE_FLIGHT_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    return None
+
+
+def _timed_out(timeout: float) -> CanRiskAPIError:
+    COUNTERS.increment("canrisk.single_flight.timed_out")
+    return CanRiskAPIError(f"No CanRisk result from another worker after {timeout}s")
+
+
+def _fetch_once(key: str, fetch: Callable[[], dict], timeout: float) -> dict:
+    """
+    fetch, and cache, the rates for the key, unless another worker already
+    is. Then waits up to timeout seconds for its rates, raising
+    CanRiskAPIError if its fetch fails or they don't come in time, and
+    taking over if it gives up without any (so only one worker fetches at a
+    time)
+    """
+    deadline = time.monotonic() + timeout
+    token = _claim(key)
+    while token is None:
+        rates = _wait_for_rates(key, deadline)
+        if rates is not None:
+            return rates
+        if time.monotonic() >= deadline:
+            raise _timed_out(timeout)
+
+        token = _claim(key)
+
+    try:
+        rates = fetch()
+        cache_rates(key, rates)
+        return rates
+    except Exception as err:
+        _record_failure(key, token, err)
+        raise
+    finally:
+        _release(key, token)
+
+
+_in_flight: dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_or_fetch_rates(
+    key: str, fetch: Callable[[], dict], timeout: Optional[float] = None
+) -> dict:
+    """
+    The rates cached under the key, or else fetch's (which are cached). Only
+    one fetch for a key is made at a time: other threads wanting the same
+    rates share its result (or its error), and other workers wait for it to
+    be cached (or raise its error), for up to timeout seconds
+    (CANRISK_SINGLE_FLIGHT_TIMEOUT by default). Errors from the cache (e.g.
+    it's down) are raised
+    """
+    timeout = settings.CANRISK_SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+    rates = get_cached_rates(key)
+    if rates is not None:
+        return rates
+
+    with _in_flight_lock:
+        shared = _in_flight.get(key)
+        if shared is None:
+            future: Future = Future()
+            _in_flight[key] = future
+
+    if shared is not None:
+        COUNTERS.increment("canrisk.single_flight.shared")
+        return shared.result(timeout)
+
+    try:
+        rates = _fetch_once(key, fetch, timeout)
+        future.set_result(rates)
+        return rates
+    except BaseException as err:
+        future.set_exception(err)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+async def _wait_for_rates_async(key: str, deadline: float) -> Optional[dict]:
+    """_wait_for_rates for async code, so a cancelled wait stops waiting"""
+    lookup = sync_to_async(_lookup, thread_sensitive=False)
+    holder = None
+    while time.monotonic() < deadline:
+        packed, locked_by = await lookup(key)
+        if packed is not None:
+            COUNTERS.increment("canrisk.single_flight.waited")
+            return unpack_rates(packed)
+        if locked_by is None:
+            error = await sync_to_async(_failure, thread_sensitive=False)(key, holder)
+            if error is not None:
+                raise _failed_elsewhere(error)
+            return None
+
+        holder = locked_by
+        await asyncio.sleep(
+            min(SINGLE_FLIGHT_POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+        )
+
+    return None
+
+
+async def _fetch_once_async(
+    key: str, fetch: Callable[[], Awaitable[dict]], timeout: float
+) -> dict:
+    """_fetch_once for async code"""
+    claim = sync_to_async(_claim, thread_sensitive=False)
+    deadline = time.monotonic() + timeout
+    token = await claim(key)
+    while token is None:
+        rates = await _wait_for_rates_async(key, deadline)
+        if rates is not None:
+            return rates
+        if time.monotonic() >= deadline:
+            raise _timed_out(timeout)
+
+        token = await claim(key)
+
+    try:
+        rates = await fetch()
+        await sync_to_async(cache_rates, thread_sensitive=False)(key, rates)
+        return rates
+    except Exception as err:
+        await sync_to_async(_record_failure, thread_sensitive=False)(key, token, err)
+        raise
+    finally:
+        await sync_to_async(_release, thread_sensitive=False)(key, token)
+
+
+# fetches in flight in each event loop, by key
+_async_in_flight: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def get_or_fetch_rates_async(
+    key: str, fetch: Callable[[], Awaitable[dict]], timeout: Optional[float] = None
+) -> dict:
+    """
+    get_or_fetch_rates for async code, with tasks in the same event loop
+    sharing a fetch. A task that's cancelled while waiting doesn't cancel the
+    fetch for the others
+    """
+    timeout = settings.CANRISK_SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+    rates = await sync_to_async(get_cached_rates, thread_sensitive=False)(key)
+    if rates is not None:
+        return rates
+
+    in_flight = _async_in_flight.setdefault(asyncio.get_running_loop(), {})
+    if key in in_flight:
+        COUNTERS.increment("canrisk.single_flight.shared")
+    else:
+        in_flight[key] = asyncio.ensure_future(_fetch_once_async(key, fetch, timeout))
+        in_flight[key].add_done_callback(lambda _: in_flight.pop(key, None))
+
+    return await asyncio.shield(in_flight[key])
@@ -1,5 +1,5 @@
-from dataclasses import dataclass, field
-from typing import Optional
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Optional
 
 from premeno.risk_api.canrisk.pedigree import PedigreeEntry, Sex
 from premeno.risk_api.canrisk.risk_factors import (
@@ -52,9 +52,10 @@ class CanRiskFile:
     def _version_info(self) -> str:
         return "CanRisk 2.0"
 
-    def __str__(self) -> str:
+    def _pedigree_file(self) -> str:
+        return "\n".join([str(person) for person in self.pedigrees])
 
-        pedigree_file = "\n".join([str(person) for person in self.pedigrees])
+    def _with_pedigree_file(self, pedigree_file: str) -> str:
         return (
             f"{header_line(self._version_info(), None)}\n"
             f"{self.risk_factors.make_header()}"
@@ -62,6 +63,19 @@ class CanRiskFile:
             f"{pedigree_file}"
         )
 
+    def __str__(self) -> str:
+        return self._with_pedigree_file(self._pedigree_file())
+
+    def mht_variants(self, mht_statuses: Iterable[MhtStatus]) -> dict[MhtStatus, str]:
+        """The file for each of the MHT statuses, only writing out the pedigree once"""
+        pedigree_file = self._pedigree_file()
+        return {
+            mht_status: replace(
+                self, risk_factors=replace(self.risk_factors, mht_use=mht_status)
+            )._with_pedigree_file(pedigree_file)
+            for mht_status in mht_statuses
+        }
+
 
 """ Convert from questionnaire status to one expected by canrisk """
 ORAL_CONTRACEPTIVE_MAPPING = {
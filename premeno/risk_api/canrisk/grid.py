@@ -0,0 +1,288 @@
+import itertools
+import json
+import os
+import struct
+from datetime import date
+from functools import lru_cache
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+
+from premeno.risk_api.canrisk.file import ORAL_CONTRACEPTIVE_MAPPING, CanRiskFile, make_family
+from premeno.risk_api.canrisk.pedigree import PedigreeEntry, Sex
+from premeno.risk_api.canrisk.risk_factors import MhtStatus, OralContraceptiveData, RiskFactors
+from premeno.risk_api.canrisk.surrogate import MAX_HORIZON
+from premeno.risk_api.questionnaire import OralContraceptiveUse, Questionnaire
+from premeno.risk_api.utils import alcohol_grams_per_day, calculate_bmi
+
+"""
+    Values of each input the grid has CanRisk's risks for, as made by
+    grid_point. Risks between values are interpolated, but not beyond them
+    (see CLAMPED_AXES). None (where it's allowed) is there being nothing: no
+    children, or no diagnosis. Each axis multiplies the number of CanRisk
+    calls needed (by three, for each MHT status), so they're kept coarse
+"""
+DEFAULT_AXES: dict[str, list] = {
+    "age": [35, 40, 45, 50, 55, 60, 65, 70],
+    "age_at_menarche": [11, 13, 15],
+    "age_at_first_child": [None, 22, 28, 34],
+    "oral_contraception": [0, 1],
+    "height": [155, 170],
+    "bmi": [20, 27, 34],
+    "alcohol_grams": [0, 16],
+    "mother_age_at_diagnosis": [None, 45, 65],
+    "sister_age_at_diagnosis": [None, 45],
+}
+
+"""
+    Axes where a value beyond the grid's is taken as the nearest one it has
+    (e.g. a BMI of 40 as 34), rather than the questionnaire being off the
+    grid. Risk changes slowly past their edges, so that's nearer CanRisk than
+    the fallback. Not age, which risk over the next years changes with too much
+"""
+CLAMPED_AXES = {
+    "age_at_menarche",
+    "age_at_first_child",
+    "height",
+    "bmi",
+    "alcohol_grams",
+    "mother_age_at_diagnosis",
+    "sister_age_at_diagnosis",
+}
+
+"""
+    MHT statuses the grid has risks for, in the order they're stored
+"""
+GRID_MHT_STATUSES = (MhtStatus.Never, MhtStatus.Oestrogen, MhtStatus.Combined)
+
+"""
+    Grid files start with GRID_MAGIC then the length of a JSON header (axes,
+    shape and version), little-endian. The risks follow, as float32s in C
+    order, from the next multiple of _DATA_ALIGNMENT bytes
+"""
+GRID_MAGIC = b"CANRISKGRID\n"
+GRID_VERSION = 1
+_HEADER_LENGTH = struct.Struct("<I")
+_DATA_ALIGNMENT = 64
+_DTYPE = np.dtype("<f4")
+
+
+def grid_point(data: Questionnaire) -> dict[str, Optional[float]]:
+    """
+    The questionnaire's inputs to CanRisk, as DEFAULT_AXES names them. Raises
+    ValueError if it has more than one sister diagnosed, which grids don't have
+    """
+    if len(data.sisters_ages_at_diagnosis) > 1:
+        raise ValueError("CanRisk grid only has one sister diagnosed")
+
+    return {
+        "age": int(data.age),
+        "age_at_menarche": data.age_at_menarche,
+        "age_at_first_child": data.age_at_first_child,
+        "oral_contraception": int(data.oral_contraception_use == OralContraceptiveUse.EVER),
+        "height": round(data.height),
+        "bmi": calculate_bmi(data.height, data.weight),
+        "alcohol_grams": alcohol_grams_per_day(data.alcohol_use),
+        "mother_age_at_diagnosis": data.mother_age_at_diagnosis,
+        "sister_age_at_diagnosis": next(iter(data.sisters_ages_at_diagnosis), None),
+    }
+
+
+def grid_canrisk_file(point: dict, today: Optional[date] = None) -> CanRiskFile:
+    """The file create_canrisk_file would make for a grid point, never using MHT"""
+    today = today or date.today()
+    age_at_first_child = point["age_at_first_child"]
+    oral_contraception = (
+        OralContraceptiveUse.EVER if point["oral_contraception"] else OralContraceptiveUse.NEVER
+    )
+
+    risk_factors = RiskFactors(
+        point["age_at_menarche"],
+        0 if age_at_first_child is None else 1,
+        age_at_first_child,
+        OralContraceptiveData(5, ORAL_CONTRACEPTIVE_MAPPING[oral_contraception]),
+        MhtStatus.Never,
+        point["height"],
+        point["bmi"],
+        point["alcohol_grams"],
+        0,
+    )
+
+    pedigree = PedigreeEntry(
+        "me", True, "me", Sex.Female, point["age"], today.year - point["age"], "dad", "mum"
+    )
+    sister_age = point["sister_age_at_diagnosis"]
+    family = make_family(
+        pedigree,
+        age_at_first_child,
+        point["mother_age_at_diagnosis"],
+        [] if sister_age is None else [sister_age],
+    )
+    return CanRiskFile(risk_factors, family)
+
+
+def grid_points(axes: dict[str, list]) -> Iterator[dict]:
+    """Every point of the grid, in the order their risks are stored"""
+    for values in itertools.product(*axes.values()):
+        yield dict(zip(axes, values))
+
+
+def _brackets(values: list, value: Optional[float], clamp: bool) -> list[tuple[int, float]]:
+    """
+    Indexes into an axis's values, and their weights, to interpolate value
+    from. Raises ValueError if it isn't within them (and isn't clamped to them)
+    """
+    if value is None:
+        if None not in values:
+            raise ValueError("Not on the CanRisk grid: has nothing where the grid needs a value")
+        return [(values.index(None), 1.0)]
+
+    at = [(i, v) for i, v in enumerate(values) if v is not None]
+    if clamp and at:
+        value = min(max(value, at[0][1]), at[-1][1])
+    for (i, low), (j, high) in zip(at, at[1:] + at[-1:]):
+        if value == low:
+            return [(i, 1.0)]
+        if low < value < high:
+            weight = (value - low) / (high - low)
+            return [(i, 1 - weight), (j, weight)]
+
+    raise ValueError(f"Not on the CanRisk grid: {value} isn't within {[v for _, v in at]}")
+
+
+def grid_brackets(
+    axes: dict[str, list], point: dict, clamp: bool = True
+) -> list[list[tuple[int, float]]]:
+    """
+    Indexes into each axis, and their weights, to interpolate point from.
+    Raises ValueError if it's off the grid, beyond CLAMPED_AXES' edges too
+    unless clamp
+    """
+    return [
+        _brackets(values, point[name], clamp and name in CLAMPED_AXES)
+        for name, values in axes.items()
+    ]
+
+
+class CanRiskGrid:
+    """
+    CanRisk's risk at every horizon (1 to MAX_HORIZON years) for each MHT
+    status at every point of a grid, memory-mapped read-only from a file, so
+    processes using the same file share the memory (only what's read of it)
+    """
+
+    def __init__(self, axes: dict[str, list], risks: np.ndarray) -> None:
+        """risks is shaped (*axis lengths, MHT status, horizon), NaN where it isn't known"""
+        self.axes = axes
+        self.risks = risks
+
+    @staticmethod
+    def shape(axes: dict[str, list]) -> tuple[int, ...]:
+        return (*(len(values) for values in axes.values()), len(GRID_MHT_STATUSES), MAX_HORIZON)
+
+    @classmethod
+    def create(cls, path: str, axes: dict[str, list]) -> "CanRiskGrid":
+        """
+        A grid of NaNs, memory-mapped for writing to path, to be filled in then
+        flushed. (It's best written elsewhere and moved into place, so workers
+        using the old grid aren't affected until open_grid sees the new one)
+        """
+        header = json.dumps(
+            {"version": GRID_VERSION, "axes": axes, "shape": cls.shape(axes)}
+        ).encode()
+        offset = cls._data_offset(header)
+        with open(path, "wb") as stream:
+            stream.write(GRID_MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+            stream.write(b"\0" * (offset - stream.tell()))
+
+        risks = np.memmap(path, dtype=_DTYPE, mode="r+", offset=offset, shape=cls.shape(axes))
+        risks[...] = np.nan
+        return cls(axes, risks)
+
+    @classmethod
+    def open(cls, path: str) -> "CanRiskGrid":
+        """The grid saved at path, read-only. Raises ValueError if it isn't one"""
+        try:
+            with open(path, "rb") as stream:
+                if stream.read(len(GRID_MAGIC)) != GRID_MAGIC:
+                    raise ValueError(f"{path} isn't a CanRisk grid")
+                (length,) = _HEADER_LENGTH.unpack(stream.read(_HEADER_LENGTH.size))
+                header = stream.read(length)
+            details = json.loads(header)
+        except (OSError, struct.error, json.JSONDecodeError) as err:
+            raise ValueError(f"Can't read CanRisk grid: {err}")
+
+        if details.get("version") != GRID_VERSION:
+            raise ValueError(f"{path} isn't a version {GRID_VERSION} CanRisk grid")
+
+        axes = details["axes"]
+        risks = np.memmap(
+            path, dtype=_DTYPE, mode="r", offset=cls._data_offset(header), shape=cls.shape(axes)
+        )
+        return cls(axes, risks)
+
+    def set_risks(self, index: Sequence[int], mht_status: MhtStatus, risks: np.ndarray) -> None:
+        self.risks[(*index, GRID_MHT_STATUSES.index(mht_status))] = risks
+
+    def flush(self) -> None:
+        if isinstance(self.risks, np.memmap):
+            self.risks.flush()
+
+    def missing(self) -> int:
+        """How many points (for any MHT status) have no risks at all"""
+        return int(np.isnan(self.risks).all(axis=-1).sum())
+
+    def interpolate(self, point: dict) -> np.ndarray:
+        """
+        Risks for each MHT status (in GRID_MHT_STATUSES order) at every
+        horizon, interpolated between the grid points around point. Raises
+        ValueError if it's off the grid
+        """
+        brackets = grid_brackets(self.axes, point)
+        # only the corners around the point are read from the file
+        block = np.asarray(
+            self.risks[np.ix_(*([i for i, _ in bracket] for bracket in brackets))],
+            dtype=float,
+        )
+        for bracket in brackets:
+            block = np.tensordot([weight for _, weight in bracket], block, axes=(0, 0))
+
+        return block
+
+    def risk(self, interpolated: np.ndarray, mht_status: MhtStatus, horizon: int) -> float:
+        """
+        The risk over the next horizon years from interpolate's risks. Raises
+        ValueError if the grid doesn't have it
+        """
+        if not 1 <= horizon <= MAX_HORIZON:
+            raise ValueError(f"CanRisk grid doesn't have risks over {horizon} years")
+
+        risk = interpolated[GRID_MHT_STATUSES.index(mht_status), horizon - 1]
+        if np.isnan(risk):
+            raise ValueError(f"CanRisk grid doesn't have risks over {horizon} years here")
+
+        return float(risk)
+
+    @staticmethod
+    def _data_offset(header: bytes) -> int:
+        end = len(GRID_MAGIC) + _HEADER_LENGTH.size + len(header)
+        return -(-end // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+
+
+def open_grid(path: str) -> CanRiskGrid:
+    """
+    CanRiskGrid.open, mapping each file once a process. A grid moved into
+    place over the old one is a different file, so it's mapped anew without
+    restarting workers (the old mapping is dropped as it leaves the cache)
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as err:
+        raise ValueError(f"Can't read CanRisk grid: {err}")
+
+    return _open_grid(path, stat.st_ino, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _open_grid(path: str, inode: int, mtime_ns: int) -> CanRiskGrid:
+    return CanRiskGrid.open(path)
@@ -0,0 +1,86 @@
+import math
+import threading
+from collections import deque
+from typing import Optional
+
+from premeno.risk_api.metrics import COUNTERS
+
+"""
+    How many of the latest calls' latencies the hedging delay is worked out
+    from, and how many there must be before any call is hedged
+"""
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+"""
+    Most hedges that can be saved up from the budget, so a quiet spell can't
+    be followed by a burst of hedges
+"""
+HEDGE_BUDGET_BURST = 5.0
+
+
+class Hedger:
+    """
+    Decides when to hedge a call (send an identical second one, the first
+    answer winning): once it's taken longer than the percentile of recent
+    calls' latency (but at least min_delay seconds). Every call earns budget
+    (a share of a hedge) and every hedge spends one, so no more than that
+    share of calls are hedged. Safe to share between threads. Counters are
+    prefixed with name
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 95.0,
+        budget: float = 0.1,
+        min_delay: float = 0.0,
+        window: int = HEDGE_WINDOW,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ) -> None:
+        if not 0 < percentile <= 100 or not 0 <= budget <= 1:
+            raise ValueError("Percentile must be between 0 and 100, and budget between 0 and 1")
+
+        self.name = name
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._saved = 0.0
+
+    def record(self, latency: float) -> None:
+        """Notes how long (in seconds) a call took to be answered"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        """
+        For a call about to be made (which earns budget): how long to wait for
+        it before hedging. None if there aren't enough latencies to go on yet
+        """
+        with self._lock:
+            self._saved = min(HEDGE_BUDGET_BURST, self._saved + self.budget)
+            if len(self._latencies) < self.min_samples:
+                return None
+
+            latencies = sorted(self._latencies)
+
+        at = max(0, math.ceil(self.percentile / 100 * len(latencies)) - 1)
+        return max(self.min_delay, latencies[at])
+
+    def try_spend(self) -> bool:
+        """Takes a hedge from the budget, if there's one to take"""
+        with self._lock:
+            if self._saved < 1:
+                COUNTERS.increment(f"{self.name}.hedge.over_budget")
+                return False
+
+            self._saved -= 1
+            return True
+
+    def refund(self) -> None:
+        """Gives back a hedge taken by try_spend that wasn't sent"""
+        with self._lock:
+            self._saved = min(HEDGE_BUDGET_BURST, self._saved + 1)
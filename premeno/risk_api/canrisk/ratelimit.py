@@ -0,0 +1,361 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+
+from premeno.risk_api.metrics import COUNTERS
+
+"""
+    Seconds between looking for a free slot, for async callers (which can't
+    block on the lock the sync ones wait on)
+"""
+LIMIT_POLL_INTERVAL = 0.01
+
+"""
+    Takes a token from the bucket in KEYS[1] (a hash of tokens, and when
+    they were last counted) holding up to ARGV[2] tokens refilled at ARGV[1]
+    a second. The token may be borrowed from the future, in which case the
+    reply is how long to wait before using it, unless that's longer than
+    ARGV[3] seconds (when negative, any wait will do), in which case none is
+    taken. Replies {taken (0 or 1), seconds to wait}, as a string as Redis
+    would make a float reply an integer. Redis's clock is used, so it doesn't
+    matter if the workers' clocks disagree
+"""
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if max_wait >= 0 and wait > max_wait then
+    return {0, tostring(wait)}
+end
+
+tokens = tokens - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {1, tostring(wait)}
+"""
+
+
+class TokenLimiter(Protocol):
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        ...
+
+
+class RateLimiter:
+    """
+    Token bucket holding up to burst calls, refilled at rate calls a second.
+    acquire blocks until the caller's call is allowed. Callers are let through
+    in the order they asked, and it's safe to share between threads
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive, and burst at least 1")
+
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Takes a token, returning how long to wait (in seconds) before using
+        it. None, taking nothing, if that's longer than max_wait
+        """
+        with self._lock:
+            now = self._clock()
+            tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - tokens) / self.rate if tokens < 1 else 0.0
+            if max_wait is not None and wait > max_wait:
+                self._tokens = tokens
+                return None
+
+            # the token is taken now, so callers after this one wait behind it
+            self._tokens = tokens - 1
+            return wait
+
+    def acquire(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Waits for a token, returning how long that took. None if that'd be over max_wait"""
+        wait = self.reserve(max_wait)
+        if wait:
+            self._sleep(wait)
+
+        return wait
+
+
+class RedisTokenBucket:
+    """
+    RateLimiter shared by every process using the same Redis (connection)
+    and key. If Redis can't be reached calls are let through, as they would
+    be without a limit
+    """
+
+    def __init__(
+        self,
+        connection,
+        key: str,
+        rate: float,
+        burst: int = 1,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive, and burst at least 1")
+
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self._sleep = sleep
+        self._script = connection.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """RateLimiter.reserve"""
+        try:
+            taken, wait = self._script(
+                keys=[self.key],
+                args=[self.rate, self.burst, -1 if max_wait is None else max_wait],
+            )
+        except RedisError as err:
+            print(f"Rate limit unavailable, not limiting: {err}")
+            COUNTERS.increment("rate_limit.errors")
+            return 0.0
+
+        return float(wait) if int(taken) else None
+
+    def acquire(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """RateLimiter.acquire"""
+        wait = self.reserve(max_wait)
+        if wait:
+            self._sleep(wait)
+
+        return wait
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Limits the calls in flight to a service, to a limit that follows how well
+    it's coping (AIMD): every call that succeeds within target_latency raises
+    the limit by 1/limit (about one for a limit's worth of calls), and one
+    that fails or is slower cuts it by backoff, between minimum and maximum.
+    Calls already in flight when it's cut don't cut it again. Safe to share
+    between threads. Counters are prefixed with name
+    """
+
+    def __init__(
+        self,
+        name: str,
+        minimum: int = 1,
+        maximum: int = 20,
+        target_latency: float = 5.0,
+        backoff: float = 0.5,
+    ) -> None:
+        if not 1 <= minimum <= maximum or not 0 < backoff < 1:
+            raise ValueError("Need 1 <= minimum <= maximum, and backoff between 0 and 1")
+
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self._condition = threading.Condition()
+        self._limit = float(maximum)
+        self._in_flight = 0
+        # bumped whenever the limit is cut, so calls made before can be told apart
+        self._generation = 0
+
+    @property
+    def limit(self) -> int:
+        with self._condition:
+            return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._in_flight
+
+    def try_acquire(self) -> Optional[int]:
+        """A slot if one's free (its generation, to release it with), else None"""
+        with self._condition:
+            return self._take()
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """try_acquire, waiting up to timeout seconds (forever if None) for a slot"""
+        with self._condition:
+            if not self._condition.wait_for(self._free, timeout):
+                return None
+
+            return self._take()
+
+    def release(self, generation: int, latency: Optional[float], ok: bool = True) -> None:
+        """
+        Frees the slot, adjusting the limit for how the call went (unless
+        latency is None: it wasn't made)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if latency is not None:
+                if ok and latency <= self.target_latency:
+                    self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                elif generation == self._generation and self._limit > self.minimum:
+                    self._limit = max(self.minimum, self._limit * self.backoff)
+                    self._generation += 1
+                    COUNTERS.increment(f"{self.name}.concurrency.decreased")
+
+            self._condition.notify_all()
+
+    def _free(self) -> bool:
+        return self._in_flight < int(self._limit)
+
+    def _take(self) -> Optional[int]:
+        if not self._free():
+            return None
+
+        self._in_flight += 1
+        return self._generation
+
+
+@dataclass
+class Permit:
+    """Admission for one call through an OutboundLimiter"""
+
+    generation: Optional[int]
+    admitted_at: float
+
+
+class OutboundLimiter:
+    """
+    Admits calls to a service: each waits, for no longer than queue_timeout
+    seconds in all (forever if None), for a slot from concurrency then a
+    token from tokens. Either may be None, for no limit. Counters are
+    prefixed with name
+    """
+
+    def __init__(
+        self,
+        name: str,
+        tokens: Optional[TokenLimiter] = None,
+        concurrency: Optional[AdaptiveConcurrencyLimit] = None,
+        queue_timeout: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+
+    def acquire(self) -> Optional[Permit]:
+        """A permit to make a call, to be released once it's made. None if it timed out"""
+        deadline = self._deadline()
+        generation = None
+        if self.concurrency is not None:
+            generation = self.concurrency.acquire(self.queue_timeout)
+            if generation is None:
+                self._rejected()
+                return None
+
+        if self.tokens is not None:
+            wait = self.tokens.reserve(self._remaining(deadline))
+            if wait is None:
+                self._rejected(generation)
+                return None
+            if wait > 0:
+                COUNTERS.increment(f"{self.name}.limiter.delayed")
+                time.sleep(wait)
+
+        return Permit(generation, time.monotonic())
+
+    async def acquire_async(self) -> Optional[Permit]:
+        """acquire for async code"""
+        deadline = self._deadline()
+        generation = None
+        if self.concurrency is not None:
+            while (generation := self.concurrency.try_acquire()) is None:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._rejected()
+                    return None
+                await asyncio.sleep(LIMIT_POLL_INTERVAL)
+
+        if self.tokens is not None:
+            # cancelled (out of time, or a lost hedge) while waiting, so gives the slot back
+            try:
+                reserve = sync_to_async(self.tokens.reserve, thread_sensitive=False)
+                wait = await reserve(self._remaining(deadline))
+                if wait is None:
+                    self._rejected(generation)
+                    return None
+                if wait > 0:
+                    COUNTERS.increment(f"{self.name}.limiter.delayed")
+                    await asyncio.sleep(wait)
+            except BaseException:
+                self._rejected(generation)
+                raise
+
+        return Permit(generation, time.monotonic())
+
+    def try_acquire(self) -> Optional[Permit]:
+        """A permit if one can be had without waiting (for calls that needn't be made)"""
+        generation = None
+        if self.concurrency is not None:
+            generation = self.concurrency.try_acquire()
+            if generation is None:
+                return None
+
+        if self.tokens is not None and self.tokens.reserve(0.0) is None:
+            if generation is not None and self.concurrency is not None:
+                self.concurrency.release(generation, None)
+            return None
+
+        return Permit(generation, time.monotonic())
+
+    def release(self, permit: Permit, ok: bool = True, sent: bool = True) -> None:
+        """Frees the permit's slot, once its call has been made (or not, if not sent)"""
+        if self.concurrency is not None and permit.generation is not None:
+            latency = time.monotonic() - permit.admitted_at if sent else None
+            self.concurrency.release(permit.generation, latency, ok)
+
+    def stats(self) -> dict:
+        """The concurrency limit and calls in flight, for metrics"""
+        if self.concurrency is None:
+            return {}
+
+        return {
+            "concurrency_limit": self.concurrency.limit,
+            "in_flight": self.concurrency.in_flight,
+        }
+
+    def _deadline(self) -> Optional[float]:
+        return None if self.queue_timeout is None else time.monotonic() + self.queue_timeout
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _rejected(self, generation: Optional[int] = None) -> None:
+        if generation is not None and self.concurrency is not None:
+            self.concurrency.release(generation, None)
+
+        COUNTERS.increment(f"{self.name}.limiter.rejected")
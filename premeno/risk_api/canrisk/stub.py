@@ -0,0 +1,232 @@
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+from urllib.parse import parse_qs
+
+"""
+    Oldest age the stub gives risks up to, like CanRisk
+"""
+MAX_AGE = 80
+
+"""
+    How much the stub scales the individual risk for each MHT status in the
+    pedigree's header, so each MHT variant gets different results
+"""
+MHT_USE_SCALE = {"N": 1.0, "F": 1.0, "E": 1.1, "C": 1.25}
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "pareto")
+
+
+def latency_distribution(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    Draws latencies (in seconds) from the distribution described by spec:
+    fixed:SECONDS, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or
+    pareto:MINIMUM,ALPHA (heavy-tailed: the smaller alpha, the longer the
+    tail). Raises ValueError if it doesn't describe one
+    """
+    name, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"Latency parameters must be numbers: {spec}")
+
+    expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "pareto": 2}
+    if name not in expected:
+        raise ValueError(f"Latency distribution must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+    if len(values) != expected[name] or any(value < 0 for value in values):
+        raise ValueError(f"{name} latency takes {expected[name]} non-negative numbers: {spec}")
+
+    if name == "fixed":
+        return lambda: values[0]
+    if name == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if name == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    return lambda: values[0] * rng.paretovariate(values[1])
+
+
+def boadicea_response(age: int, mht_use: str = "N") -> dict:
+    """
+    Something shaped like a BOADICEA response (as extract_cancer_rates reads
+    it), for a woman of the given age using MHT as in the pedigree header
+    """
+    scale = MHT_USE_SCALE.get(mht_use, 1.0)
+
+    def risks(breast_scale: float) -> list[dict]:
+        return [
+            {
+                "age": at_age,
+                "breast cancer risk": {
+                    "decimal": breast_scale * (at_age - age) / 100,
+                    "percent": breast_scale * (at_age - age),
+                },
+                "ovarian cancer risk": {
+                    "decimal": (at_age - age) / 4000,
+                    "percent": (at_age - age) / 40,
+                },
+            }
+            for at_age in range(age + 1, MAX_AGE + 1)
+        ]
+
+    return {
+        "pedigree_result": [
+            {
+                "family_id": "fam",
+                "cancer_risks": risks(0.3 * scale),
+                "baseline_cancer_risks": risks(0.25),
+                "mutation_probabilties": [
+                    {gene: {"decimal": 0.001, "percent": 0.1}}
+                    for gene in ("no mutation", "BRCA1", "BRCA2", "PALB2", "ATM", "CHEK2")
+                ],
+            }
+        ],
+        "version": "2.0",
+    }
+
+
+def _parse_pedigree(pedigree_data: str) -> tuple[int, str]:
+    """The target's age and the MHT status in a CanRisk file. Raises ValueError if it isn't one"""
+    mht_use = "N"
+    columns: Optional[list[str]] = None
+    for line in pedigree_data.splitlines():
+        if line.startswith("##mht_use="):
+            mht_use = line.split("=", 1)[1]
+        elif line.startswith("##FamID"):
+            columns = line[2:].split("\t")
+        elif columns is not None and line.strip():
+            row = dict(zip(columns, line.split("\t")))
+            if row.get("Target") == "1":
+                return int(row["Age"]), mht_use
+
+    raise ValueError("No target in pedigree")
+
+
+@dataclass
+class StubConfig:
+    """How a stub CanRisk server behaves"""
+
+    # spec for latency_distribution, for each call
+    latency: str = "fixed:0"
+    # share of BOADICEA calls answered with a 503
+    error_rate: float = 0.0
+    # share of BOADICEA calls answered with a 400, as for a pedigree CanRisk won't take
+    bad_request_rate: float = 0.0
+    token: str = "stub-token"
+    seed: Optional[int] = None
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubCanRiskServer"
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        form = {key: values[0] for key, values in parse_qs(body, keep_blank_values=True).items()}
+        time.sleep(self.server.next_latency())
+
+        if self.path.rstrip("/") == "/auth-token":
+            if form.get("username") is None or form.get("password") is None:
+                self._respond(400, {"non_field_errors": ["Unable to log in"]})
+            else:
+                self._respond(200, {"token": self.server.config.token})
+        elif self.path.rstrip("/") == "/boadicea":
+            self._boadicea(form)
+        else:
+            self._respond(404, {"detail": "Not found."})
+
+    def _boadicea(self, form: dict) -> None:
+        if self.headers.get("Authorization") != f"token {self.server.config.token}":
+            self._respond(401, {"detail": "Invalid token."})
+            return
+
+        outcome = self.server.next_outcome()
+        if outcome is not None:
+            self._respond(outcome, {"detail": "Stub failure"})
+            return
+
+        try:
+            age, mht_use = _parse_pedigree(form.get("pedigree_data", ""))
+        except ValueError as err:
+            self._respond(400, {"pedigree_data": [str(err)]})
+            return
+
+        self._respond(200, boadicea_response(age, mht_use))
+
+    def _respond(self, status: int, response: dict) -> None:
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubCanRiskServer(ThreadingHTTPServer):
+    """
+    Stands in for the CanRisk API: answers auth-token/ and boadicea/ (with
+    made up risks for the pedigree's target), after latencies drawn from the
+    configured distribution, failing the configured share of BOADICEA calls.
+    Raises ValueError if the config doesn't make sense
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        config: StubConfig,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        verbose: bool = False,
+    ) -> None:
+        if not 0 <= config.error_rate + config.bad_request_rate <= 1:
+            raise ValueError("Error and bad request rates must add up to between 0 and 1")
+
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._latency = latency_distribution(config.latency, self._rng)
+        self.config = config
+        self.verbose = verbose
+        super().__init__((host, port), _StubHandler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_latency(self) -> float:
+        with self._rng_lock:
+            return self._latency()
+
+    def next_outcome(self) -> Optional[int]:
+        """The status to fail the next BOADICEA call with, or None to answer it"""
+        with self._rng_lock:
+            draw = self._rng.random()
+
+        if draw < self.config.error_rate:
+            return 503
+        if draw < self.config.error_rate + self.config.bad_request_rate:
+            return 400
+        return None
+
+
+@contextmanager
+def running_stub_server(config: StubConfig) -> Iterator[str]:
+    """Runs a stub server in a thread while in the context, yielding its base URL"""
+    server = StubCanRiskServer(config)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server.base_url
+    finally:
+        server.shutdown()
+        server.server_close()
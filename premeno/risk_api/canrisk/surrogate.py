@@ -0,0 +1,273 @@
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.utils import interpolate_rate
+from premeno.risk_api.questionnaire import OralContraceptiveUse, Questionnaire
+from premeno.risk_api.utils import alcohol_grams_per_day, calculate_bmi
+
+"""
+    Version of the surrogate files. Bump it when the features, or how they're
+    made, change, so old files aren't used
+"""
+SURROGATE_VERSION = 1
+
+"""
+    What the surrogate is fitted on: the inputs create_canrisk_file gives
+    CanRisk, as numbers (0 where there's nothing, with a flag saying so),
+    and the MHT status (never being neither flag)
+"""
+FEATURES = (
+    "age",
+    "age_at_menarche",
+    "parous",
+    "age_at_first_child",
+    "oral_contraception",
+    "height",
+    "bmi",
+    "alcohol_grams",
+    "mother_diagnosed",
+    "mother_age_at_diagnosis",
+    "sisters_diagnosed",
+    "mht_oestrogen",
+    "mht_combined",
+)
+
+_MHT_FEATURES = {
+    MhtStatus.Oestrogen: FEATURES.index("mht_oestrogen"),
+    MhtStatus.Combined: FEATURES.index("mht_combined"),
+}
+
+"""
+    Longest projection (in years) the surrogate is fitted for: from the
+    youngest age the questionnaire takes to the oldest CanRisk gives risks to
+"""
+MAX_HORIZON = 80 - 35
+
+"""
+    Risks are fitted on the complementary log-log scale (so any prediction is
+    a risk between 0 and 1), clipped this far from 0 and 1 first
+"""
+_RISK_CLIP = 1e-9
+
+
+def surrogate_features(data: Questionnaire, mht_status: MhtStatus = MhtStatus.Never) -> np.ndarray:
+    """The features (in FEATURES order) for the questionnaire, with the MHT status"""
+    features = np.array(
+        [
+            int(data.age),
+            data.age_at_menarche,
+            data.age_at_first_child is not None,
+            data.age_at_first_child or 0,
+            data.oral_contraception_use == OralContraceptiveUse.EVER,
+            round(data.height),
+            calculate_bmi(data.height, data.weight),
+            alcohol_grams_per_day(data.alcohol_use),
+            data.mother_age_at_diagnosis is not None,
+            data.mother_age_at_diagnosis or 0,
+            data.number_of_sisters_with_cancer,
+            0,
+            0,
+        ],
+        dtype=float,
+    )
+
+    return with_mht_status(features, mht_status)
+
+
+def with_mht_status(features: np.ndarray, mht_status: MhtStatus) -> np.ndarray:
+    """A copy of the features with the MHT status changed"""
+    features = features.copy()
+    for status, column in _MHT_FEATURES.items():
+        features[column] = status == mht_status
+
+    return features
+
+
+def horizon_risks(rates: dict, age: int) -> np.ndarray:
+    """
+    The individual risk from extract_cancer_rates at each horizon (1 to
+    MAX_HORIZON years on from age), NaN where they don't reach
+    """
+    risks = np.full(MAX_HORIZON, np.nan)
+    for horizon in range(1, MAX_HORIZON + 1):
+        try:
+            risks[horizon - 1] = interpolate_rate(rates["age"], rates["individual"], age + horizon)
+        except ValueError:
+            pass
+
+    return risks
+
+
+def _cloglog(risks: np.ndarray) -> np.ndarray:
+    clipped = np.clip(risks, _RISK_CLIP, 1 - _RISK_CLIP)
+    return np.log(-np.log1p(-clipped))
+
+
+def _inverse_cloglog(values: np.ndarray) -> np.ndarray:
+    return -np.expm1(-np.exp(values))
+
+
+class CanRiskSurrogate:
+    """
+    Stands in for the CanRisk model: a ridge regression for each horizon (in
+    years) of the risk, on the complementary log-log scale, on FEATURES. Its
+    error on CanRisk results it wasn't fitted on (if it has been evaluated)
+    goes with it, so predictions can be labelled with how far off they may be
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        coefficients: np.ndarray,
+        errors: Optional[dict[str, np.ndarray]] = None,
+    ) -> None:
+        """coefficients has a row for each horizon (NaN if it wasn't fitted), intercept first"""
+        self.mean = mean
+        self.scale = scale
+        self.coefficients = coefficients
+        self.errors = errors or {}
+
+    @classmethod
+    def fit(
+        cls, features: np.ndarray, risks: np.ndarray, ridge: float = 1.0
+    ) -> "CanRiskSurrogate":
+        """
+        Fits to the features (a row for each CanRisk result) and their
+        horizon_risks. A horizon is only fitted if more results reach it than
+        there are features
+        """
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        design = np.hstack([np.ones((len(features), 1)), (features - mean) / scale])
+        # the intercept isn't shrunk
+        penalty = ridge * np.diag([0.0] + [1.0] * len(FEATURES))
+
+        coefficients = np.full((MAX_HORIZON, len(FEATURES) + 1), np.nan)
+        for horizon in range(MAX_HORIZON):
+            known = ~np.isnan(risks[:, horizon])
+            if known.sum() <= len(FEATURES):
+                continue
+
+            x, y = design[known], _cloglog(risks[known, horizon])
+            coefficients[horizon] = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+
+        return cls(mean, scale, coefficients)
+
+    @property
+    def horizons(self) -> list[int]:
+        """The horizons (in years) predictions can be made for"""
+        return [i + 1 for i in np.flatnonzero(~np.isnan(self.coefficients[:, 0]))]
+
+    def predict(self, features: np.ndarray, horizon: int) -> float:
+        """Risk over the next horizon years. Raises ValueError if it wasn't fitted for that"""
+        coefficients = self._coefficients(horizon)
+        value = coefficients[0] + ((features - self.mean) / self.scale) @ coefficients[1:]
+        return float(_inverse_cloglog(value))
+
+    def predict_all(self, features: np.ndarray) -> np.ndarray:
+        """Risks for rows of features at every horizon, NaN where it wasn't fitted"""
+        design = np.hstack([np.ones((len(features), 1)), (features - self.mean) / self.scale])
+        with np.errstate(invalid="ignore"):
+            return _inverse_cloglog(design @ self.coefficients.T)
+
+    def evaluate(self, features: np.ndarray, risks: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Absolute errors in the risk at each horizon, against CanRisk's
+        horizon_risks for the features: mean, 95th percentile and largest
+        (NaN where there's nothing to compare), and how many were compared.
+        They're kept with the surrogate
+        """
+        errors = np.abs(self.predict_all(features) - risks)
+        compared = (~np.isnan(errors)).sum(axis=0)
+        self.errors = {"count": compared}
+        summaries: list[tuple[str, Callable[..., Any]]] = [
+            ("mean", np.nanmean),
+            ("p95", lambda e, axis: np.nanpercentile(e, 95, axis=axis)),
+            ("max", np.nanmax),
+        ]
+        for name, summary in summaries:
+            self.errors[name] = np.full(MAX_HORIZON, np.nan)
+            self.errors[name][compared > 0] = summary(errors[:, compared > 0], axis=0)
+
+        return self.errors
+
+    def error_bound(self, horizon: int) -> Optional[float]:
+        """95th percentile of the absolute error at the horizon, if it's been evaluated"""
+        if "p95" not in self.errors or not 1 <= horizon <= MAX_HORIZON:
+            return None
+
+        bound = self.errors["p95"][horizon - 1]
+        return None if np.isnan(bound) else float(bound)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as stream:
+            np.savez(
+                stream,
+                version=SURROGATE_VERSION,
+                features=np.array(FEATURES),
+                mean=self.mean,
+                scale=self.scale,
+                coefficients=self.coefficients,
+                **{f"errors_{name}": values for name, values in self.errors.items()},
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CanRiskSurrogate":
+        """Raises ValueError if it's not a surrogate this version can use"""
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+        except (OSError, EOFError) as err:
+            raise ValueError(f"Can't read CanRisk surrogate: {err}")
+
+        features = tuple(arrays.get("features", ()))
+        if arrays.get("version") != SURROGATE_VERSION or features != FEATURES:
+            raise ValueError(f"{path} isn't a version {SURROGATE_VERSION} CanRisk surrogate")
+
+        errors = {
+            name.replace("errors_", "", 1): values
+            for name, values in arrays.items()
+            if name.startswith("errors_")
+        }
+        return cls(arrays["mean"], arrays["scale"], arrays["coefficients"], errors)
+
+    def _coefficients(self, horizon: int) -> np.ndarray:
+        if not 1 <= horizon <= MAX_HORIZON or np.isnan(self.coefficients[horizon - 1, 0]):
+            raise ValueError(f"CanRisk surrogate wasn't fitted for {horizon} years")
+
+        return self.coefficients[horizon - 1]
+
+
+@lru_cache(maxsize=4)
+def load_surrogate(path: str) -> CanRiskSurrogate:
+    """CanRiskSurrogate.load, reading each file once a process"""
+    return CanRiskSurrogate.load(path)
+
+
+def fit_and_evaluate(
+    features: np.ndarray,
+    risks: np.ndarray,
+    groups: Sequence[str],
+    holdout: float,
+    seed: int = 0,
+    ridge: float = 1.0,
+) -> tuple[CanRiskSurrogate, int, int]:
+    """
+    Fits a surrogate, holding out a share of the groups (results that are the
+    same woman, which would otherwise tell it the answers), then evaluates it
+    on them. The surrogate, and how many results it was fitted and evaluated on
+    """
+    names = sorted(set(groups))
+    held_out = set(np.random.default_rng(seed).permutation(names)[: int(len(names) * holdout)])
+    test = np.array([group in held_out for group in groups], dtype=bool)
+
+    surrogate = CanRiskSurrogate.fit(features[~test], risks[~test], ridge)
+    if test.any():
+        surrogate.evaluate(features[test], risks[test])
+
+    return surrogate, int((~test).sum()), int(test.sum())
@@ -1,4 +1,80 @@
-from typing import Any, Optional
+from typing import IO, Any, Optional
+
+import ijson
+
+"""
+    Where the values extract_cancer_rates keeps are in a BOADICEA response,
+    as ijson prefixes
+"""
+_RATE_PREFIXES = {
+    "pedigree_result.item.baseline_cancer_risks.item.age": "age",
+    "pedigree_result.item.baseline_cancer_risks.item.breast cancer risk.decimal": "baseline",
+    "pedigree_result.item.cancer_risks.item.breast cancer risk.decimal": "individual",
+}
+
+
+"""
+    How much of a BOADICEA response is read at a time when streaming it. ijson
+    holds the events for a whole buffer at once, so this bounds the memory used
+"""
+STREAM_BUFFER_SIZE = 8192
+
+FAMILY_PREFIX = "pedigree_result.item"
+
+
+def _new_rates() -> dict[str, list]:
+    return {"age": [], "baseline": [], "individual": []}
+
+
+def _checked_rates(rates: dict[str, list], families: int) -> dict:
+    if families == 0:
+        raise ValueError("No pedigree result in BOADICEA response")
+
+    return rates
+
+
+# the loops below are the hot path (there's an event for every value in the
+# response), so are kept inline rather than calling out for each event
+
+
+def extract_cancer_rates_stream(body: IO[bytes]) -> dict:
+    """
+    extract_cancer_rates for the BOADICEA response body, read as it comes
+    rather than made into Python objects (most of it isn't needed). Raises
+    ValueError if it isn't a BOADICEA response
+    """
+    rates, families = _new_rates(), 0
+    try:
+        for prefix, event, value in ijson.parse(body, buf_size=STREAM_BUFFER_SIZE, use_float=True):
+            field = _RATE_PREFIXES.get(prefix)
+            if field is not None:
+                if families == 0:  # only inputting one family
+                    rates[field].append(value)
+            elif event == "end_map" and prefix == FAMILY_PREFIX:
+                families += 1
+    except ijson.JSONError as err:
+        raise ValueError(f"Bad BOADICEA response: {err}")
+
+    return _checked_rates(rates, families)
+
+
+async def extract_cancer_rates_async_stream(body: Any) -> dict:
+    """extract_cancer_rates_stream for a body with an async read method"""
+    rates, families = _new_rates(), 0
+    try:
+        async for prefix, event, value in ijson.parse_async(
+            body, buf_size=STREAM_BUFFER_SIZE, use_float=True
+        ):
+            field = _RATE_PREFIXES.get(prefix)
+            if field is not None:
+                if families == 0:
+                    rates[field].append(value)
+            elif event == "end_map" and prefix == FAMILY_PREFIX:
+                families += 1
+    except ijson.JSONError as err:
+        raise ValueError(f"Bad BOADICEA response: {err}")
+
+    return _checked_rates(rates, families)
 
 
 def extract_cancer_rates(boadicea: dict) -> dict:
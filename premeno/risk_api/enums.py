@@ -0,0 +1,43 @@
+from enum import Enum
+
+
+class EthnicGroup(Enum):
+    WHITE = "white"
+    OTHER = "other"
+
+
+class EducationLevel(Enum):
+    PRIMARY = "primary"
+    SECONDARY = "secondary"
+    COLLEGE = "college"
+    UNIVERSITY = "uni"
+
+
+class SmokingUse(Enum):
+    NEVER = "never"
+    PAST = "past"
+    CURRENT = "current"
+
+
+class OralContraceptiveUse(Enum):
+    NEVER = "n"
+    EVER = "y"
+
+
+class MhtType(Enum):
+    NONE = "none"
+    OESTROGEN = "e"
+    COMBINED = "e+p"
+
+
+class BiopsyStatus(Enum):
+    NONE = 0
+    ONE = 1
+    MULTIPLE = 2
+    UNKNOWN = 3
+
+
+class HyperplasiaStatus(Enum):
+    NONE = 0
+    SOME = 1
+    UNKNOWN = 3
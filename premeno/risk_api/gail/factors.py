@@ -1,18 +1,64 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Iterable, Optional
 
+import numpy as np
+
+from premeno.risk_api.enums import BiopsyStatus, HyperplasiaStatus
 from premeno.risk_api.gail.errors import FactorError, RecodingError
-from premeno.risk_api.gail.race import ASIANS, ETHNIC_GROUP_TO_RACE, HISPANICS, Race
-from premeno.risk_api.questionnaire import BiopsyStatus, HyperplasiaStatus, Questionnaire
+from premeno.risk_api.gail.race import ASIANS, ETHNIC_GROUP_TO_RACE, HISPANICS, RACE_CODES, Race
+
+if TYPE_CHECKING:
+    from premeno.risk_api.questionnaire import Questionnaire
 
 _MIN_AGE = 25  # BCRAT mention 35 but use 25 in their package. Instead, we'll use 25
 _MAX_AGE = 80
 
+# Ages come from dates, so real ones differ by at least a day (~0.003 years).
+# Rounding well below that doesn't change the risk, but stops float noise in
+# how the age was worked out making otherwise equal factors unequal
+AGE_DECIMALS = 6
+
+""" Relative risk factors for unknown/no biopsy, no hyperplasia and hyperplasia """
+HYPERPLASIA_RELATIVE_RISKS = (1.00, 0.93, 1.82)
+
+""" Layout of the structured arrays of factors taken by GailModel.predict_batch """
+GAIL_FACTORS_DTYPE = np.dtype(
+    [
+        ("age", np.float64),
+        ("number_of_biopsies", np.int8),
+        ("age_at_menarche", np.int8),
+        ("age_at_first_child", np.int8),
+        ("number_of_relatives", np.int8),
+        ("relative_risk_factor", np.float64),
+        ("race", np.int8),  # see RACE_CODES
+    ]
+)
+
 
 class GailFactors:
     """These are the factors used in the logistic regression model
     Generally labelled from 0 to 3 (though add in race and age)
+
+    Immutable, and equal factors hash the same, so they can be used as
+    cache keys (see GailModel.predict)
     """
 
+    __slots__ = (
+        "age",
+        "number_of_biopsies",
+        "age_at_menarche",
+        "age_at_first_child",
+        "number_of_relatives",
+        "relative_risk_factor",
+        "race",
+    )
+    age: float
+    number_of_biopsies: int
+    age_at_menarche: int
+    age_at_first_child: int
+    number_of_relatives: int
+    relative_risk_factor: float
+    race: Race
+
     def __init__(
         self,
         age: float,
@@ -23,38 +69,61 @@ class GailFactors:
         relative_risk_factor: float,
         race: Race,
     ) -> None:
+        age = round(age, AGE_DECIMALS)
         if age < _MIN_AGE or age >= _MAX_AGE:
             raise FactorError(f"Age must be between {_MIN_AGE} and {_MAX_AGE}")
-        self.age = age
 
         if not 0 <= number_of_biopsies <= 2:
             raise FactorError("Biopsies factor should be between 0 and 2")
 
-        self.number_of_biopsies = number_of_biopsies
-
         if not 0 <= age_at_menarche <= 2:
             raise FactorError("Age at menarche factor should be between 0 and 2")
 
-        self.age_at_menarche = age_at_menarche
-
         if not 0 <= age_at_first_child <= 3:
             raise FactorError("Age at first child factor should be between 0 and 3")
 
-        self.age_at_first_child = age_at_first_child
-
         if not 0 <= number_of_relatives <= 2:
             raise FactorError("Number of relatives factor should be between 0 and 2")
 
-        self.number_of_relatives = number_of_relatives
-
         if not 0 < relative_risk_factor:
             raise FactorError("Relative risk factor should be positive")
 
-        self.relative_risk_factor = relative_risk_factor
-        self.race = race
+        values = (
+            age,
+            number_of_biopsies,
+            age_at_menarche,
+            age_at_first_child,
+            number_of_relatives,
+            relative_risk_factor,
+            race,
+        )
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("GailFactors can't be changed")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("GailFactors can't be changed")
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, GailFactors):
+            return NotImplemented
+
+        return self._values() == other._values()
+
+    def __hash__(self) -> int:
+        return hash(self._values())
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"GailFactors({values})"
 
     @classmethod
-    def from_questionnaire(cls, data: Questionnaire) -> "GailFactors":
+    def from_questionnaire(cls, data: "Questionnaire") -> "GailFactors":
         race = ETHNIC_GROUP_TO_RACE[data.ethnic_group]
         biops = recode_number_of_biopsies(data.number_of_biopsies, race)
         menarche = recode_age_at_menarche(data.age_at_menarche, race)
@@ -67,6 +136,45 @@ class GailFactors:
 
         return GailFactors(data.age, biops, menarche, first_child, num_rels, rr_fac, race)
 
+    def to_record(self) -> tuple:
+        """Row of a GAIL_FACTORS_DTYPE array"""
+        return (
+            self.age,
+            self.number_of_biopsies,
+            self.age_at_menarche,
+            self.age_at_first_child,
+            self.number_of_relatives,
+            self.relative_risk_factor,
+            RACE_CODES[self.race],
+        )
+
+
+def factors_to_array(factors: Iterable[GailFactors]) -> np.ndarray:
+    """Packs Gail factors into a structured array for the batch model"""
+    return np.array([fac.to_record() for fac in factors], dtype=GAIL_FACTORS_DTYPE)
+
+
+def validate_factors_array(factors: np.ndarray) -> None:
+    """Array equivalent of the checks made by GailFactors"""
+    if np.any((factors["age"] < _MIN_AGE) | (factors["age"] >= _MAX_AGE)):
+        raise FactorError(f"Age must be between {_MIN_AGE} and {_MAX_AGE}")
+
+    limits = {
+        "number_of_biopsies": 2,
+        "age_at_menarche": 2,
+        "age_at_first_child": 3,
+        "number_of_relatives": 2,
+    }
+    for name, limit in limits.items():
+        if np.any((factors[name] < 0) | (factors[name] > limit)):
+            raise FactorError(f"{name} factor should be between 0 and {limit}")
+
+    if np.any(factors["relative_risk_factor"] <= 0):
+        raise FactorError("Relative risk factor should be positive")
+
+    if np.any((factors["race"] < 0) | (factors["race"] >= len(RACE_CODES))):
+        raise FactorError("Unknown race code")
+
 
 def recode_number_of_biopsies(number_of_biopsies: BiopsyStatus, race: Race) -> int:
     """Recodes number of biopsies from 0 to 2"""
@@ -164,11 +272,11 @@ def hyperplasia_relative_risk(
     number_of_biopsies_fac = recode_number_of_biopsies(number_of_biopsies, race)
 
     if number_of_biopsies_fac == 0 or hyperplasia == HyperplasiaStatus.UNKNOWN:
-        return 1.00
+        return HYPERPLASIA_RELATIVE_RISKS[0]
     elif hyperplasia == HyperplasiaStatus.NONE:
-        return 0.93
+        return HYPERPLASIA_RELATIVE_RISKS[1]
     elif hyperplasia == HyperplasiaStatus.SOME:
-        return 1.82
+        return HYPERPLASIA_RELATIVE_RISKS[2]
     else:
         # can't happen unless enums change
         raise RecodingError("Failed to recode relative risk factor")  # pragma: no cover
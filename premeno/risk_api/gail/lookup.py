@@ -0,0 +1,113 @@
+from typing import Optional, Union
+
+import numpy as np
+
+from premeno.risk_api.gail.factors import HYPERPLASIA_RELATIVE_RISKS, GailFactors
+from premeno.risk_api.gail.parameters import BETAS_ARRAY, UNATTRIBUTABLE_RISK_ARRAY
+from premeno.risk_api.gail.race import RACE_CODES
+
+"""
+    Number of levels of each factor, in the order they're packed into a
+    factor code (so the age factor is the last digit, and the code for
+    the age factor being 1 is one more than for it being 0)
+"""
+FACTOR_LEVELS = {
+    "race": len(RACE_CODES),
+    "hyperplasia": len(HYPERPLASIA_RELATIVE_RISKS),
+    "number_of_biopsies": 3,
+    "age_at_menarche": 3,
+    "age_at_first_child": 4,
+    "number_of_relatives": 3,
+    "age_factor": 2,
+}
+
+
+def _build_tables() -> tuple[np.ndarray, np.ndarray]:
+    """Evaluates GailModel.relative_risk (and the unattributable version) at every code"""
+    levels = dict(zip(FACTOR_LEVELS, np.indices(tuple(FACTOR_LEVELS.values())).reshape(7, -1)))
+    beta = BETAS_ARRAY[levels["race"]].T
+    biopsies = levels["number_of_biopsies"]
+    first_child = levels["age_at_first_child"]
+    relatives = levels["number_of_relatives"]
+
+    hazard = (
+        biopsies * beta[0]
+        + levels["age_at_menarche"] * beta[1]
+        + first_child * beta[2]
+        + relatives * beta[3]
+        + biopsies * levels["age_factor"] * beta[4]
+        + (first_child * relatives * beta[5])
+        + np.log(np.array(HYPERPLASIA_RELATIVE_RISKS)[levels["hyperplasia"]])
+    )
+    relative_risks = np.exp(hazard)
+    unattrib_risks = UNATTRIBUTABLE_RISK_ARRAY[levels["race"], levels["age_factor"]]
+
+    return relative_risks, unattrib_risks * relative_risks
+
+
+"""
+    Relative risk (and relative risk times the unattributable risk) for
+    every possible combination of factors, indexed by factor code
+"""
+RELATIVE_RISKS, UNATTRIB_RELATIVE_RISKS = _build_tables()
+
+# plain lists are quicker to index one value at a time
+_RELATIVE_RISKS_LIST = RELATIVE_RISKS.tolist()
+_UNATTRIB_RELATIVE_RISKS_LIST = UNATTRIB_RELATIVE_RISKS.tolist()
+
+
+def factor_code(factors: GailFactors) -> Optional[int]:
+    """
+    Code of the factors with the age factor at 0 (add age_factor(at_age)
+    to get the code at a given age). None if the relative risk factor
+    isn't one of the hyperplasia levels, so isn't in the tables
+    """
+    if factors.relative_risk_factor not in HYPERPLASIA_RELATIVE_RISKS:
+        return None
+
+    digits = (
+        RACE_CODES[factors.race],
+        HYPERPLASIA_RELATIVE_RISKS.index(factors.relative_risk_factor),
+        factors.number_of_biopsies,
+        factors.age_at_menarche,
+        factors.age_at_first_child,
+        factors.number_of_relatives,
+        0,
+    )
+
+    code = 0
+    for digit, levels in zip(digits, FACTOR_LEVELS.values()):
+        code = code * levels + digit
+
+    return code
+
+
+def factor_codes(factors: np.ndarray) -> np.ndarray:
+    """factor_code for each row of a GAIL_FACTORS_DTYPE array, -1 where not in the tables"""
+    hyperplasia = np.full(len(factors), -1)
+    for level, rr_factor in enumerate(HYPERPLASIA_RELATIVE_RISKS):
+        hyperplasia[factors["relative_risk_factor"] == rr_factor] = level
+
+    digits: tuple[Union[np.ndarray, int], ...] = (
+        factors["race"],
+        hyperplasia,
+        factors["number_of_biopsies"],
+        factors["age_at_menarche"],
+        factors["age_at_first_child"],
+        factors["number_of_relatives"],
+        0,
+    )
+
+    codes = np.zeros(len(factors), dtype=np.intp)
+    for digit, levels in zip(digits, FACTOR_LEVELS.values()):
+        codes = codes * levels + digit
+
+    return np.where(hyperplasia >= 0, codes, -1)
+
+
+def lookup_relative_risk(code: int, at_age_factor: int) -> float:
+    return _RELATIVE_RISKS_LIST[code + at_age_factor]
+
+
+def lookup_unattrib_relative_risk(code: int, at_age_factor: int) -> float:
+    return _UNATTRIB_RELATIVE_RISKS_LIST[code + at_age_factor]
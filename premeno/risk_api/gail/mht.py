@@ -1,4 +1,4 @@
-from premeno.risk_api.questionnaire import MhtType
+from premeno.risk_api.enums import MhtType
 
 
 def collab_relative_risk(mht_type: MhtType) -> float:
@@ -1,27 +1,65 @@
 import math
+from functools import _CacheInfo, lru_cache
+from typing import Optional, Sequence, Union
 
-from premeno.risk_api.gail.factors import GailFactors
+import numpy as np
+
+from premeno.risk_api.gail.errors import FactorError
+from premeno.risk_api.gail.factors import GailFactors, validate_factors_array
+from premeno.risk_api.gail.lookup import (
+    UNATTRIB_RELATIVE_RISKS,
+    factor_code,
+    factor_codes,
+    lookup_relative_risk,
+    lookup_unattrib_relative_risk,
+)
 from premeno.risk_api.gail.parameters import (
+    AGE_BAND_WIDTH,
     BETAS,
+    BETAS_ARRAY,
     COMPETING_HAZARDS,
+    COMPETING_HAZARDS_ARRAY,
+    CUMULATIVE_COMPETING_HAZARDS,
+    CUMULATIVE_COMPETING_HAZARDS_ARRAY,
+    CUMULATIVE_INCIDENCE_RATES,
+    CUMULATIVE_INCIDENCE_RATES_ARRAY,
     INCIDENCE_RATES,
+    INCIDENCE_RATES_ARRAY,
+    START_AGE,
     UNATTRIBUTABLE_RISK,
+    UNATTRIBUTABLE_RISK_ARRAY,
 )
 from premeno.risk_api.gail.race import RACES_TO_RACE_CATEGORY
 
+# Note: In BCRAT code, they for some reason split this out
+# rather than having an age cat
+PIVOT_AGE = 50
+
+NUMBER_OF_BANDS = len(INCIDENCE_RATES_ARRAY[0])
+MAX_AGE = START_AGE + NUMBER_OF_BANDS * AGE_BAND_WIDTH
+
+# first band where age_factor is 1 (the pivot age falls on a band boundary)
+PIVOT_BAND = (PIVOT_AGE - START_AGE) // AGE_BAND_WIDTH
+
+
+DEFAULT_PREDICTION_CACHE_SIZE = 4096
+
 
 def age_factor(at_age: float) -> int:
-    # Note: In BCRAT code, they for some reason split this out
-    # rather than having an age cat
-    PIVOT_AGE = 50
     return 1 if at_age > PIVOT_AGE else 0
 
 
+def age_band(at_age: float) -> int:
+    """Index of the rate table band containing the age (the last band includes MAX_AGE)"""
+    return min(int((at_age - START_AGE) // AGE_BAND_WIDTH), NUMBER_OF_BANDS - 1)
+
+
 class GailModel:
     """Produces relative and absolute risks given gail factors"""
 
     def __init__(self, factors: GailFactors):
         self.factors = factors
+        self._code = factor_code(factors)
 
     def _calculate_interval_length(
         self, interval: int, interval_endpoints: tuple[int, int], age_end: float
@@ -41,12 +79,10 @@ class GailModel:
             return 1
 
     def _get_incidence_rate(self, interval: int) -> float:
-        AGE_BAND_WIDTH = 5
         idx = (interval - 1) // AGE_BAND_WIDTH
         return INCIDENCE_RATES[self.factors.race][idx]
 
     def _get_competing_hazard(self, interval: int) -> float:
-        AGE_BAND_WIDTH = 5
         idx = (interval - 1) // AGE_BAND_WIDTH
         return COMPETING_HAZARDS[self.factors.race][idx]
 
@@ -74,6 +110,13 @@ class GailModel:
 
     def relative_risk(self, at_age: float) -> float:
         """Calculates the relative risk of the given Gail factors"""
+        if self._code is None:
+            return self._relative_risk_formula(at_age)
+
+        return lookup_relative_risk(self._code, age_factor(at_age))
+
+    def _relative_risk_formula(self, at_age: float) -> float:
+        """Calculates relative risk directly, for factors not in the lookup tables"""
         beta = BETAS[RACES_TO_RACE_CATEGORY[self.factors.race]]
 
         hazard = (
@@ -89,18 +132,123 @@ class GailModel:
         return math.exp(hazard)
 
     def _unattrib_relative_risk(self, at_age) -> float:
+        if self._code is not None:
+            return lookup_unattrib_relative_risk(self._code, age_factor(at_age))
+
         unattrib_risks = UNATTRIBUTABLE_RISK[RACES_TO_RACE_CATEGORY[self.factors.race]]
         rel_risk = self.relative_risk(at_age)
         return unattrib_risks[age_factor(at_age)] * rel_risk
 
+    def _cumulative_hazard(
+        self, at_age: float, unattrib_before_pivot: float, unattrib_after_pivot: float
+    ) -> float:
+        """Total hazard from START_AGE to the given age, from the prefix sums of the rates"""
+        race = self.factors.race
+        band = age_band(at_age)
+        time_in_band = at_age - (START_AGE + band * AGE_BAND_WIDTH)
+
+        incidence = (
+            CUMULATIVE_INCIDENCE_RATES[race][band] + INCIDENCE_RATES[race][band] * time_in_band
+        )
+        competing = (
+            CUMULATIVE_COMPETING_HAZARDS[race][band] + COMPETING_HAZARDS[race][band] * time_in_band
+        )
+
+        if at_age <= PIVOT_AGE:
+            return unattrib_before_pivot * incidence + competing
+
+        pivot_incidence = CUMULATIVE_INCIDENCE_RATES[race][PIVOT_BAND]
+        return (
+            unattrib_before_pivot * pivot_incidence
+            + unattrib_after_pivot * (incidence - pivot_incidence)
+            + competing
+        )
+
     def predict(self, years: float) -> float:
         """
         Gets the probability (absolute risk) of breast cancer
         incidence of the
         given years from the starting age
+
+        Results are kept in a bounded LRU cache (see set_prediction_cache_size)
+        """
+        return _cached_predict(self.factors, years)
+
+    def predict_curve(self, horizons: Sequence[float]) -> np.ndarray:
+        """
+        Absolute risk at each of the horizons (years from the starting age,
+        needn't be whole or in order), worked out in a single pass. Use
+        MAX_AGE - age as the horizon for the lifetime risk
+        """
+        if any(horizon < 0 for horizon in horizons):
+            raise FactorError("Horizons can't be negative")
+
+        order = sorted(range(len(horizons)), key=lambda idx: horizons[idx])
+        risks = self._absolute_risks([horizons[idx] for idx in order])
+
+        curve = np.empty(len(horizons))
+        curve[order] = risks
+        return curve
+
+    def _absolute_risks(self, horizons: list[float]) -> list[float]:
+        """
+        Absolute risks at the given (sorted) horizons. The hazards are
+        constant within each age band, so each band the projection passes
+        through is integrated in one go, noting the total so far at any
+        horizons that end within it
         """
-        START_AGE = 20
+        if not horizons:
+            return []
+
+        age_start = self.factors.age
+        age_end = age_start + horizons[-1]
+        if age_end > MAX_AGE:
+            raise FactorError(f"Can't project beyond age {MAX_AGE}")
+
+        # as in _predict_by_interval, the age factor is taken at the end of each year
+        unattrib_risks = (
+            self._unattrib_relative_risk(PIVOT_AGE),
+            self._unattrib_relative_risk(PIVOT_AGE + 1),
+        )
+        start_hazard = self._cumulative_hazard(age_start, *unattrib_risks)
+
+        horizon_ages = [age_start + horizon for horizon in horizons]
+        absolute_risks: list[float] = []
+        total_absolute_risk = 0.0
+        for band in range(age_band(age_start), age_band(age_end) + 1):
+            band_start = START_AGE + band * AGE_BAND_WIDTH
+            segment_start = max(age_start, band_start)
+            segment_end = min(age_end, band_start + AGE_BAND_WIDTH)
+
+            incidence_rate = INCIDENCE_RATES[self.factors.race][band]
+            unattrib_risk = unattrib_risks[band >= PIVOT_BAND]
+            hazard = incidence_rate * unattrib_risk + COMPETING_HAZARDS[self.factors.race][band]
+            cumulative_hazard = (
+                self._cumulative_hazard(segment_start, *unattrib_risks) - start_hazard
+            )
+            band_risk = (unattrib_risk * incidence_rate / hazard) * math.exp(-cumulative_hazard)
 
+            while len(absolute_risks) < len(horizons):
+                horizon_age = horizon_ages[len(absolute_risks)]
+                if horizon_age > segment_end:
+                    break
+
+                absolute_risks.append(
+                    total_absolute_risk
+                    + band_risk * (1 - math.exp(-hazard * (horizon_age - segment_start)))
+                )
+
+            total_absolute_risk += band_risk * (
+                1 - math.exp(-hazard * (segment_end - segment_start))
+            )
+
+        return absolute_risks
+
+    def _predict_by_interval(self, years: float) -> float:
+        """
+        The original year by year version of predict, following BCRAT.
+        Kept as a reference for checking the band integration
+        """
         age_end = self.factors.age + years
         interval_rng = (
             math.floor(self.factors.age) - START_AGE + 1,
@@ -127,3 +275,128 @@ class GailModel:
             total_hazard += hazard_in_interval * interval_length
 
         return total_absolute_risk
+
+    @staticmethod
+    def _batch_unattrib_relative_risks(factors: np.ndarray) -> list[np.ndarray]:
+        """Array version of _unattrib_relative_risk, before and after the pivot age"""
+        codes = factor_codes(factors)
+        in_tables = codes >= 0
+        unattrib_risks = [
+            UNATTRIB_RELATIVE_RISKS[np.where(in_tables, codes, 0) + at_pivot]
+            for at_pivot in (0, 1)
+        ]
+        if in_tables.all():
+            return unattrib_risks
+
+        # relative risk factors other than the hyperplasia levels: work it out
+        others = factors[~in_tables]
+        race = others["race"].astype(np.intp)
+        beta = BETAS_ARRAY[race].T
+        biopsies = others["number_of_biopsies"]
+        first_child = others["age_at_first_child"]
+        relatives = others["number_of_relatives"]
+        for at_pivot in (0, 1):
+            unattrib_risks[at_pivot][~in_tables] = UNATTRIBUTABLE_RISK_ARRAY[
+                race, at_pivot
+            ] * np.exp(
+                biopsies * beta[0]
+                + others["age_at_menarche"] * beta[1]
+                + first_child * beta[2]
+                + relatives * beta[3]
+                + biopsies * at_pivot * beta[4]
+                + (first_child * relatives * beta[5])
+                + np.log(others["relative_risk_factor"])
+            )
+
+        return unattrib_risks
+
+    @staticmethod
+    def predict_batch(factors: np.ndarray, years: Union[float, np.ndarray]) -> np.ndarray:
+        """
+        Array version of predict. Takes a GAIL_FACTORS_DTYPE array (see
+        factors_to_array) and the projection length(s), and returns the
+        absolute risk for each row. Follows predict band by band, but each
+        band is computed for all rows at once
+        """
+        validate_factors_array(factors)
+
+        age_start = factors["age"]
+        age_end = age_start + years
+        if np.any(age_end > MAX_AGE):
+            raise FactorError(f"Can't project beyond age {MAX_AGE}")
+
+        race = factors["race"].astype(np.intp)
+        unattrib_risks = GailModel._batch_unattrib_relative_risks(factors)
+        pivot_incidence = CUMULATIVE_INCIDENCE_RATES_ARRAY[race, PIVOT_BAND]
+
+        def cumulative_hazard(at_age: np.ndarray, band: np.ndarray) -> np.ndarray:
+            time_in_band = at_age - (START_AGE + band * AGE_BAND_WIDTH)
+            incidence = (
+                CUMULATIVE_INCIDENCE_RATES_ARRAY[race, band]
+                + INCIDENCE_RATES_ARRAY[race, band] * time_in_band
+            )
+            competing = (
+                CUMULATIVE_COMPETING_HAZARDS_ARRAY[race, band]
+                + COMPETING_HAZARDS_ARRAY[race, band] * time_in_band
+            )
+            return (
+                np.where(
+                    at_age <= PIVOT_AGE,
+                    unattrib_risks[0] * incidence,
+                    unattrib_risks[0] * pivot_incidence
+                    + unattrib_risks[1] * (incidence - pivot_incidence),
+                )
+                + competing
+            )
+
+        def bands(at_age: np.ndarray) -> np.ndarray:
+            band = (at_age - START_AGE) // AGE_BAND_WIDTH
+            return np.minimum(band, NUMBER_OF_BANDS - 1).astype(np.intp)
+
+        start_band = bands(age_start)
+        end_band = bands(age_end)
+        start_hazard = cumulative_hazard(age_start, start_band)
+
+        total_absolute_risk = np.zeros(len(factors))
+        for band in range(start_band.min(initial=0), end_band.max(initial=-1) + 1):
+            band_start = START_AGE + band * AGE_BAND_WIDTH
+            segment_start = np.maximum(age_start, band_start)
+            segment_length = np.minimum(age_end, band_start + AGE_BAND_WIDTH) - segment_start
+            in_band = segment_length > 0
+
+            incidence_rate = INCIDENCE_RATES_ARRAY[race, band]
+            unattrib_risk = unattrib_risks[band >= PIVOT_BAND]
+            hazard = incidence_rate * unattrib_risk + COMPETING_HAZARDS_ARRAY[race, band]
+            segment_hazard = (
+                cumulative_hazard(segment_start, np.full(len(factors), band)) - start_hazard
+            )
+
+            absolute_risk = (
+                (unattrib_risk * incidence_rate / hazard)
+                * np.exp(-segment_hazard)
+                * (1 - np.exp(-hazard * segment_length))
+            )
+            total_absolute_risk += np.where(in_band, absolute_risk, 0)
+
+        return total_absolute_risk
+
+
+def _predict(factors: GailFactors, years: float) -> float:
+    return GailModel(factors)._absolute_risks([years])[0]
+
+
+_cached_predict = lru_cache(maxsize=DEFAULT_PREDICTION_CACHE_SIZE)(_predict)
+
+
+def set_prediction_cache_size(maxsize: Optional[int]) -> None:
+    """
+    Replaces the GailModel.predict cache with an empty one holding up to
+    maxsize results (0 turns caching off, None removes the limit)
+    """
+    global _cached_predict
+    _cached_predict = lru_cache(maxsize=maxsize)(_predict)
+
+
+def prediction_cache_info() -> _CacheInfo:
+    """Hits, misses, maximum and current size of the GailModel.predict cache"""
+    return _cached_predict.cache_info()
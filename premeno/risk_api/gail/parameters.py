@@ -1,4 +1,12 @@
-from premeno.risk_api.gail.race import Race, RaceCategory
+from itertools import accumulate
+
+import numpy as np
+
+from premeno.risk_api.gail.race import RACES_TO_RACE_CATEGORY, Race, RaceCategory
+
+""" The rate tables below are in AGE_BAND_WIDTH year bands starting at START_AGE """
+START_AGE = 20
+AGE_BAND_WIDTH = 5
 
 """
     These are the background rates of breast cancer for each age_group
@@ -454,3 +462,35 @@ UNATTRIBUTABLE_RISK = {
     RaceCategory.HISPANIC_OTHER: [0.428864989813, 0.450352338746],
     RaceCategory.ASIAN: [0.47519806426735, 0.50316401683903],
 }
+
+
+"""
+    Integrals of the incidence rates and competing hazards from START_AGE
+    up to the start of each band (so one longer than the tables). The
+    rates are constant within a band, so these give the cumulative
+    hazard at any age without summing year by year
+"""
+CUMULATIVE_INCIDENCE_RATES = {
+    race: list(accumulate((AGE_BAND_WIDTH * rate for rate in rates), initial=0.0))
+    for race, rates in INCIDENCE_RATES.items()
+}
+CUMULATIVE_COMPETING_HAZARDS = {
+    race: list(accumulate((AGE_BAND_WIDTH * rate for rate in rates), initial=0.0))
+    for race, rates in COMPETING_HAZARDS.items()
+}
+
+
+"""
+    Array versions of the tables above for the batch model, with one row
+    per race, in the order given by RACE_CODES
+"""
+INCIDENCE_RATES_ARRAY = np.array([INCIDENCE_RATES[race] for race in Race])
+COMPETING_HAZARDS_ARRAY = np.array([COMPETING_HAZARDS[race] for race in Race])
+BETAS_ARRAY = np.array([BETAS[RACES_TO_RACE_CATEGORY[race]] for race in Race])
+UNATTRIBUTABLE_RISK_ARRAY = np.array(
+    [UNATTRIBUTABLE_RISK[RACES_TO_RACE_CATEGORY[race]] for race in Race]
+)
+CUMULATIVE_INCIDENCE_RATES_ARRAY = np.array([CUMULATIVE_INCIDENCE_RATES[race] for race in Race])
+CUMULATIVE_COMPETING_HAZARDS_ARRAY = np.array(
+    [CUMULATIVE_COMPETING_HAZARDS[race] for race in Race]
+)
@@ -1,6 +1,6 @@
 from enum import Enum
 
-from premeno.risk_api.questionnaire import EthnicGroup
+from premeno.risk_api.enums import EthnicGroup
 
 
 class Race(Enum):
@@ -37,6 +37,10 @@ ETHNIC_GROUP_TO_RACE = {
 }
 
 
+""" Integer codes for each race, used to index the parameter arrays (see parameters.py) """
+RACE_CODES = {race: code for code, race in enumerate(Race)}
+
+
 """ Some gail parameters are stored by category """
 RACES_TO_RACE_CATEGORY = {
     Race.WHITE: RaceCategory.WHITE,
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+import uuid
+from enum import Enum
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+
+from premeno.risk_api.metrics import COUNTERS
+from premeno.risk_api.questionnaire import Questionnaire
+from premeno.risk_api.risk import risk_predictions
+
+"""
+    Redis list that jobs wait in for a risk_worker to take them. They join at
+    the head and are taken from the tail
+"""
+QUEUE_KEY = "risk-jobs:queue"
+
+"""
+    Redis list (one for each worker, by name) that a risk_worker keeps the
+    jobs it has taken in until it has run them, so any it doesn't finish (if
+    it dies) can be queued again
+"""
+PROCESSING_KEY = "risk-jobs:processing:{worker}"
+
+
+class JobStatus(Enum):
+    """Where a risk prediction job has got to"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED)
+
+
+def _job_key(job_id: str) -> str:
+    return f"risk-job:{job_id}"
+
+
+def _save(job_id: str, status: JobStatus, **details: Any) -> None:
+    caches[settings.RISK_JOBS_CACHE].set(
+        _job_key(job_id),
+        {"id": job_id, "status": status.value, **details},
+        timeout=settings.RISK_JOB_TTL,
+    )
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """
+    The job's id and status, and its result (the risk predictions) once done
+    or error if it failed. None if there's no such job, or it has expired
+    """
+    return caches[settings.RISK_JOBS_CACHE].get(_job_key(job_id))
+
+
+def server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _job_events(
+    job_id: str, job: dict, last_status: Optional[str], timed_out: bool
+) -> tuple[list[str], bool]:
+    """The events for the job as it now is (from get_job), and whether the stream ends"""
+    events = []
+    if job["status"] != last_status:
+        events.append(server_sent_event(job["status"], job))
+
+    if JobStatus(job["status"]) in FINISHED:
+        return events, True
+
+    if timed_out:
+        events.append(server_sent_event("timeout", {"id": job_id}))
+        return events, True
+
+    return events, False
+
+
+def job_events(job_id: str) -> Iterator[str]:
+    """
+    Server-sent events for the job: one each time its status changes (named
+    for the status, with the job as data) until it's finished, then the
+    stream ends. A timeout event ends it if that takes longer than
+    RISK_JOB_EVENTS_TIMEOUT, and an expired event if the job goes away
+    """
+    deadline = time.monotonic() + settings.RISK_JOB_EVENTS_TIMEOUT
+    last_status = None
+    while True:
+        job = get_job(job_id)
+        if job is None:
+            yield server_sent_event("expired", {"id": job_id})
+            return
+
+        events, ended = _job_events(job_id, job, last_status, time.monotonic() >= deadline)
+        yield from events
+        if ended:
+            return
+
+        last_status = job["status"]
+        time.sleep(settings.RISK_JOB_EVENTS_POLL_INTERVAL)
+
+
+async def job_events_async(job_id: str) -> AsyncIterator[str]:
+    """job_events for async code, so waiting between looks at the job doesn't block the loop"""
+    deadline = time.monotonic() + settings.RISK_JOB_EVENTS_TIMEOUT
+    last_status = None
+    while True:
+        job = await sync_to_async(get_job, thread_sensitive=False)(job_id)
+        if job is None:
+            yield server_sent_event("expired", {"id": job_id})
+            return
+
+        events, ended = _job_events(job_id, job, last_status, time.monotonic() >= deadline)
+        for event in events:
+            yield event
+        if ended:
+            return
+
+        last_status = job["status"]
+        await asyncio.sleep(settings.RISK_JOB_EVENTS_POLL_INTERVAL)
+
+
+def redis_connection():
+    """The Redis connection behind RISK_JOBS_CACHE (which must be a django-redis cache)"""
+    return get_redis_connection(settings.RISK_JOBS_CACHE)
+
+
+def submit_job(raw: dict, proj_years: int) -> str:
+    """
+    Queues risk predictions for the questionnaire data raw (already validated),
+    returning the job's id. With RISK_JOBS_EAGER they're made straight away
+    """
+    job_id = uuid.uuid4().hex
+    _save(job_id, JobStatus.QUEUED)
+    COUNTERS.increment("risk_jobs.submitted")
+
+    job = json.dumps({"id": job_id, "questionnaire": raw, "proj_years": proj_years})
+    if settings.RISK_JOBS_EAGER:
+        run_job(job)
+    else:
+        redis_connection().lpush(QUEUE_KEY, job)
+
+    return job_id
+
+
+def run_job(job: str) -> None:
+    """Makes the predictions for a job taken off the queue, saving the result"""
+    job_data = json.loads(job)
+    job_id = job_data["id"]
+    _save(job_id, JobStatus.RUNNING)
+
+    try:
+        data = Questionnaire(**job_data["questionnaire"])
+        result = risk_predictions(data, job_data["proj_years"])
+    except Exception as err:
+        print(f"Risk job {job_id} failed: {err}")
+        COUNTERS.increment("risk_jobs.failed")
+        _save(job_id, JobStatus.FAILED, error=str(err))
+        return
+
+    COUNTERS.increment("risk_jobs.done")
+    _save(job_id, JobStatus.DONE, result=result)
+
+
+def run_next_job(connection, timeout: float, worker: str) -> bool:
+    """
+    Runs the next job on the queue, waiting up to timeout seconds for one.
+    Whether it ran one. The job is kept in the worker's processing list while
+    it runs, so it isn't lost if the worker dies (see requeue_unfinished_jobs)
+    """
+    processing = PROCESSING_KEY.format(worker=worker)
+    job = connection.brpoplpush(QUEUE_KEY, processing, timeout=timeout)
+    if job is None:
+        return False
+
+    run_job(job.decode() if isinstance(job, bytes) else job)
+    connection.lrem(processing, 1, job)
+    return True
+
+
+def requeue_unfinished_jobs(connection, worker: str) -> int:
+    """
+    Queues again (behind the jobs already waiting) those the worker took but
+    didn't finish, because it died. How many there were
+    """
+    processing = PROCESSING_KEY.format(worker=worker)
+    requeued = 0
+    while True:
+        job = connection.rpoplpush(processing, QUEUE_KEY)
+        if job is None:
+            return requeued
+
+        job_id = json.loads(job)["id"]
+        print(f"Risk job {job_id} wasn't finished, so is queued again")
+        _save(job_id, JobStatus.QUEUED)
+        COUNTERS.increment("risk_jobs.requeued")
+        requeued += 1
@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import date
+from typing import Iterator
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import ValidationError
+
+from premeno.risk_api.canrisk.cache import get_cached_rates, result_cache_keys
+from premeno.risk_api.canrisk.grid import (
+    DEFAULT_AXES,
+    GRID_MHT_STATUSES,
+    CanRiskGrid,
+    grid_brackets,
+    grid_canrisk_file,
+    grid_point,
+    grid_points,
+)
+from premeno.risk_api.canrisk.ratelimit import RateLimiter
+from premeno.risk_api.canrisk.surrogate import horizon_risks
+from premeno.risk_api.management.commands.warm_canrisk_cache import (
+    WarmingPlan,
+    add_profile_arguments,
+    read_profiles,
+    warm,
+)
+from premeno.risk_api.questionnaire import Questionnaire
+
+"""
+    Axes that can have None (nothing) as a value
+"""
+NONE_AXES = {name for name, values in DEFAULT_AXES.items() if None in values}
+
+
+def grid_coverage(axes: dict[str, list], profiles: Iterator[dict]) -> Counter[str]:
+    """
+    How many of the profiles are "on" the grid, only on it once taken to the
+    edges of CLAMPED_AXES ("clamped"), "off" it (so get the fallback's risks),
+    or "invalid"
+    """
+    coverage: Counter[str] = Counter()
+    for profile in profiles:
+        try:
+            point = grid_point(Questionnaire(**profile))
+        except ValidationError:
+            coverage["invalid"] += 1
+            continue
+        except ValueError:
+            coverage["off"] += 1
+            continue
+
+        try:
+            grid_brackets(axes, point, clamp=False)
+            coverage["on"] += 1
+        except ValueError:
+            try:
+                grid_brackets(axes, point)
+                coverage["clamped"] += 1
+            except ValueError:
+                coverage["off"] += 1
+
+    return coverage
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetches CanRisk's risks for every point of a grid of its inputs (DEFAULT_AXES, or a "
+        "JSON file shaped like it), through the result cache, and saves them as a grid file "
+        "for CANRISK_GRID_PATH. Best run against the local stub or offline, as the grid "
+        "takes a call for each point and MHT status. Reports the grid's coverage of a grid "
+        "of questionnaires and/or past inputs (as for warm_canrisk_cache)"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("output", help="File to save the grid to")
+        parser.add_argument("--axes", help="JSON file of the grid's axes (DEFAULT_AXES if none)")
+        add_profile_arguments(parser)
+        parser.add_argument(
+            "--canrisk", metavar="URL", help="CanRisk API to call (CANRISK_API_URL by default)"
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Calls in flight at once")
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Most calls a second (CANRISK_WARM_RATE_LIMIT by default)",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report the grid's size, calling nothing"
+        )
+
+    def handle(self, *args, **options) -> None:
+        rate = options["rate"] if options["rate"] is not None else settings.CANRISK_WARM_RATE_LIMIT
+        if options["concurrency"] < 1 or rate <= 0:
+            raise CommandError("Concurrency and rate must be positive")
+
+        axes = self._axes(options["axes"])
+        today = date.today()
+        plan = WarmingPlan()
+        keys = []
+        for point in grid_points(axes):
+            canrisk_file = grid_canrisk_file(point, today)
+            pedigrees = canrisk_file.mht_variants(GRID_MHT_STATUSES)
+            point_keys = result_cache_keys(canrisk_file, GRID_MHT_STATUSES)
+            for mht_status, key in point_keys.items():
+                plan.lookups[key] += 1
+                plan.pedigrees.setdefault(key, pedigrees[mht_status])
+            keys.append(point_keys)
+
+        cached = plan.cached()
+        missing = [key for key in plan.pedigrees if key not in cached]
+        size = math.prod(CanRiskGrid.shape(axes)) * 4
+        self.stdout.write(
+            f"{len(keys)} points, {len(plan.pedigrees)} CanRisk requests ({len(missing)} not"
+            f" cached), {size / 2 ** 20:.1f} MiB"
+        )
+        self._report_coverage(grid_coverage(axes, read_profiles(options)))
+        if options["dry_run"]:
+            return
+
+        if missing:
+            start = time.perf_counter()
+            fetched, errors = warm(
+                plan, missing, options["canrisk"], RateLimiter(rate), options["concurrency"]
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"Fetched {fetched} in {elapsed:.1f}s ({len(errors)} failed)")
+            for error, count in Counter(errors).most_common(5):
+                self.stderr.write(f"{count} failed: {error}")
+
+        # built alongside, then moved into place, so workers using the old grid carry on
+        building = f"{options['output']}.building"
+        grid = CanRiskGrid.create(building, axes)
+        indexes = np.ndindex(*(len(values) for values in axes.values()))
+        for index, point, point_keys in zip(indexes, grid_points(axes), keys):
+            for mht_status, key in point_keys.items():
+                rates = get_cached_rates(key)
+                if rates is not None:
+                    grid.set_risks(index, mht_status, horizon_risks(rates, point["age"]))
+        grid.flush()
+        os.replace(building, options["output"])
+
+        missing_points = grid.missing()
+        self.stdout.write(
+            f"Saved {options['output']}"
+            + (f" ({missing_points} points have no risks)" if missing_points else "")
+        )
+
+    def _report_coverage(self, coverage: Counter[str]) -> None:
+        total = coverage["on"] + coverage["clamped"] + coverage["off"]
+        if not total:
+            self.stderr.write("No valid profiles to report the coverage of")
+            return
+
+        self.stdout.write(
+            f"Coverage of {total} profiles: {coverage['on'] / total:.1%} on the grid,"
+            f" {coverage['clamped'] / total:.1%} more taken to its edges,"
+            f" {coverage['off'] / total:.1%} off it"
+            + (f" ({coverage['invalid']} invalid profiles skipped)" if coverage["invalid"] else "")
+        )
+
+    def _axes(self, path) -> dict[str, list]:
+        if path is None:
+            return DEFAULT_AXES
+
+        try:
+            with open(path) as stream:
+                axes = json.load(stream)
+        except (OSError, json.JSONDecodeError) as err:
+            raise CommandError(f"Can't read axes: {err}")
+
+        if set(axes) != set(DEFAULT_AXES) or not all(axes.values()):
+            raise CommandError(f"Axes must give values for each of {', '.join(DEFAULT_AXES)}")
+
+        for name, values in axes.items():
+            numbers = [value for value in values if value is not None]
+            if numbers != sorted(set(numbers)) or (None in values and name not in NONE_AXES):
+                raise CommandError(f"{name} must be numbers in order (or nothing, where allowed)")
+
+        return {name: axes[name] for name in DEFAULT_AXES}
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from premeno.risk_api.canrisk.stub import StubCanRiskServer, StubConfig
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the CanRisk API, for load tests and benchmarks. "
+        "Point CANRISK_API_URL at it"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument(
+            "--latency",
+            default="fixed:0",
+            help=(
+                "Latency of each call: fixed:SECONDS, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA"
+                " or pareto:MINIMUM,ALPHA"
+            ),
+        )
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0, help="Share of BOADICEA calls given a 503"
+        )
+        parser.add_argument(
+            "--bad-request-rate",
+            type=float,
+            default=0.0,
+            help="Share of BOADICEA calls given a 400",
+        )
+        parser.add_argument("--token", default="stub-token", help="Token handed out on login")
+        parser.add_argument("--seed", type=int, default=None, help="Seed, for repeatable runs")
+        parser.add_argument("--verbose", action="store_true", help="Log each request")
+
+    def handle(self, *args, **options) -> None:
+        config = StubConfig(
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            bad_request_rate=options["bad_request_rate"],
+            token=options["token"],
+            seed=options["seed"],
+        )
+        try:
+            server = StubCanRiskServer(
+                config, options["host"], options["port"], options["verbose"]
+            )
+        except ValueError as err:
+            raise CommandError(str(err))
+
+        self.stderr.write(f"Stub CanRisk API listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
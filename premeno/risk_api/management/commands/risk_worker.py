@@ -0,0 +1,66 @@
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+
+from premeno.risk_api.jobs import redis_connection, requeue_unfinished_jobs, run_next_job
+
+"""
+    Seconds each thread waits for a job before checking whether it should stop
+"""
+POLL_TIMEOUT = 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs risk prediction jobs (from POST /api/risk/jobs/) off the Redis queue. "
+        "Across all workers, --concurrency bounds how many are run at once"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Jobs this worker runs at once"
+        )
+        parser.add_argument("--burst", action="store_true", help="Stop once the queue is empty")
+        parser.add_argument(
+            "--name",
+            default=socket.gethostname(),
+            help=(
+                "Name of this worker (the host's by default), the same when it's restarted and "
+                "unlike any other running worker's. On starting, jobs that a worker with the name "
+                "took but didn't finish are queued again"
+            ),
+        )
+
+    def handle(self, *args, **options) -> None:
+        stop = threading.Event()
+        connection = redis_connection()
+        worker = options["name"]
+        requeued = requeue_unfinished_jobs(connection, worker)
+        if requeued:
+            self.stderr.write(f"Queued {requeued} unfinished jobs again")
+
+        def work() -> None:
+            while not stop.is_set():
+                if not run_next_job(connection, POLL_TIMEOUT, worker) and options["burst"]:
+                    return
+
+        # finish the jobs being run, then stop
+        previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        threads = [threading.Thread(target=work) for _ in range(options["concurrency"])]
+        for thread in threads:
+            thread.start()
+        self.stderr.write(f"Risk worker running {len(threads)} jobs at once")
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(POLL_TIMEOUT)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
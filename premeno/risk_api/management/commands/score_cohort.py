@@ -0,0 +1,225 @@
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from itertools import islice
+from typing import IO, Iterable, Iterator, Optional, Union
+
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import ValidationError
+
+from premeno.risk_api.questionnaire import MhtType, Questionnaire
+from premeno.risk_api.risk import CanRiskCalc, GailRiskCalc, RiskCalc
+
+FORMATS = ("csv", "jsonl")
+
+"""
+    CSV cells that hold a JSON list (e.g. "[45, 52]"), as CSV has no lists
+"""
+CSV_LIST_FIELDS = ("sisters_ages_at_diagnosis",)
+
+"""
+    Rows handed to the pool at a time. Only this many are held in memory,
+    however large the cohort
+"""
+BATCH_SIZE = 2000
+
+# models used by this process to score rows, set by _init_scorer
+_calcs: list[RiskCalc] = []
+_proj_years = 5
+
+
+def _init_scorer(proj_years: int, canrisk_url: Optional[str]) -> None:
+    global _calcs, _proj_years
+
+    _proj_years = proj_years
+    _calcs = [GailRiskCalc()]
+    if canrisk_url is not None:
+        _calcs.append(CanRiskCalc(canrisk_url))
+
+
+def _format_validation_error(err: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in err.errors()
+    )
+
+
+def score_row(item: tuple[str, dict]) -> dict:
+    """Scores one questionnaire, recording any problems in the error column"""
+    row_id, row = item
+    record: dict = dict.fromkeys(output_columns(_calcs))
+    record["id"] = row_id
+
+    try:
+        data = Questionnaire(**row)
+    except ValidationError as err:
+        record["error"] = _format_validation_error(err)
+        return record
+
+    errors = []
+    for calc in _calcs:
+        try:
+            prepared = calc.prepare(data, _proj_years)
+            for mht_type in MhtType:
+                record[_column(calc, mht_type)] = calc.predict_prepared(
+                    prepared, data, _proj_years, mht_type
+                )
+        except Exception as err:
+            errors.append(f"{calc.name}: {err}")
+
+    record["error"] = "; ".join(errors)
+    return record
+
+
+def _column(calc: RiskCalc, mht_type: MhtType) -> str:
+    return f"{calc.name.lower()}_{mht_type.value}"
+
+
+def output_columns(calcs: Iterable[RiskCalc]) -> list[str]:
+    return ["id"] + [_column(calc, mht) for calc in calcs for mht in MhtType] + ["error"]
+
+
+def read_csv(stream: IO[str]) -> Iterator[dict]:
+    """
+    Rows of a CSV file. Blank cells are left as "", which the questionnaire
+    takes as unknown (or none), except in list fields, which are empty
+    """
+    for row in csv.DictReader(stream):
+        yield {
+            key: (json.loads(value) if value != "" else []) if key in CSV_LIST_FIELDS else value
+            for key, value in row.items()
+        }
+
+
+def read_jsonl(stream: IO[str]) -> Iterator[dict]:
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as err:
+            raise CommandError(f"Line {number} isn't valid JSON: {err}")
+        if not isinstance(row, dict):
+            raise CommandError(f"Line {number} isn't a JSON object")
+
+        yield row
+
+
+def _with_ids(rows: Iterable[dict]) -> Iterator[tuple[str, dict]]:
+    """Pairs each row with its "id" field, or its row number (from 1) if it hasn't one"""
+    for number, row in enumerate(rows, start=1):
+        row_id = row.pop("id", None)
+        yield (str(number) if row_id in (None, "") else str(row_id)), row
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class JsonlWriter:
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+
+    def writeheader(self) -> None:
+        pass
+
+    def writerow(self, record: dict) -> None:
+        self.stream.write(json.dumps(record) + "\n")
+
+
+def _format_from_path(path: str, given: Optional[str]) -> str:
+    if given is not None:
+        return given
+
+    for fmt in FORMATS:
+        if path.endswith(f".{fmt}"):
+            return fmt
+
+    raise CommandError(f"Can't tell the format of '{path}', pass it with --*-format")
+
+
+class Command(BaseCommand):
+    help = (
+        "Scores a cohort of questionnaires (CSV or JSON Lines, one questionnaire per row "
+        "with the same fields as the API) with Gail, and optionally CanRisk, writing one "
+        "row of predictions per questionnaire"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("input", help="Questionnaires to score, - for stdin")
+        parser.add_argument("output", help="Where to write the predictions, - for stdout")
+        parser.add_argument("--input-format", choices=FORMATS)
+        parser.add_argument("--output-format", choices=FORMATS)
+        parser.add_argument("--years", type=int, default=5, help="Projection years")
+        parser.add_argument(
+            "--canrisk",
+            nargs="?",
+            const="",
+            metavar="URL",
+            help="Also score with CanRisk, against the given API (CANRISK_API_URL by default)",
+        )
+        parser.add_argument(
+            "--processes", type=int, default=None, help="Worker processes (default: CPU count)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=50)
+        parser.add_argument(
+            "--progress-every", type=int, default=1000, help="Report progress every N rows"
+        )
+
+    def handle(self, *args, **options) -> None:
+        input_format = _format_from_path(options["input"], options["input_format"])
+        output_format = _format_from_path(options["output"], options["output_format"])
+        processes = options["processes"] or multiprocessing.cpu_count()
+        init_args = (options["years"], options["canrisk"])
+
+        _init_scorer(*init_args)
+        columns = output_columns(_calcs)
+
+        input_stream = sys.stdin if options["input"] == "-" else open(options["input"], newline="")
+        output_stream = (
+            sys.stdout if options["output"] == "-" else open(options["output"], "w", newline="")
+        )
+        pool = multiprocessing.Pool(processes, _init_scorer, init_args) if processes > 1 else None
+
+        try:
+            rows = _with_ids((read_csv if input_format == "csv" else read_jsonl)(input_stream))
+            writer: Union[csv.DictWriter[str], JsonlWriter] = (
+                csv.DictWriter(output_stream, columns)
+                if output_format == "csv"
+                else JsonlWriter(output_stream)
+            )
+            writer.writeheader()
+
+            start = time.perf_counter()
+            scored = failed = 0
+            for batch in _batches(rows, BATCH_SIZE):
+                records = (
+                    pool.imap(score_row, batch, options["chunk_size"])
+                    if pool is not None
+                    else map(score_row, batch)
+                )
+                for record in records:
+                    writer.writerow(record)
+                    scored += 1
+                    failed += bool(record["error"])
+                    if scored % options["progress_every"] == 0:
+                        self._report(scored, failed, start)
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if input_stream is not sys.stdin:
+                input_stream.close()
+            if output_stream is not sys.stdout:
+                output_stream.close()
+
+        self._report(scored, failed, start, done=True)
+
+    def _report(self, scored: int, failed: int, start: float, done: bool = False) -> None:
+        elapsed = time.perf_counter() - start
+        rate = scored / elapsed if elapsed > 0 else 0.0
+        message = f"{scored} rows scored ({failed} with errors) at {rate:.1f} rows/sec"
+        self.stderr.write(f"Done: {message} in {elapsed:.1f}s" if done else message)
@@ -0,0 +1,99 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import ValidationError
+
+from premeno.risk_api.canrisk.cache import get_cached_rates, result_cache_keys
+from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.surrogate import fit_and_evaluate, horizon_risks, surrogate_features
+from premeno.risk_api.management.commands.warm_canrisk_cache import (
+    add_profile_arguments,
+    read_profiles,
+)
+from premeno.risk_api.questionnaire import Questionnaire
+from premeno.risk_api.risk import MHT_TO_STATUS
+
+"""
+    Horizons (in years) the error on held out results is reported for
+"""
+REPORTED_HORIZONS = (1, 5, 10, 20)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fits a local surrogate for the CanRisk model to the CanRisk results in the result "
+        "cache (nothing is sent to CanRisk) for a grid of questionnaires and/or past inputs "
+        "(as for warm_canrisk_cache), saving it for CANRISK_SURROGATE_PATH. Reports its error "
+        "on the results held out from fitting"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("output", help="File to save the surrogate to")
+        add_profile_arguments(parser)
+        parser.add_argument(
+            "--holdout", type=float, default=0.2, help="Share of women held out to evaluate on"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed for choosing who's held out")
+        parser.add_argument("--ridge", type=float, default=1.0, help="Regularisation strength")
+
+    def handle(self, *args, **options) -> None:
+        if not 0 <= options["holdout"] < 1 or options["ridge"] < 0:
+            raise CommandError("Holdout must be between 0 and 1, and ridge not negative")
+
+        features, risks, groups = [], [], []
+        seen, invalid = set(), 0
+        for profile in read_profiles(options):
+            try:
+                data = Questionnaire(**profile)
+            except ValidationError:
+                invalid += 1
+                continue
+
+            cache_keys = result_cache_keys(
+                create_canrisk_file(data, MhtStatus.Never), MHT_TO_STATUS.values()
+            )
+            for mht_status, key in cache_keys.items():
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                rates = get_cached_rates(key)
+                if rates is not None:
+                    features.append(surrogate_features(data, mht_status))
+                    risks.append(horizon_risks(rates, int(data.age)))
+                    # every MHT status is the same woman
+                    groups.append(cache_keys[MhtStatus.Never])
+
+        if not features:
+            raise CommandError("No cached CanRisk results for these profiles to fit to")
+
+        surrogate, fitted, held_out = fit_and_evaluate(
+            np.array(features),
+            np.array(risks),
+            groups,
+            options["holdout"],
+            options["seed"],
+            options["ridge"],
+        )
+        if not surrogate.horizons:
+            raise CommandError(f"Too few cached CanRisk results ({fitted}) to fit to")
+
+        surrogate.save(options["output"])
+        self.stdout.write(
+            f"Fitted to {fitted} of {len(features)} cached CanRisk results for {len(seen)}"
+            f" requests, for {min(surrogate.horizons)} to {max(surrogate.horizons)} years"
+            + (f" ({invalid} invalid profiles skipped)" if invalid else "")
+        )
+        if not held_out:
+            self.stdout.write("Nothing held out, so its error isn't known")
+            return
+
+        self.stdout.write(f"Absolute error in the risk over {held_out} held out results:")
+        for horizon in REPORTED_HORIZONS:
+            count = int(surrogate.errors["count"][horizon - 1])
+            if count:
+                self.stdout.write(
+                    f"  {horizon} years: mean {surrogate.errors['mean'][horizon - 1]:.3%},"
+                    f" 95th percentile {surrogate.errors['p95'][horizon - 1]:.3%},"
+                    f" max {surrogate.errors['max'][horizon - 1]:.3%} ({count} compared)"
+                )
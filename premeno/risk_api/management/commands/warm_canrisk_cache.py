@@ -0,0 +1,264 @@
+import itertools
+import json
+import math
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import ValidationError
+
+from premeno.risk_api.canrisk.api import get_canrisk_api
+from premeno.risk_api.canrisk.cache import get_cached_rates, get_or_fetch_rates, result_cache_keys
+from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.ratelimit import RateLimiter
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.management.commands.score_cohort import FORMATS, read_csv, read_jsonl
+from premeno.risk_api.questionnaire import DAYS_PER_YEAR, Questionnaire
+from premeno.risk_api.risk import MHT_TO_STATUS
+
+"""
+    Profiles warmed when no grid or inputs are given: women in their late
+    forties and early fifties with no family history, drinking none, a little
+    or a moderate amount, with or without children. Every combination of the
+    "vary" values is made over "base". A value that is an object is merged in
+    (its name is just a label), so fields that go together can vary together.
+    "age" is made into dates of birth. Unknowns are "", as from the frontend
+"""
+DEFAULT_GRID = {
+    "base": {
+        "height": 164,
+        "weight": 70,
+        "ethnic_group": "white",
+        "education": "uni",
+        "alcohol_use": 0,
+        "smoking": "never",
+        "mht": "none",
+        "age_at_menarche": 13,
+        "nulliparous": False,
+        "age_at_first_child": 28,
+        "oral_contraception_use": "y",
+        "number_of_biopsies": 0,
+        "biopsies_with_hyperplasia": 0,
+        "mother_age_at_diagnosis": "",
+        "sisters_ages_at_diagnosis": [],
+    },
+    "vary": {
+        "age": list(range(45, 56)),
+        "alcohol_use": [0, 7, 14],
+        "children": [
+            {"nulliparous": False, "age_at_first_child": 28},
+            {"nulliparous": True, "age_at_first_child": ""},
+        ],
+    },
+}
+
+
+"""
+    Dates of birth as the frontend sends them
+"""
+DATE_OF_BIRTH_FORMAT = "%Y-%m-%dT00:00:00.000Z"
+
+
+def dates_of_birth(age: int, today: date) -> list[date]:
+    """
+    A date of birth for each year someone aged age today could have been born
+    in (CanRisk is sent the year as well as the age)
+    """
+    # the youngest and oldest someone can be and still be that age (see age_from_date)
+    youngest = today - timedelta(days=math.ceil(DAYS_PER_YEAR * age))
+    oldest = today - timedelta(days=math.ceil(DAYS_PER_YEAR * (age + 1)) - 1)
+    return [youngest] if youngest.year == oldest.year else [youngest, oldest]
+
+
+def grid_profiles(grid: dict, today: Optional[date] = None) -> Iterator[dict]:
+    """Questionnaire data for each combination in grid (shaped like DEFAULT_GRID)"""
+    today = today or date.today()
+    names = list(grid.get("vary", {}))
+    for values in itertools.product(*(grid["vary"][name] for name in names)):
+        profiles = [dict(grid.get("base", {}))]
+        for name, value in zip(names, values):
+            if isinstance(value, dict):
+                profiles = [{**profile, **value} for profile in profiles]
+            elif name == "age":
+                profiles = [
+                    {**profile, "date_of_birth": dob.strftime(DATE_OF_BIRTH_FORMAT)}
+                    for profile in profiles
+                    for dob in dates_of_birth(value, today)
+                ]
+            else:
+                profiles = [{**profile, name: value} for profile in profiles]
+
+        yield from profiles
+
+
+def add_profile_arguments(parser) -> None:
+    """The options read_profiles takes"""
+    parser.add_argument("--grid", help="JSON file of profiles (built-in grid if none)")
+    parser.add_argument("--replay", help="Past questionnaires, - for stdin")
+    parser.add_argument("--replay-format", choices=FORMATS)
+
+
+def _replayed(path: str, replay_format: Optional[str]) -> Iterator[dict]:
+    if replay_format is None:
+        replay_format = next((fmt for fmt in FORMATS if path.endswith(f".{fmt}")), None)
+    if replay_format is None:
+        raise CommandError(f"Can't tell the format of '{path}', pass it with --replay-format")
+
+    stream = sys.stdin if path == "-" else open(path, newline="")
+    try:
+        for row in (read_csv if replay_format == "csv" else read_jsonl)(stream):
+            row.pop("id", None)
+            yield row
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def read_profiles(options: dict) -> Iterator[dict]:
+    """
+    Questionnaire data for the grid and/or replayed questionnaires in the
+    command's options (from add_profile_arguments), or DEFAULT_GRID's if neither
+    """
+    if options["grid"] is not None:
+        try:
+            with open(options["grid"]) as stream:
+                grid = json.load(stream)
+        except (OSError, json.JSONDecodeError) as err:
+            raise CommandError(f"Can't read grid: {err}")
+        yield from grid_profiles(grid)
+    elif options["replay"] is None:
+        yield from grid_profiles(DEFAULT_GRID)
+
+    if options["replay"] is not None:
+        yield from _replayed(options["replay"], options["replay_format"])
+
+
+class WarmingPlan:
+    """
+    The CanRisk requests (by result cache key) that profiles make, and how
+    often they're looked up, so coverage can be weighted by how common each is
+    """
+
+    def __init__(self) -> None:
+        self.pedigrees: dict[str, str] = {}
+        self.lookups: Counter[str] = Counter()
+        self.invalid = 0
+
+    def add(self, profile: dict) -> None:
+        try:
+            data = Questionnaire(**profile)
+        except ValidationError:
+            self.invalid += 1
+            return
+
+        canrisk_file = create_canrisk_file(data, MhtStatus.Never)
+        pedigrees = canrisk_file.mht_variants(MHT_TO_STATUS.values())
+        for mht_status, key in result_cache_keys(canrisk_file, MHT_TO_STATUS.values()).items():
+            self.lookups[key] += 1
+            self.pedigrees.setdefault(key, pedigrees[mht_status])
+
+    def cached(self) -> set[str]:
+        return {key for key in self.pedigrees if get_cached_rates(key) is not None}
+
+    def coverage(self, cached: set[str]) -> float:
+        """Share of the distinct requests that are cached"""
+        return len(cached) / len(self.pedigrees) if self.pedigrees else 0.0
+
+    def projected_hit_rate(self, cached: set[str]) -> float:
+        """Share of lookups that would be cache hits"""
+        total = sum(self.lookups.values())
+        return sum(self.lookups[key] for key in cached) / total if total else 0.0
+
+
+def warm(
+    plan: WarmingPlan,
+    missing: list[str],
+    base_url: Optional[str],
+    limiter: RateLimiter,
+    concurrency: int,
+) -> tuple[int, list[str]]:
+    """Fetches the missing requests into the result cache. How many were, and the errors"""
+    api = get_canrisk_api(base_url)
+
+    def fetch(key: str) -> dict:
+        limiter.acquire()
+        return api.boadicea_rates(plan.pedigrees[key])
+
+    def warm_one(key: str) -> Optional[str]:
+        try:
+            get_or_fetch_rates(key, lambda: fetch(key))
+        except Exception as err:
+            return str(err)
+        return None
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        errors = [error for error in pool.map(warm_one, missing) if error is not None]
+
+    return len(missing) - len(errors), errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the shared CanRisk result cache ahead of time for common profiles: a grid "
+        "of questionnaires (JSON, shaped like DEFAULT_GRID), and/or past inputs replayed "
+        "from a CSV or JSON Lines file (as for score_cohort). Reports the coverage, and the "
+        "hit rate those profiles would get"
+    )
+
+    def add_arguments(self, parser) -> None:
+        add_profile_arguments(parser)
+        parser.add_argument(
+            "--canrisk", metavar="URL", help="CanRisk API to call (CANRISK_API_URL by default)"
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Calls in flight at once")
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Most calls a second (CANRISK_WARM_RATE_LIMIT by default)",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report the coverage, calling nothing"
+        )
+
+    def handle(self, *args, **options) -> None:
+        rate = options["rate"] if options["rate"] is not None else settings.CANRISK_WARM_RATE_LIMIT
+        if options["concurrency"] < 1 or rate <= 0:
+            raise CommandError("Concurrency and rate must be positive")
+
+        plan = WarmingPlan()
+        for profile in read_profiles(options):
+            plan.add(profile)
+        if not plan.pedigrees:
+            raise CommandError("No valid profiles to warm")
+
+        cached = plan.cached()
+        missing = [key for key in plan.pedigrees if key not in cached]
+        self._report(plan, cached, "Before")
+
+        if options["dry_run"] or not missing:
+            return
+
+        start = time.perf_counter()
+        warmed, errors = warm(
+            plan, missing, options["canrisk"], RateLimiter(rate), options["concurrency"]
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Warmed {warmed} in {elapsed:.1f}s ({len(errors)} failed)")
+        for error, count in Counter(errors).most_common(5):
+            self.stderr.write(f"{count} failed: {error}")
+
+        self._report(plan, plan.cached(), "After")
+
+    def _report(self, plan: WarmingPlan, cached: set[str], when: str) -> None:
+        self.stdout.write(
+            f"{when}: {len(cached)} of {len(plan.pedigrees)} distinct CanRisk requests cached"
+            f" ({plan.coverage(cached):.1%} coverage), projected hit rate"
+            f" {plan.projected_hit_rate(cached):.1%} over {sum(plan.lookups.values())} lookups"
+            + (f" ({plan.invalid} invalid profiles skipped)" if plan.invalid else "")
+        )
@@ -0,0 +1,33 @@
+import threading
+from collections import Counter
+
+
+class Counters:
+    """Thread-safe named counters, for keeping track of what this process has done"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter[str] = Counter()
+
+    def increment(self, name: str, by: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += by
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counts[name]
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+"""
+    Counters for this process. Names are prefixed with what they count, e.g.
+    canrisk.logins
+"""
+COUNTERS = Counters()
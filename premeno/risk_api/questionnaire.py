@@ -1,55 +1,25 @@
 from datetime import date, datetime, timedelta
-from enum import Enum
-from typing import Optional
+from inspect import signature
+from typing import Any, Optional
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, ValidationError, validator
 
+from premeno.risk_api.enums import (
+    BiopsyStatus,
+    EducationLevel,
+    EthnicGroup,
+    HyperplasiaStatus,
+    MhtType,
+    OralContraceptiveUse,
+    SmokingUse,
+)
 
-class EthnicGroup(Enum):
-    WHITE = "white"
-    OTHER = "other"
-
-
-class EducationLevel(Enum):
-    PRIMARY = "primary"
-    SECONDARY = "secondary"
-    COLLEGE = "college"
-    UNIVERSITY = "uni"
-
-
-class SmokingUse(Enum):
-    NEVER = "never"
-    PAST = "past"
-    CURRENT = "current"
-
-
-class OralContraceptiveUse(Enum):
-    NEVER = "n"
-    EVER = "y"
-
-
-class MhtType(Enum):
-    NONE = "none"
-    OESTROGEN = "e"
-    COMBINED = "e+p"
-
-
-class BiopsyStatus(Enum):
-    NONE = 0
-    ONE = 1
-    MULTIPLE = 2
-    UNKNOWN = 3
-
-
-class HyperplasiaStatus(Enum):
-    NONE = 0
-    SOME = 1
-    UNKNOWN = 3
+DAYS_PER_YEAR = 365.2425
 
 
 def age_from_date(date_of_birth: date, to_date: date = date.today()) -> float:
     """ """
-    return (to_date - date_of_birth) / timedelta(days=365.2425)
+    return (to_date - date_of_birth) / timedelta(days=DAYS_PER_YEAR)
 
 
 class Questionnaire(BaseModel):
@@ -199,3 +169,48 @@ class Questionnaire(BaseModel):
             raise ValueError("Sister's age of breast cancer diagnois should be between 0 and 120")
 
         return v
+
+
+"""
+    Fields with validators that check them against other fields (so need
+    checking again when one of those changes)
+"""
+CROSS_CHECKED_FIELDS = {
+    name
+    for name, field in Questionnaire.__fields__.items()
+    if any("values" in signature(v.func).parameters for v in field.class_validators.values())
+}
+
+
+def replace_field(data: Questionnaire, raw: dict, name: str, value: Any) -> Questionnaire:
+    """
+    Copy of the questionnaire with one field changed. raw is the data it was
+    parsed from. Only the changed field, and the later fields checked against
+    it, are validated again; raises ValidationError as Questionnaire(**raw)
+    would
+    """
+    fields = Questionnaire.__fields__
+    if name not in fields:
+        raise ValueError(f"Unknown questionnaire field '{name}'")
+
+    raw = {**raw, name: value}
+    names = list(fields)
+    values: dict[str, Any] = {}
+    updates: dict[str, Any] = {}
+    for field_name in names:
+        if field_name == name or (field_name in CROSS_CHECKED_FIELDS and name in values):
+            field = fields[field_name]
+            validated, errors = field.validate(
+                raw.get(field_name, getattr(data, field_name)),
+                values,
+                loc=field_name,
+                cls=Questionnaire,
+            )
+            if errors:
+                raise ValidationError([errors], Questionnaire)
+            updates[field_name] = validated
+            values[field_name] = validated
+        else:
+            values[field_name] = getattr(data, field_name)
+
+    return data.copy(update=updates)
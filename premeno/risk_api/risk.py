@@ -1,17 +1,37 @@
 import abc
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional, Sequence
 
+import numpy as np
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
-from premeno.risk_api.canrisk.api import CanRiskAPI
+from premeno.risk_api.canrisk.api import CanRiskAPI, get_async_canrisk_api, get_canrisk_api
+from premeno.risk_api.canrisk.cache import (
+    get_or_fetch_rates,
+    get_or_fetch_rates_async,
+    result_cache_keys,
+)
 from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.grid import CanRiskGrid, grid_point, open_grid
 from premeno.risk_api.canrisk.risk_factors import MhtStatus
-from premeno.risk_api.canrisk.utils import extract_cancer_rates, interpolate_rate
-from premeno.risk_api.gail.factors import GailFactors
+from premeno.risk_api.canrisk.surrogate import (
+    CanRiskSurrogate,
+    load_surrogate,
+    surrogate_features,
+    with_mht_status,
+)
+from premeno.risk_api.canrisk.utils import interpolate_rate
+from premeno.risk_api.gail.factors import GailFactors, factors_to_array
 from premeno.risk_api.gail.mht import collab_relative_risk
 from premeno.risk_api.gail.model import GailModel
-from premeno.risk_api.questionnaire import MhtType, Questionnaire
+from premeno.risk_api.metrics import COUNTERS
+from premeno.risk_api.questionnaire import MhtType, Questionnaire, replace_field
 
 
 class PredictionError(Exception):
@@ -40,9 +60,40 @@ MHT_TO_STATUS = {
     MhtType.COMBINED: MhtStatus.Combined,
 }
 
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool shared by the whole process for calls to remote models, with
+    as many threads as the CanRisk client has connections (so calls never
+    wait for a connection)
+    """
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        # a forked process has the pool but not its threads
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CANRISK_API_POOL_SIZE, thread_name_prefix="risk-calc"
+            )
+            _executor_pid = os.getpid()
+
+        return _executor
+
 
 class RiskCalc(metaclass=abc.ABCMeta):
-    """Abstract RiskCalc class - subclass to define an adapter that the API will use"""
+    """
+    Abstract RiskCalc class - subclass to define an adapter that the API will use,
+    defining predict_mht_type, or prepare and predict_prepared
+    """
+
+    # whether predictions for each MHT type are made at the same time, on the shared thread pool
+    concurrent: bool = False
+    # seconds predict waits for a concurrent model's predictions (None to wait for them all)
+    latency_budget: Optional[float] = None
 
     @property
     @classmethod
@@ -56,20 +107,106 @@ class RiskCalc(metaclass=abc.ABCMeta):
     def name(cls) -> str:
         pass  # pragma: no cover
 
-    @abc.abstractmethod
-    def predict_mht_type(self, data: Questionnaire, proj_years: int, mht_type: MhtType) -> float:
-        pass  # pragma: no cover
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # each is defined in terms of the other
+        if (
+            cls.predict_mht_type is RiskCalc.predict_mht_type
+            and cls.predict_prepared is RiskCalc.predict_prepared
+        ):
+            raise TypeError(
+                f"{cls.__name__} defines neither predict_mht_type nor predict_prepared"
+            )
 
-    def predict(self, data: Questionnaire, proj_years: int) -> dict[MhtType, Optional[float]]:
-        results = {}
-        for mht_type in MhtType:
+    def predict_mht_type(self, data: Questionnaire, proj_years: int, mht_type: MhtType) -> float:
+        """Prediction for one MHT type"""
+        return self.predict_prepared(self.prepare(data, proj_years), data, proj_years, mht_type)
+
+    def available(self) -> bool:
+        """Whether the model is set up to predict at all (e.g. has the files it needs)"""
+        return True
+
+    def error_bound(self, proj_years: int) -> Optional[float]:
+        """
+        How far off predictions over proj_years may be, for models that
+        approximate another. None if it isn't one, or that's not known
+        """
+        return None
+
+    def prepare(self, data: Questionnaire, proj_years: int) -> Any:
+        """
+        Work that doesn't depend on the MHT type, done once per questionnaire
+        and handed to predict_prepared for each type. Nothing by default
+        """
+        return None
+
+    def predict_prepared(
+        self, prepared: Any, data: Questionnaire, proj_years: int, mht_type: MhtType
+    ) -> float:
+        """Prediction for one MHT type, given the result of prepare"""
+        return self.predict_mht_type(data, proj_years, mht_type)
+
+    def predict(self, data: Questionnaire, proj_years: int) -> dict[str, Optional[float]]:
+        try:
+            prepared = self.prepare(data, proj_years)
+        except Exception as err:
+            print(f"Prediction Error for {self.name} model: {err}")
+            return {mht_type.value: None for mht_type in MhtType}
+
+        return self.predict_each_type([(prepared, data)], proj_years, self.latency_budget)[0]
+
+    def predict_each_type(
+        self,
+        prepared_data: Sequence[tuple[Any, Questionnaire]],
+        proj_years: int,
+        timeout: Optional[float] = None,
+    ) -> list[dict[str, Optional[float]]]:
+        """
+        predict_prepared for every MHT type of each prepared questionnaire, on
+        the shared thread pool if the model is concurrent. A prediction that
+        fails, or (if concurrent) isn't made within timeout seconds, is None
+        """
+
+        def predict_type(task: tuple[tuple[Any, Questionnaire], MhtType]) -> Optional[float]:
+            (prepared, data), mht_type = task
             try:
-                results.update({mht_type.value: self.predict_mht_type(data, proj_years, mht_type)})
+                return self.predict_prepared(prepared, data, proj_years, mht_type)
             except Exception as err:
-                results.update({mht_type.value: None})
                 print(f"Prediction Error for {self.name} model: {err}")
-
-        return results
+                return None
+
+        tasks = [(item, mht_type) for item in prepared_data for mht_type in MhtType]
+        if self.concurrent and (len(tasks) > 1 or timeout is not None):
+            futures = [shared_executor().submit(predict_type, task) for task in tasks]
+            done, not_done = wait(futures, timeout=timeout)
+            if not_done:
+                # the calls carry on in the pool, but nothing waits for them
+                for future in not_done:
+                    future.cancel()
+                self._out_of_time(timeout)
+
+            predictions = [future.result() if future in done else None for future in futures]
+        else:
+            predictions = list(map(predict_type, tasks))
+
+        in_order = iter(predictions)
+        return [{mht_type.value: next(in_order) for mht_type in MhtType} for _ in prepared_data]
+
+    def _out_of_time(self, timeout: Optional[float]) -> None:
+        COUNTERS.increment(f"{self.name.lower()}.budget_exceeded")
+        print(f"Prediction Error for {self.name} model: no prediction after {timeout}s")
+
+    def predict_many(
+        self, datas: Sequence[Questionnaire], proj_years: int
+    ) -> list[dict[str, Optional[float]]]:
+        """predict for each of several questionnaires. One at a time by default"""
+        return [self.predict(data, proj_years) for data in datas]
+
+    async def predict_async(
+        self, data: Questionnaire, proj_years: int
+    ) -> dict[str, Optional[float]]:
+        """predict for async code. Runs predict in a thread by default"""
+        return await sync_to_async(self.predict, thread_sensitive=False)(data, proj_years)
 
 
 class CanRiskCalc(RiskCalc):
@@ -77,14 +214,207 @@ class CanRiskCalc(RiskCalc):
 
     risk: Risk = Risk.BREAST_CANCER
     name: str = "CanRisk"
+    concurrent: bool = True
+
+    def __init__(self, base_url: Optional[str] = None) -> None:
+        """Uses the CanRisk API at base_url, or CANRISK_API_URL"""
+        self.base_url = base_url or settings.CANRISK_API_URL
+        self.latency_budget = settings.CANRISK_LATENCY_BUDGET
+
+    def prepare(
+        self, data: Questionnaire, proj_years: int
+    ) -> tuple[CanRiskAPI, dict[MhtStatus, str], dict[MhtStatus, str]]:
+        """
+        Gets the shared client, and writes the file (and the key for its result
+        in the cache) for each MHT type from one pedigree
+        """
+        api = get_canrisk_api(self.base_url)
+        canrisk_file = create_canrisk_file(data, MhtStatus.Never)
+
+        return (
+            api,
+            canrisk_file.mht_variants(MHT_TO_STATUS.values()),
+            result_cache_keys(canrisk_file, MHT_TO_STATUS.values()),
+        )
+
+    def predict_prepared(
+        self,
+        prepared: tuple[CanRiskAPI, dict[MhtStatus, str], dict[MhtStatus, str]],
+        data: Questionnaire,
+        proj_years: int,
+        mht_type: MhtType,
+    ) -> float:
+        api, canrisk_files, cache_keys = prepared
+        mht_status = MHT_TO_STATUS[mht_type]
+
+        # waits for another worker's call no longer than the request would
+        rates = get_or_fetch_rates(
+            cache_keys[mht_status],
+            lambda: api.boadicea_rates(canrisk_files[mht_status]),
+            self._wait_timeout(self.latency_budget),
+        )
+
+        return self._risk(rates, data, proj_years)
+
+    async def predict_async(
+        self, data: Questionnaire, proj_years: int
+    ) -> dict[str, Optional[float]]:
+        """
+        Makes the API calls for every MHT type at once, with the async client,
+        waiting for them for no longer than the latency budget
+        """
+        budget = self.latency_budget
+        deadline = None if budget is None else time.monotonic() + budget
+        try:
+            api = get_async_canrisk_api(self.base_url)
+            canrisk_file = create_canrisk_file(data, MhtStatus.Never)
+            canrisk_files = canrisk_file.mht_variants(MHT_TO_STATUS.values())
+            cache_keys = result_cache_keys(canrisk_file, MHT_TO_STATUS.values())
+        except Exception as err:
+            print(f"Prediction Error for {self.name} model: {err}")
+            return {mht_type.value: None for mht_type in MhtType}
+
+        async def predict_type(mht_type: MhtType) -> Optional[float]:
+            mht_status = MHT_TO_STATUS[mht_type]
+
+            async def fetch() -> dict:
+                return await api.boadicea_rates(canrisk_files[mht_status])
 
-    def predict_mht_type(self, data: Questionnaire, proj_years: int, mht_type: MhtType) -> float:
-        api = CanRiskAPI(settings.CANRISK_API_USERNAME, settings.CANRISK_API_PASSWORD)
-        canrisk_file = create_canrisk_file(data, MHT_TO_STATUS[mht_type])
-        rates = extract_cancer_rates(api.boadicea(str(canrisk_file)))
+            try:
+                rates = await get_or_fetch_rates_async(
+                    cache_keys[mht_status],
+                    fetch,
+                    self._wait_timeout(None if deadline is None else deadline - time.monotonic()),
+                )
+                return self._risk(rates, data, proj_years)
+            except Exception as err:
+                print(f"Prediction Error for {self.name} model: {err}")
+                return None
+
+        tasks = [asyncio.ensure_future(predict_type(mht_type)) for mht_type in MhtType]
+        done, not_done = await asyncio.wait(tasks, timeout=self.latency_budget)
+        if not_done:
+            for task in not_done:
+                task.cancel()
+            self._out_of_time(self.latency_budget)
 
+        return {
+            mht_type.value: task.result() if task in done else None
+            for mht_type, task in zip(MhtType, tasks)
+        }
+
+    @staticmethod
+    def _wait_timeout(remaining: Optional[float]) -> float:
+        """Longest to wait for another worker's CanRisk call, with remaining seconds of budget"""
+        if remaining is None:
+            return settings.CANRISK_SINGLE_FLIGHT_TIMEOUT
+
+        return max(0.0, min(settings.CANRISK_SINGLE_FLIGHT_TIMEOUT, remaining))
+
+    @staticmethod
+    def _risk(rates: dict, data: Questionnaire, proj_years: int) -> float:
         return interpolate_rate(rates["age"], rates["individual"], int(data.age) + proj_years)
 
+    def predict_many(
+        self, datas: Sequence[Questionnaire], proj_years: int
+    ) -> list[dict[str, Optional[float]]]:
+        """Prepares each questionnaire, then makes all the API calls for them at once"""
+        results: list[dict[str, Optional[float]]] = []
+        prepared_data, prepared_at = [], []
+        for data in datas:
+            results.append({mht_type.value: None for mht_type in MhtType})
+            try:
+                prepared_data.append((self.prepare(data, proj_years), data))
+                prepared_at.append(len(results) - 1)
+            except Exception as err:
+                print(f"Prediction Error for {self.name} model: {err}")
+
+        for i, predictions in zip(prepared_at, self.predict_each_type(prepared_data, proj_years)):
+            results[i] = predictions
+
+        return results
+
+
+class CanRiskSurrogateCalc(RiskCalc):
+    """
+    Adapter for a local surrogate of the CanRisk model (fitted to cached
+    CanRisk results by manage.py train_canrisk_surrogate), which answers
+    without calling CanRisk but may be off by as much as its error_bound
+    """
+
+    risk: Risk = Risk.BREAST_CANCER
+    name: str = "CanRisk surrogate"
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Uses the surrogate saved at path, or CANRISK_SURROGATE_PATH"""
+        self.path = path or settings.CANRISK_SURROGATE_PATH
+
+    def available(self) -> bool:
+        return bool(self.path)
+
+    def surrogate(self) -> CanRiskSurrogate:
+        """Raises ValueError if there's no surrogate"""
+        if not self.path:
+            raise ValueError("No CanRisk surrogate (CANRISK_SURROGATE_PATH isn't set)")
+
+        return load_surrogate(self.path)
+
+    def prepare(self, data: Questionnaire, proj_years: int) -> tuple[CanRiskSurrogate, np.ndarray]:
+        return self.surrogate(), surrogate_features(data)
+
+    def predict_prepared(
+        self,
+        prepared: tuple[CanRiskSurrogate, np.ndarray],
+        data: Questionnaire,
+        proj_years: int,
+        mht_type: MhtType,
+    ) -> float:
+        surrogate, features = prepared
+        return surrogate.predict(with_mht_status(features, MHT_TO_STATUS[mht_type]), proj_years)
+
+    def error_bound(self, proj_years: int) -> Optional[float]:
+        """
+        95th percentile of the surrogate's absolute error over proj_years, on
+        CanRisk results it wasn't fitted to. None if that's not known
+        """
+        return self.surrogate().error_bound(proj_years)
+
+
+class CanRiskGridCalc(RiskCalc):
+    """
+    Adapter for CanRisk's risks precomputed over a grid of its inputs (by
+    manage.py build_canrisk_grid), interpolated between the grid's points.
+    Questionnaires off the grid get no prediction
+    """
+
+    risk: Risk = Risk.BREAST_CANCER
+    name: str = "CanRisk grid"
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Uses the grid saved at path, or CANRISK_GRID_PATH"""
+        self.path = path or settings.CANRISK_GRID_PATH
+
+    def available(self) -> bool:
+        return bool(self.path)
+
+    def prepare(self, data: Questionnaire, proj_years: int) -> tuple[CanRiskGrid, np.ndarray]:
+        """The grid, and its risks interpolated for the questionnaire"""
+        if not self.path:
+            raise ValueError("No CanRisk grid (CANRISK_GRID_PATH isn't set)")
+
+        grid = open_grid(self.path)
+        return grid, grid.interpolate(grid_point(data))
+
+    def predict_prepared(
+        self,
+        prepared: tuple[CanRiskGrid, np.ndarray],
+        data: Questionnaire,
+        proj_years: int,
+        mht_type: MhtType,
+    ) -> float:
+        grid, interpolated = prepared
+        return grid.risk(interpolated, MHT_TO_STATUS[mht_type], proj_years)
+
 
 class GailRiskCalc(RiskCalc):
     """Adapter for Gail model"""
@@ -92,10 +422,64 @@ class GailRiskCalc(RiskCalc):
     risk: Risk = Risk.BREAST_CANCER
     name: str = "Gail"
 
-    def predict_mht_type(self, data: Questionnaire, proj_years: int, mht_type: MhtType) -> float:
-        gail = GailModel(GailFactors.from_questionnaire(data))
-        mht_rel_risk = collab_relative_risk(mht_type)
-        return gail.predict(proj_years) * mht_rel_risk
+    def prepare(self, data: Questionnaire, proj_years: int) -> float:
+        """The risk without MHT, which each MHT type scales"""
+        return GailModel(GailFactors.from_questionnaire(data)).predict(proj_years)
+
+    def predict_prepared(
+        self, prepared: float, data: Questionnaire, proj_years: int, mht_type: MhtType
+    ) -> float:
+        return prepared * collab_relative_risk(mht_type)
+
+    def predict_many(
+        self, datas: Sequence[Questionnaire], proj_years: int
+    ) -> list[dict[str, Optional[float]]]:
+        """Scores the questionnaires together with GailModel.predict_batch"""
+        results: list[dict[str, Optional[float]]] = [
+            {mht_type.value: None for mht_type in MhtType} for _ in datas
+        ]
+
+        factors, scored = [], []
+        for i, data in enumerate(datas):
+            try:
+                factors.append(GailFactors.from_questionnaire(data))
+                scored.append(i)
+            except Exception as err:
+                print(f"Prediction Error for {self.name} model: {err}")
+
+        if not factors:
+            return results
+
+        try:
+            risks = GailModel.predict_batch(factors_to_array(factors), proj_years)
+        except Exception:
+            # something in the batch can't be scored, so find out which one by one
+            return super().predict_many(datas, proj_years)
+
+        for i, risk in zip(scored, risks.tolist()):
+            results[i] = {
+                mht_type.value: risk * collab_relative_risk(mht_type) for mht_type in MhtType
+            }
+
+        return results
+
+    def predict_curve(
+        self, data: Questionnaire, horizons: Sequence[float]
+    ) -> dict[str, Optional[list[float]]]:
+        """
+        Risks at each of the horizons (in years, e.g. 1, 5, 10 and MAX_AGE - age
+        for lifetime) for each MHT type, from one pass through the model
+        """
+        try:
+            curve = GailModel(GailFactors.from_questionnaire(data)).predict_curve(horizons)
+        except Exception as err:
+            print(f"Prediction Error for {self.name} model: {err}")
+            return {mht_type.value: None for mht_type in MhtType}
+
+        return {
+            mht_type.value: (curve * collab_relative_risk(mht_type)).tolist()
+            for mht_type in MhtType
+        }
 
 
 class FakeCalc(RiskCalc):
@@ -112,15 +496,161 @@ class FakeCalc(RiskCalc):
         }[mht_type]
 
 
-def risk_predictions(data: Questionnaire, proj_years: int) -> dict:
-    """Makes all risk predictions based on the questionnaire data"""
-    models = {
-        Risk.BREAST_CANCER: CanRiskCalc,
-    }
+"""
+    Models the sensitivity analysis reports, keyed by name
+"""
+SENSITIVITY_MODELS = {
+    "gail": GailRiskCalc,
+    "canrisk": CanRiskCalc,
+}
+
+
+def _delta(risk: Optional[float], baseline: Optional[float]) -> Optional[float]:
+    if risk is None or baseline is None:
+        return None
+
+    return risk - baseline
+
+
+def sensitivity_predictions(
+    data: Questionnaire, raw: dict, perturbations: Sequence[dict], proj_years: int
+) -> dict:
+    """
+    Risk (for the MHT type she uses) for the questionnaire, and for each
+    perturbation of it (a field and the value to change it to), with the
+    change from the questionnaire's risk. raw is the data the questionnaire
+    was parsed from. All the variants are scored together by each model, and
+    variants that only differ in MHT type are scored once
+    """
+    variants: list[Optional[Questionnaire]] = []
+    errors: list[Optional[str]] = []
+    for perturbation in perturbations:
+        try:
+            variants.append(replace_field(data, raw, perturbation["field"], perturbation["value"]))
+            errors.append(None)
+        except ValueError as err:
+            variants.append(None)
+            errors.append(str(err))
+
+    # every model predicts for every MHT type, so changing only the MHT type needs no new scoring
+    baseline_key = data.json(exclude={"mht"})
+    to_score = {baseline_key: data}
+    keys: list[Optional[str]] = []
+    for variant in variants:
+        if variant is None:
+            keys.append(None)
+            continue
+
+        variant_key = variant.json(exclude={"mht"})
+        to_score.setdefault(variant_key, variant)
+        keys.append(variant_key)
+
+    predictions = {}
+    for name, model in SENSITIVITY_MODELS.items():
+        scored = model().predict_many(list(to_score.values()), proj_years)
+        predictions[name] = dict(zip(to_score, scored))
+
+    def risks(variant: Questionnaire, key: str) -> dict[str, Optional[float]]:
+        return {name: predictions[name][key][variant.mht.value] for name in predictions}
+
+    baseline = risks(data, baseline_key)
+    results = []
+    for perturbation, variant, key, error in zip(perturbations, variants, keys, errors):
+        result = {"field": perturbation["field"], "value": perturbation["value"]}
+        if variant is None or key is None:
+            result["error"] = error
+        else:
+            risk = risks(variant, key)
+            result["risk"] = risk
+            result["delta"] = {name: _delta(risk[name], baseline[name]) for name in risk}
+        results.append(result)
+
+    return {"baseline": baseline, "perturbations": results}
+
+
+"""
+    Model used for each type of risk
+"""
+RISK_MODELS = {
+    Risk.BREAST_CANCER: CanRiskCalc,
+}
+
+"""
+    Models used for a type of risk when its model in RISK_MODELS doesn't give
+    every prediction (e.g. CanRisk is down, too slow, or its circuit is open),
+    each tried in turn until one does. Those that aren't available (e.g. no
+    CanRisk grid has been built) are skipped
+"""
+FALLBACK_MODELS = {
+    Risk.BREAST_CANCER: (CanRiskGridCalc, CanRiskSurrogateCalc, GailRiskCalc),
+}
+
 
-    results = {}
-    for risk in models:
-        model = models[risk]()
-        results[risk.value] = model.predict(data, proj_years)
+def _complete(predictions: dict[str, Optional[float]]) -> bool:
+    return None not in predictions.values()
+
+
+def _fallbacks(risk: Risk) -> list[RiskCalc]:
+    models = (model() for model in FALLBACK_MODELS.get(risk, ()))
+    return [model for model in models if model.available()]
+
+
+def _with_sources(predictions: dict[Risk, tuple[RiskCalc, dict]], proj_years: int) -> dict:
+    results = {risk.value: prediction for risk, (_, prediction) in predictions.items()}
+    results["sources"] = {risk.value: model.name for risk, (model, _) in predictions.items()}
+
+    error_bounds = {}
+    for risk, (model, _) in predictions.items():
+        bound = model.error_bound(proj_years)
+        if bound is not None:
+            error_bounds[risk.value] = bound
+    if error_bounds:
+        results["error_bounds"] = error_bounds
 
     return results
+
+
+def risk_predictions(data: Questionnaire, proj_years: int) -> dict:
+    """
+    Makes all risk predictions based on the questionnaire data, with the name
+    of the model that made each under "sources", and how far off each may be
+    under "error_bounds" where the model approximates CanRisk (see
+    RiskCalc.error_bound)
+    """
+    predictions: dict[Risk, tuple[RiskCalc, dict]] = {}
+    for risk in RISK_MODELS:
+        model: RiskCalc = RISK_MODELS[risk]()
+        prediction = model.predict(data, proj_years)
+
+        if not _complete(prediction):
+            for fallback in _fallbacks(risk):
+                fallback_prediction = fallback.predict(data, proj_years)
+                if _complete(fallback_prediction):
+                    COUNTERS.increment(f"{risk.value}.fallbacks")
+                    model, prediction = fallback, fallback_prediction
+                    break
+
+        predictions[risk] = (model, prediction)
+
+    return _with_sources(predictions, proj_years)
+
+
+async def risk_predictions_async(data: Questionnaire, proj_years: int) -> dict:
+    """risk_predictions for async code, with the models predicting at the same time"""
+
+    async def predict(risk: Risk) -> tuple[RiskCalc, dict]:
+        model: RiskCalc = RISK_MODELS[risk]()
+        prediction = await model.predict_async(data, proj_years)
+
+        if not _complete(prediction):
+            for fallback in _fallbacks(risk):
+                fallback_prediction = await fallback.predict_async(data, proj_years)
+                if _complete(fallback_prediction):
+                    COUNTERS.increment(f"{risk.value}.fallbacks")
+                    model, prediction = fallback, fallback_prediction
+                    break
+
+        return model, prediction
+
+    predictions = await asyncio.gather(*(predict(risk) for risk in RISK_MODELS))
+    return _with_sources(dict(zip(RISK_MODELS, predictions)), proj_years)
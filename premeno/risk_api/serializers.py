@@ -10,3 +10,13 @@ class QuestionnaireSerializer(serializers.Serializer):
     dob = serializers.DateField()
     height = serializers.FloatField()
     weight = serializers.FloatField()
+
+
+class PerturbationSerializer(serializers.Serializer):
+    field = serializers.CharField()
+    value = serializers.JSONField()
+
+
+class SensitivitySerializer(serializers.Serializer):
+    questionnaire = serializers.DictField()
+    perturbations = PerturbationSerializer(many=True)
@@ -1,8 +1,37 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+from unittest.mock import patch
+
+import httpx
+import requests
+import respx
 from django.conf import settings
 from pytest import raises
 from requests_mock import Mocker
 
-from premeno.risk_api.canrisk.api import CanRiskAPI, CanRiskAPIError
+from premeno.risk_api.canrisk.api import (
+    BASE_URL,
+    AsyncCanRiskAPI,
+    CanRiskAPI,
+    CanRiskAPIError,
+    CircuitOpenError,
+    RateLimitedError,
+    canrisk_clients,
+    circuit_breaker,
+    get_async_canrisk_api,
+    get_canrisk_api,
+    outbound_limiter,
+    request_hedger,
+    reset_canrisk_clients,
+)
+from premeno.risk_api.canrisk.breaker import CircuitBreaker, CircuitState
+from premeno.risk_api.canrisk.hedge import Hedger
+from premeno.risk_api.canrisk.ratelimit import AdaptiveConcurrencyLimit, OutboundLimiter, Permit
+from premeno.risk_api.canrisk.stub import boadicea_response
+from premeno.risk_api.canrisk.utils import extract_cancer_rates
+from premeno.risk_api.metrics import COUNTERS
 
 
 class TestCanRiskAPI:
@@ -14,6 +43,7 @@ class TestCanRiskAPI:
     @classmethod
     def teardown_class(cls):
         settings.CANRISK_API_CACHE = cls.tmp_cache
+        reset_canrisk_clients()
 
     def test_initialise_correct(self) -> None:
         with Mocker() as mock:
@@ -76,6 +106,41 @@ class TestCanRiskAPI:
             canrisk = CanRiskAPI("dv21", "password123")
             assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
 
+    def test_boadicea_rates(self) -> None:
+        with Mocker() as mock:
+            mock.post(
+                "https://www.canrisk.org/auth-token/",
+                status_code=200,
+                json={"token": "notarealtoken"},
+            )
+            mock.post("https://www.canrisk.org/boadicea/", json=boadicea_response(46))
+            canrisk = CanRiskAPI("dv21", "password123")
+            rates = canrisk.boadicea_rates("fakepedigreedata")
+            assert rates == extract_cancer_rates(boadicea_response(46))
+
+            mock.post("https://www.canrisk.org/boadicea/", status_code=400, json={})
+            with raises(CanRiskAPIError, match="Bad Request"):
+                canrisk.boadicea_rates("fakepedigreedata")
+
+    def test_boadicea_rates_cached(self) -> None:
+        with Mocker() as mock:
+            settings.CANRISK_API_CACHE = True
+            mock.post(
+                "https://www.canrisk.org/auth-token/",
+                status_code=200,
+                json={"token": "notarealtoken"},
+            )
+            canrisk = CanRiskAPI("dv21", "password123")
+
+            mock.post("https://www.canrisk.org/boadicea/", json=boadicea_response(46))
+            rates = canrisk.boadicea_rates("otherpedigreedata")
+            assert rates == extract_cancer_rates(boadicea_response(46))
+
+            mock.post("https://www.canrisk.org/boadicea/", json=boadicea_response(50))
+            # caches the first one
+            assert canrisk.boadicea_rates("otherpedigreedata") == rates
+            settings.CANRISK_API_CACHE = False
+
     def test_cached(self) -> None:
         with Mocker() as mock:
             settings.CANRISK_API_CACHE = True
@@ -101,3 +166,543 @@ class TestCanRiskAPI:
             # caches the first one
             assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
             settings.CANRISK_API_CACHE = False
+
+    def test_refreshes_token_when_rejected(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+        with Mocker() as mock:
+            mock.post(
+                "https://www.canrisk.org/auth-token/",
+                [{"json": {"token": "old"}}, {"json": {"token": "new"}}],
+            )
+            mock.post(
+                "https://www.canrisk.org/boadicea/",
+                [{"status_code": 401, "json": {}}, {"json": {"test": "TEST"}}],
+            )
+            canrisk = CanRiskAPI("dv21", "password123")
+
+            assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
+            assert canrisk.api_key == "new"
+            assert mock.request_history[-1].headers["Authorization"] == "token new"
+
+    def test_gives_up_when_refreshed_token_rejected(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/auth-token/", json={"token": "notarealtoken"})
+            mock.post("https://www.canrisk.org/boadicea/", status_code=401, json={})
+            canrisk = CanRiskAPI("dv21", "password123")
+
+            with raises(CanRiskAPIError, match="Unauthorized"):
+                canrisk.boadicea("fakepedigreedata")
+            assert mock.call_count == 4
+
+    def test_base_url(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+        with Mocker() as mock:
+            mock.post("http://localhost:8001/auth-token/", json={"token": "notarealtoken"})
+            mock.post("http://localhost:8001/boadicea/", json={"test": "TEST"})
+            canrisk = CanRiskAPI("dv21", "password123", "http://localhost:8001/")
+
+            assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
+
+    def test_shared_client(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+        reset_canrisk_clients()
+        COUNTERS.reset()
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/auth-token/", json={"token": "notarealtoken"})
+            mock.post("http://localhost:8001/auth-token/", json={"token": "notarealtoken"})
+
+            canrisk = get_canrisk_api()
+            assert get_canrisk_api() is canrisk
+            assert get_canrisk_api("http://localhost:8001") is not canrisk
+            assert set(canrisk_clients()) == {BASE_URL, "http://localhost:8001"}
+            assert COUNTERS.get("canrisk.logins") == 2
+
+        reset_canrisk_clients()
+        assert canrisk_clients() == {}
+
+    def test_slow_login_holds_up_only_its_client(self) -> None:
+        reset_canrisk_clients()
+        logging_in = threading.Event()
+        release = threading.Event()
+        made = []
+
+        class SlowLogin:
+            def __init__(self, username: str, password: str, base_url: str, *args) -> None:
+                made.append(base_url)
+                if base_url == "http://slow":
+                    logging_in.set()
+                    release.wait(5)
+
+        with patch("premeno.risk_api.canrisk.api.CanRiskAPI", SlowLogin):
+            clients = []
+            threads = [
+                threading.Thread(target=lambda: clients.append(get_canrisk_api("http://slow")))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            assert logging_in.wait(5)
+
+            # isn't held up by the other client's login
+            assert get_canrisk_api("http://fast") is not None
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        # the threads wanting the slow client waited for the one login
+        assert made.count("http://slow") == 1
+        assert clients[0] is clients[1]
+        reset_canrisk_clients()
+
+    def test_connection_stats(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        canrisk = CanRiskAPI("dv21", "password123")
+        assert canrisk.connection_stats() == {"connections": 0, "requests": 0}
+
+    def test_timeout(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/boadicea/", json={"test": "TEST"})
+            canrisk = CanRiskAPI("dv21", "password123", timeout=2.5)
+
+            canrisk.boadicea("fakepedigreedata")
+            assert mock.last_request.timeout == 2.5
+
+    def test_circuit_breaker(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        with Mocker() as mock:
+            mock.post(
+                "https://www.canrisk.org/boadicea/",
+                [
+                    {"status_code": 400, "json": {}},
+                    {"status_code": 503, "json": {}},
+                    {"exc": requests.exceptions.ConnectTimeout},
+                ],
+            )
+            breaker = CircuitBreaker("test", failure_threshold=2)
+            canrisk = CanRiskAPI("dv21", "password123", breaker=breaker)
+
+            # bad requests are our fault, not the API's
+            with raises(CanRiskAPIError, match="Bad Request"):
+                canrisk.boadicea("fakepedigreedata")
+            assert breaker.state == CircuitState.CLOSED
+
+            with raises(CanRiskAPIError, match="Service Unavailable"):
+                canrisk.boadicea("fakepedigreedata")
+            with raises(requests.exceptions.ConnectTimeout):
+                canrisk.boadicea("fakepedigreedata")
+            assert breaker.state == CircuitState.OPEN
+
+            with raises(CircuitOpenError):
+                canrisk.boadicea("fakepedigreedata")
+            assert mock.call_count == 3
+
+    def test_shared_breaker(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        reset_canrisk_clients()
+
+        assert get_canrisk_api().breaker is circuit_breaker()
+        assert circuit_breaker("http://localhost:8001") is not circuit_breaker()
+        assert circuit_breaker().failure_threshold == settings.CANRISK_BREAKER_FAILURES
+
+        reset_canrisk_clients()
+
+    def test_limiter(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        COUNTERS.reset()
+        with Mocker() as mock:
+            mock.post(
+                "https://www.canrisk.org/boadicea/",
+                [
+                    {"status_code": 200, "json": {"test": "TEST"}},
+                    {"status_code": 429, "json": {}},
+                    {"status_code": 200, "json": {"test": "TEST"}},
+                ],
+            )
+            concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=2)
+            limiter = OutboundLimiter("test", concurrency=concurrency, queue_timeout=0.01)
+            canrisk = CanRiskAPI("dv21", "password123", limiter=limiter)
+
+            assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
+            assert concurrency.limit == 2
+
+            # throttled, so backs off
+            with raises(CanRiskAPIError, match="Too Many Requests"):
+                canrisk.boadicea("fakepedigreedata")
+            assert concurrency.limit == 1
+            assert COUNTERS.get("canrisk.throttled") == 1
+
+            # the one slot is taken, so gives up without calling
+            generation = concurrency.acquire()
+            assert generation is not None
+            with raises(RateLimitedError):
+                canrisk.boadicea("fakepedigreedata")
+            assert mock.call_count == 2
+
+            concurrency.release(generation, None)
+            assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
+            assert concurrency.in_flight == 0
+
+    def test_limiter_breaker_open(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        breaker = CircuitBreaker("test", failure_threshold=1)
+        breaker.record_failure()
+        concurrency = AdaptiveConcurrencyLimit("test")
+        canrisk = CanRiskAPI(
+            "dv21",
+            "password123",
+            breaker=breaker,
+            limiter=OutboundLimiter("test", None, concurrency),
+        )
+
+        with raises(CircuitOpenError):
+            canrisk.boadicea("fakepedigreedata")
+        assert concurrency.in_flight == 0
+        assert concurrency.limit == concurrency.maximum
+
+    def test_shared_limiter(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        reset_canrisk_clients()
+
+        limiter = outbound_limiter()
+        assert get_canrisk_api().limiter is limiter
+        assert outbound_limiter("http://localhost:8001") is not limiter
+        assert limiter.concurrency is not None
+        assert limiter.concurrency.maximum == settings.CANRISK_CONCURRENCY_MAX
+        assert limiter.queue_timeout == settings.CANRISK_QUEUE_TIMEOUT
+        # no rate limit configured for tests
+        assert limiter.tokens is None
+
+        reset_canrisk_clients()
+
+    def test_hedging(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        COUNTERS.reset()
+        calls = []
+
+        def respond(request, context) -> dict:
+            calls.append(request)
+            call = len(calls)
+            if call in (1, 3):
+                time.sleep(0.3)
+            return {"call": call}
+
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/boadicea/", json=respond)
+            hedger = Hedger("canrisk", percentile=50, budget=0.5, min_delay=0.1, min_samples=1)
+            hedger.record(0.01)
+            canrisk = CanRiskAPI("dv21", "password123", hedger=hedger)
+
+            # slow, but half a call's budget isn't enough to hedge
+            assert canrisk.boadicea("fakepedigreedata") == {"call": 1}
+            assert canrisk.boadicea("fakepedigreedata") == {"call": 2}
+            assert COUNTERS.get("canrisk.hedge.over_budget") == 1
+
+            # slow again, so hedged, and the hedge answers first
+            assert canrisk.boadicea("fakepedigreedata") == {"call": 4}
+            assert COUNTERS.get("canrisk.hedge.sent") == 1
+            assert COUNTERS.get("canrisk.hedge.won") == 1
+
+    def test_hedging_limited(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        COUNTERS.reset()
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=1)
+        hedger = Hedger("canrisk", budget=1.0, min_samples=1)
+        hedger.record(0.01)
+
+        def respond(request, context) -> dict:
+            time.sleep(0.1)
+            return {"test": "TEST"}
+
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/boadicea/", json=respond)
+            limiter = OutboundLimiter("test", concurrency=concurrency)
+            canrisk = CanRiskAPI("dv21", "password123", limiter=limiter, hedger=hedger)
+
+            # the call has the only slot, so there's none to hedge with
+            assert canrisk.boadicea("fakepedigreedata") == {"test": "TEST"}
+            assert mock.call_count == 1
+            assert COUNTERS.get("canrisk.hedge.limited") == 1
+            assert concurrency.in_flight == 0
+
+    def test_hedging_both_fail(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        hedger = Hedger("canrisk", budget=1.0, min_samples=1)
+        hedger.record(0.0)
+
+        def respond(request, context) -> dict:
+            time.sleep(0.05)
+            context.status_code = 400
+            return {}
+
+        with Mocker() as mock:
+            mock.post("https://www.canrisk.org/boadicea/", json=respond)
+            canrisk = CanRiskAPI("dv21", "password123", hedger=hedger)
+
+            with raises(CanRiskAPIError, match="Bad Request"):
+                canrisk.boadicea("fakepedigreedata")
+            assert mock.call_count == 2
+
+    def test_shared_hedger(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        reset_canrisk_clients()
+
+        # no hedging configured for tests
+        assert request_hedger() is None
+        assert get_canrisk_api().hedger is None
+
+        percentile = settings.CANRISK_HEDGE_PERCENTILE
+        settings.CANRISK_HEDGE_PERCENTILE = 95.0
+        try:
+            reset_canrisk_clients()
+            hedger = request_hedger()
+            assert get_canrisk_api().hedger is hedger
+            assert request_hedger("http://localhost:8001") is not hedger
+            assert hedger is not None
+            assert hedger.budget == settings.CANRISK_HEDGE_BUDGET
+        finally:
+            settings.CANRISK_HEDGE_PERCENTILE = percentile
+            reset_canrisk_clients()
+
+
+class TestAsyncCanRiskAPI:
+    def test_boadicea(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+
+        async def boadicea() -> tuple[list[dict], AsyncCanRiskAPI]:
+            canrisk = AsyncCanRiskAPI("dv21", "password123")
+            results = await asyncio.gather(
+                canrisk.boadicea("fakepedigreedata"), canrisk.boadicea("fakepedigreedata")
+            )
+            await canrisk.aclose()
+            return list(results), canrisk
+
+        with respx.mock:
+            login = respx.post("https://www.canrisk.org/auth-token/").respond(
+                json={"token": "notarealtoken"}
+            )
+            call = respx.post("https://www.canrisk.org/boadicea/").respond(json={"test": "TEST"})
+            results, canrisk = asyncio.run(boadicea())
+
+        assert results == [{"test": "TEST"}, {"test": "TEST"}]
+        assert canrisk.api_key == "notarealtoken"
+        assert login.call_count == 1
+        assert call.calls[-1].request.headers["Authorization"] == "token notarealtoken"
+
+    def test_boadicea_rates(self) -> None:
+        settings.CANRISK_API_TOKEN = "notarealtoken"
+
+        async def boadicea_rates() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123")
+            rates = await canrisk.boadicea_rates("fakepedigreedata")
+            with raises(CanRiskAPIError, match="Bad Request"):
+                await canrisk.boadicea_rates("fakepedigreedata")
+            await canrisk.aclose()
+            return rates
+
+        with respx.mock:
+            respx.post("https://www.canrisk.org/boadicea/").mock(
+                side_effect=[
+                    httpx.Response(200, json=boadicea_response(46)),
+                    httpx.Response(400, json={}),
+                ]
+            )
+            rates = asyncio.run(boadicea_rates())
+
+        assert rates == extract_cancer_rates(boadicea_response(46))
+        settings.CANRISK_API_TOKEN = ""
+
+    def test_refreshes_token_when_rejected(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+
+        async def boadicea() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123")
+            return await canrisk.boadicea("fakepedigreedata")
+
+        with respx.mock:
+            respx.post("https://www.canrisk.org/auth-token/").mock(
+                side_effect=[
+                    httpx.Response(200, json={"token": "old"}),
+                    httpx.Response(200, json={"token": "new"}),
+                ]
+            )
+            call = respx.post("https://www.canrisk.org/boadicea/").mock(
+                side_effect=[httpx.Response(401, json={}), httpx.Response(200, json={"a": 1})]
+            )
+
+            assert asyncio.run(boadicea()) == {"a": 1}
+            assert call.calls[-1].request.headers["Authorization"] == "token new"
+
+    def test_bad_response(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+
+        async def boadicea() -> dict:
+            return await AsyncCanRiskAPI("dv21", "password123").boadicea("fakepedigreedata")
+
+        with respx.mock:
+            respx.post("https://www.canrisk.org/boadicea/").respond(400, json={})
+
+            with raises(CanRiskAPIError, match="Bad response from CanRisk API:"):
+                asyncio.run(boadicea())
+
+    def test_no_token_response(self) -> None:
+        settings.CANRISK_API_TOKEN = ""
+
+        async def boadicea() -> dict:
+            return await AsyncCanRiskAPI("dv21", "password123").boadicea("fakepedigreedata")
+
+        with respx.mock:
+            respx.post("https://www.canrisk.org/auth-token/").respond(json={"bloken": "x"})
+
+            with raises(CanRiskAPIError, match="Unable to parse CanRisk API token."):
+                asyncio.run(boadicea())
+
+    def test_circuit_breaker(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        breaker = CircuitBreaker("test", failure_threshold=1)
+
+        async def boadicea() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", breaker=breaker)
+            return await canrisk.boadicea("fakepedigreedata")
+
+        with respx.mock:
+            call = respx.post("https://www.canrisk.org/boadicea/").mock(
+                side_effect=httpx.ConnectTimeout("timed out")
+            )
+
+            with raises(httpx.ConnectTimeout):
+                asyncio.run(boadicea())
+            with raises(CircuitOpenError):
+                asyncio.run(boadicea())
+            assert call.call_count == 1
+
+    def test_cancelled_trial(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        async def respond(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"test": "TEST"})
+
+        async def cancelled() -> None:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", breaker=breaker)
+            with raises(asyncio.TimeoutError):
+                await asyncio.wait_for(canrisk.boadicea("fakepedigreedata"), 0.05)
+            await canrisk.aclose()
+
+        async def boadicea() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", breaker=breaker)
+            return await canrisk.boadicea("fakepedigreedata")
+
+        with respx.mock:
+            call = respx.post("https://www.canrisk.org/boadicea/").mock(side_effect=respond)
+            asyncio.run(cancelled())
+
+            # the trial was given up on, so another can be made
+            assert breaker.state == CircuitState.OPEN
+            call.mock(return_value=httpx.Response(200, json={"test": "TEST"}))
+            assert asyncio.run(boadicea()) == {"test": "TEST"}
+            assert breaker.state == CircuitState.CLOSED
+
+    def test_limiter(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=2)
+        limiter = OutboundLimiter("test", concurrency=concurrency, queue_timeout=0.05)
+
+        async def boadicea() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", limiter=limiter)
+            return await canrisk.boadicea("fakepedigreedata")
+
+        with respx.mock:
+            call = respx.post("https://www.canrisk.org/boadicea/").mock(
+                side_effect=[httpx.Response(503, json={}), httpx.Response(200, json={"a": 1})]
+            )
+            with raises(CanRiskAPIError, match="Service Unavailable"):
+                asyncio.run(boadicea())
+            assert concurrency.limit == 1
+
+            generation = concurrency.acquire()
+            assert generation is not None
+            with raises(RateLimitedError):
+                asyncio.run(boadicea())
+            concurrency.release(generation, None)
+
+            assert asyncio.run(boadicea()) == {"a": 1}
+            assert call.call_count == 2
+            assert concurrency.in_flight == 0
+
+    def test_hedging(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        COUNTERS.reset()
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=2, maximum=2)
+        limiter = OutboundLimiter("test", concurrency=concurrency)
+        hedger = Hedger("canrisk", budget=1.0, min_delay=0.05, min_samples=1)
+        hedger.record(0.01)
+        calls = []
+
+        async def respond(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return httpx.Response(200, json={"call": len(calls)})
+
+        async def boadicea() -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", limiter=limiter, hedger=hedger)
+            result = await canrisk.boadicea("fakepedigreedata")
+            await canrisk.aclose()
+            return result
+
+        with respx.mock:
+            respx.post("https://www.canrisk.org/boadicea/").mock(side_effect=respond)
+
+            start = time.monotonic()
+            assert asyncio.run(boadicea()) == {"call": 2}
+            assert time.monotonic() - start < 1
+            assert COUNTERS.get("canrisk.hedge.won") == 1
+            # the slow call was cancelled, giving back its slot
+            assert concurrency.in_flight == 0
+
+    def test_cancelled_while_getting_hedge_permit(self) -> None:
+        settings.CANRISK_API_TOKEN = "abc"
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=2, maximum=2)
+        limiter = OutboundLimiter("test", concurrency=concurrency)
+        hedger = Hedger("canrisk", budget=1.0, min_samples=1)
+        hedger.record(0.0)
+
+        def slow_hedge_permit(limiter: OutboundLimiter, hedger: Hedger) -> Optional[Permit]:
+            time.sleep(0.2)
+            return limiter.try_acquire()
+
+        async def respond(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"test": "TEST"})
+
+        async def cancelled() -> None:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", limiter=limiter, hedger=hedger)
+            with raises(asyncio.TimeoutError):
+                await asyncio.wait_for(canrisk.boadicea("fakepedigreedata"), 0.1)
+            await canrisk.aclose()
+
+        with patch("premeno.risk_api.canrisk.api._hedge_permit", slow_hedge_permit):
+            with respx.mock:
+                respx.post("https://www.canrisk.org/boadicea/").mock(side_effect=respond)
+                asyncio.run(cancelled())
+
+        # the permit that came too late is given back
+        assert concurrency.in_flight == 0
+
+    def test_client_per_event_loop(self) -> None:
+        async def clients() -> tuple[AsyncCanRiskAPI, AsyncCanRiskAPI, AsyncCanRiskAPI]:
+            return (
+                get_async_canrisk_api(),
+                get_async_canrisk_api(),
+                get_async_canrisk_api("http://localhost:8001"),
+            )
+
+        first, same, other_url = asyncio.run(clients())
+        assert first is same
+        assert other_url is not first
+        assert other_url.base_url == "http://localhost:8001"
+        assert asyncio.run(clients())[0] is not first
@@ -0,0 +1,85 @@
+from premeno.risk_api.canrisk.breaker import CircuitBreaker, CircuitState
+from premeno.risk_api.metrics import COUNTERS
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestCircuitBreaker:
+    def setup_method(self) -> None:
+        COUNTERS.reset()
+
+    def test_opens_after_failures_in_a_row(self) -> None:
+        breaker = CircuitBreaker("test", failure_threshold=3, clock=FakeClock())
+
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.allow()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow()
+        assert COUNTERS.get("test.breaker.opened") == 1
+        assert COUNTERS.get("test.breaker.rejected") == 1
+
+    def test_trial_call_after_reset_timeout(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 29
+        assert not breaker.allow()
+
+        # only one call is let through to see if it's back
+        clock.now = 30
+        assert breaker.allow()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.allow()
+
+    def test_failed_trial_opens_again(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        breaker.record_failure()
+
+        clock.now = 30
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+
+        clock.now = 59
+        assert not breaker.allow()
+        clock.now = 60
+        assert breaker.allow()
+        assert COUNTERS.get("test.breaker.opened") == 2
+
+    def test_abandoned_trial(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 30
+        assert breaker.allow()
+        # given up on, so another trial can be made straight away
+        breaker.record_abandoned()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.allow()
+        assert breaker.state == CircuitState.HALF_OPEN
+
+        # says nothing when closed
+        breaker.record_success()
+        breaker.record_abandoned()
+        assert breaker.state == CircuitState.CLOSED
@@ -0,0 +1,383 @@
+import asyncio
+import threading
+import time
+from dataclasses import replace
+from datetime import date
+from unittest.mock import patch
+
+from django.core.cache import caches
+from pytest import approx, raises
+
+from premeno.risk_api.canrisk.api import CancerRateSource, CanRiskAPIError
+from premeno.risk_api.canrisk.cache import (
+    RESULT_CACHE_VERSION,
+    _fetch_once,
+    _fetch_once_async,
+    _record_failure,
+    cache_rates,
+    get_cached_rates,
+    get_or_fetch_rates,
+    get_or_fetch_rates_async,
+    pack_rates,
+    result_cache_keys,
+    unpack_rates,
+)
+from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.metrics import COUNTERS
+from premeno.risk_api.questionnaire import Questionnaire
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [52],
+}
+
+STATUSES = (MhtStatus.Never, MhtStatus.Oestrogen, MhtStatus.Combined)
+
+RATES = {"age": [50, 51], "baseline": [0.25, 0.5], "individual": [0.5, 0.75]}
+
+
+def canrisk_file(**changes):
+    return create_canrisk_file(Questionnaire(**dict(QUESTIONNAIRE, **changes)), MhtStatus.Never)
+
+
+class TestResultCache:
+    def setup_method(self) -> None:
+        caches["default"].clear()
+        COUNTERS.reset()
+
+    def test_keys(self) -> None:
+        keys = result_cache_keys(canrisk_file(), STATUSES)
+
+        assert len(set(keys.values())) == 3
+        assert all(key.startswith("canrisk:") for key in keys.values())
+        assert result_cache_keys(canrisk_file(), STATUSES) == keys
+
+        # same woman, whatever MHT the file was written for or the questionnaire says
+        mht_file = canrisk_file(mht="e+p")
+        mht_file = replace(
+            mht_file, risk_factors=replace(mht_file.risk_factors, mht_use=MhtStatus.Combined)
+        )
+        assert result_cache_keys(mht_file, STATUSES) == keys
+
+        # things that aren't sent to CanRisk don't matter
+        assert result_cache_keys(canrisk_file(smoking="current"), STATUSES) == keys
+
+        assert result_cache_keys(canrisk_file(height="170"), STATUSES) != keys
+        assert result_cache_keys(canrisk_file(sisters_ages_at_diagnosis=[]), STATUSES) != keys
+
+    @patch("premeno.risk_api.canrisk.pedigree.date")
+    def test_keys_ignore_todays_date(self, mock_date) -> None:
+        """The mother's year of birth is worked out from today's date"""
+        mock_date.today.return_value = date(2030, 1, 1)
+        file = canrisk_file()
+        keys = result_cache_keys(file, STATUSES)
+
+        mock_date.today.return_value = date(2031, 6, 1)
+        next_year = canrisk_file()
+        assert str(next_year) != str(file)
+        assert result_cache_keys(next_year, STATUSES) == keys
+
+    def test_keys_include_sources(self) -> None:
+        keys = result_cache_keys(canrisk_file(), STATUSES)
+        assert result_cache_keys(canrisk_file(), STATUSES, CancerRateSource.UK) == keys
+
+    def test_get_and_set(self) -> None:
+        rates = {"age": [50, 51], "baseline": [0.05, 0.1], "individual": [0.1, 0.2]}
+
+        assert get_cached_rates("canrisk:test") is None
+        cache_rates("canrisk:test", rates)
+        cached = get_cached_rates("canrisk:test")
+        assert cached == {key: approx(values, rel=1e-7) for key, values in rates.items()}
+
+        assert COUNTERS.get("canrisk.result_cache.misses") == 1
+        assert COUNTERS.get("canrisk.result_cache.hits") == 1
+
+    def test_versioned(self) -> None:
+        rates = {"age": [50], "baseline": [0.5], "individual": [0.25]}
+        cache_rates("canrisk:test", rates)
+
+        cache = caches["default"]
+        assert cache.get("canrisk:test", version=RESULT_CACHE_VERSION) == pack_rates(rates)
+        assert cache.get("canrisk:test", version=RESULT_CACHE_VERSION + 1) is None
+
+    def test_unpackable_rates_not_cached(self) -> None:
+        cache_rates("canrisk:test", {"age": [300], "baseline": [0.5], "individual": [0.25]})
+        assert get_cached_rates("canrisk:test") is None
+
+
+def failing_fetch() -> dict:
+    raise ZeroDivisionError("BIG OL EXCEPTION")
+
+
+async def failing_fetch_async() -> dict:
+    return failing_fetch()
+
+
+class TestSingleFlight:
+    def setup_method(self) -> None:
+        caches["default"].clear()
+        COUNTERS.reset()
+
+    def wait_for_counter(self, name: str, value: int) -> None:
+        deadline = time.monotonic() + 5
+        while COUNTERS.get(name) < value and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_fetches_and_caches(self) -> None:
+        assert get_or_fetch_rates("canrisk:test", lambda: RATES) == RATES
+        assert get_or_fetch_rates("canrisk:test", failing_fetch) == RATES
+        assert COUNTERS.get("canrisk.result_cache.hits") == 1
+
+    def test_threads_share_a_fetch(self) -> None:
+        release = threading.Event()
+        fetches = []
+
+        def fetch() -> dict:
+            fetches.append(1)
+            release.wait(5)
+            return RATES
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(get_or_fetch_rates("canrisk:test", fetch))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        self.wait_for_counter("canrisk.single_flight.shared", 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == [RATES] * 4
+        assert len(fetches) == 1
+
+    def test_threads_share_an_error(self) -> None:
+        release = threading.Event()
+
+        def fetch() -> dict:
+            release.wait(5)
+            raise ValueError("BIG OL EXCEPTION")
+
+        errors = []
+
+        def get() -> None:
+            try:
+                get_or_fetch_rates("canrisk:test", fetch)
+            except ValueError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=get) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_counter("canrisk.single_flight.shared", 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 3
+        assert get_cached_rates("canrisk:test") is None
+
+    @patch("premeno.risk_api.canrisk.cache.SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    def test_waits_for_another_worker(self) -> None:
+        cache = caches["default"]
+        lock = "canrisk:test:lock"
+        cache.add(lock, "other", version=RESULT_CACHE_VERSION)
+
+        def other_worker() -> None:
+            time.sleep(0.1)
+            cache_rates("canrisk:test", RATES)
+            cache.delete(lock, version=RESULT_CACHE_VERSION)
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        rates = get_or_fetch_rates("canrisk:test", failing_fetch)
+        thread.join()
+
+        assert rates == {key: approx(values) for key, values in RATES.items()}
+        assert COUNTERS.get("canrisk.single_flight.waited") == 1
+
+    @patch("premeno.risk_api.canrisk.cache.SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    def test_fetches_when_other_worker_gives_up(self) -> None:
+        cache = caches["default"]
+        cache.add("canrisk:test:lock", "other", version=RESULT_CACHE_VERSION)
+        threading.Timer(
+            0.1, lambda: cache.delete("canrisk:test:lock", version=RESULT_CACHE_VERSION)
+        ).start()
+
+        assert get_or_fetch_rates("canrisk:test", lambda: RATES) == RATES
+        assert get_cached_rates("canrisk:test") is not None
+
+    @patch("premeno.risk_api.canrisk.cache.SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    def test_waits_no_longer_than_timeout(self) -> None:
+        caches["default"].add("canrisk:test:lock", "other", version=RESULT_CACHE_VERSION)
+
+        start = time.monotonic()
+        with raises(CanRiskAPIError):
+            get_or_fetch_rates("canrisk:test", lambda: RATES, timeout=0.1)
+        with raises(CanRiskAPIError):
+            asyncio.run(get_or_fetch_rates_async("canrisk:test", failing_fetch_async, timeout=0.1))
+        assert time.monotonic() - start < 1
+        assert COUNTERS.get("canrisk.single_flight.timed_out") == 2
+
+    @patch("premeno.risk_api.canrisk.cache.SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    def test_one_worker_takes_over(self) -> None:
+        cache = caches["default"]
+        cache.add("canrisk:test:lock", "other", version=RESULT_CACHE_VERSION)
+        fetches = []
+
+        def fetch() -> dict:
+            fetches.append(1)
+            time.sleep(0.1)
+            return RATES
+
+        # workers waiting for one that gives up without a word (as if it died)
+        results = []
+        workers = [
+            threading.Thread(target=lambda: results.append(_fetch_once("canrisk:test", fetch, 5)))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.05)
+        cache.delete("canrisk:test:lock", version=RESULT_CACHE_VERSION)
+        for worker in workers:
+            worker.join()
+
+        # only one of them fetches, and the others wait for it again
+        assert len(fetches) == 1
+        assert len(results) == 3
+
+    @patch("premeno.risk_api.canrisk.cache.SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    def test_waiters_share_another_workers_error(self) -> None:
+        cache = caches["default"]
+        cache.add("canrisk:test:lock", "other", version=RESULT_CACHE_VERSION)
+        fetches = []
+
+        def fetch() -> dict:
+            fetches.append(1)
+            return RATES
+
+        errors = []
+
+        def wait() -> None:
+            try:
+                _fetch_once("canrisk:test", fetch, 5)
+            except CanRiskAPIError as err:
+                errors.append(err)
+
+        async def wait_async() -> None:
+            with raises(CanRiskAPIError):
+                await _fetch_once_async("canrisk:test", failing_fetch_async, 5)
+
+        workers = [threading.Thread(target=wait) for _ in range(3)]
+        workers.append(threading.Thread(target=lambda: asyncio.run(wait_async())))
+        for worker in workers:
+            worker.start()
+        time.sleep(0.05)
+        # the other worker's fetch fails
+        _record_failure("canrisk:test", "other", CanRiskAPIError("BIG OL EXCEPTION"))
+        cache.delete("canrisk:test:lock", version=RESULT_CACHE_VERSION)
+        for worker in workers:
+            worker.join()
+
+        # they all raise its error at once, rather than trying again in turn
+        assert len(errors) == 3
+        assert "BIG OL EXCEPTION" in str(errors[0])
+        assert fetches == []
+        assert COUNTERS.get("canrisk.single_flight.failed_elsewhere") == 4
+
+    def test_failure_recorded(self) -> None:
+        with raises(ZeroDivisionError):
+            get_or_fetch_rates("canrisk:test", failing_fetch)
+
+        failed = caches["default"].get("canrisk:test:failed", version=RESULT_CACHE_VERSION)
+        assert failed is not None and "BIG OL EXCEPTION" in failed[1]
+
+    def test_lock_released(self) -> None:
+        get_or_fetch_rates("canrisk:test", lambda: RATES)
+        with raises(ZeroDivisionError):
+            get_or_fetch_rates("canrisk:other", failing_fetch)
+
+        cache = caches["default"]
+        assert cache.get("canrisk:test:lock", version=RESULT_CACHE_VERSION) is None
+        assert cache.get("canrisk:other:lock", version=RESULT_CACHE_VERSION) is None
+
+    def test_tasks_share_a_fetch(self) -> None:
+        fetches = []
+
+        async def fetch() -> dict:
+            fetches.append(1)
+            await asyncio.sleep(0.05)
+            return RATES
+
+        async def get_all() -> list:
+            return await asyncio.gather(
+                *(get_or_fetch_rates_async("canrisk:test", fetch) for _ in range(4))
+            )
+
+        assert asyncio.run(get_all()) == [RATES] * 4
+        assert len(fetches) == 1
+        assert COUNTERS.get("canrisk.single_flight.shared") == 3
+        assert get_cached_rates("canrisk:test") is not None
+
+    def test_cancelled_task_doesnt_cancel_fetch(self) -> None:
+        async def fetch() -> dict:
+            await asyncio.sleep(0.1)
+            return RATES
+
+        async def get_both() -> dict:
+            impatient = asyncio.ensure_future(get_or_fetch_rates_async("canrisk:test", fetch))
+            patient = asyncio.ensure_future(get_or_fetch_rates_async("canrisk:test", fetch))
+            await asyncio.sleep(0.02)
+            impatient.cancel()
+            return await patient
+
+        assert asyncio.run(get_both()) == RATES
+
+
+class TestPackRates:
+    def test_round_trip(self) -> None:
+        ages = list(range(47, 81))
+        rates: dict[str, list] = {
+            "age": ages,
+            "baseline": [(age - 47) / 100 for age in ages],
+            "individual": [(age - 47) / 80 for age in ages],
+        }
+
+        packed = pack_rates(rates)
+        assert isinstance(packed, bytes)
+        assert len(packed) == 2 + 9 * len(rates["age"])
+
+        unpacked = unpack_rates(packed)
+        assert unpacked["age"] == rates["age"]
+        assert unpacked["baseline"] == approx(rates["baseline"], rel=1e-7)
+        assert unpacked["individual"] == approx(rates["individual"], rel=1e-7)
+
+    def test_empty(self) -> None:
+        rates: dict[str, list] = {"age": [], "baseline": [], "individual": []}
+        assert unpack_rates(pack_rates(rates)) == rates
+
+    def test_bad_rates(self) -> None:
+        with raises(ValueError):
+            pack_rates({"age": [50, 51], "baseline": [0.1], "individual": [0.1, 0.2]})
+
+        with raises(ValueError):
+            pack_rates({"age": [-1], "baseline": [0.1], "individual": [0.1]})
@@ -52,6 +52,20 @@ class TestCanRiskFile:
             f"{pedigree_file}"
         )
 
+    def test_mht_variants(self) -> None:
+        rf = RiskFactors(13, 1, 26, OralContraceptiveData(5), MhtStatus.Never, 170, 21.4, 80, 56)
+        file = CanRiskFile(rf, [self.TEST_PEDIGREE, self.TEST_MOTHER, self.TEST_FATHER])
+        variants = file.mht_variants([MhtStatus.Never, MhtStatus.Oestrogen, MhtStatus.Combined])
+
+        assert list(variants) == [MhtStatus.Never, MhtStatus.Oestrogen, MhtStatus.Combined]
+        for mht_status, contents in variants.items():
+            rf_mht = RiskFactors(
+                13, 1, 26, OralContraceptiveData(5), mht_status, 170, 21.4, 80, 56
+            )
+            assert contents == str(CanRiskFile(rf_mht, file.pedigrees))
+
+        assert file.risk_factors.mht_use == MhtStatus.Never
+
     def test_create_canrisk_file(self) -> None:
         data = {
             "date_of_birth": "1960-08-20T16:48:50.823Z",
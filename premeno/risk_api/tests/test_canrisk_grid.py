@@ -0,0 +1,293 @@
+import json
+import math
+import os
+from datetime import date
+from io import StringIO
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from pytest import approx, raises
+
+from premeno.risk_api.canrisk.api import reset_canrisk_clients
+from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.grid import (
+    DEFAULT_AXES,
+    GRID_MHT_STATUSES,
+    CanRiskGrid,
+    grid_brackets,
+    grid_canrisk_file,
+    grid_point,
+    grid_points,
+    open_grid,
+)
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+from premeno.risk_api.canrisk.surrogate import MAX_HORIZON
+from premeno.risk_api.management.commands.build_canrisk_grid import grid_coverage
+from premeno.risk_api.questionnaire import Questionnaire
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "170",
+    "weight": "78.03",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "14",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "13",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "65",
+    "sisters_ages_at_diagnosis": [],
+}
+
+AXES: dict[str, list] = {
+    "age": [40, 50],
+    "age_at_menarche": [11, 15],
+    "age_at_first_child": [None, 20, 30],
+    "oral_contraception": [0, 1],
+    "height": [160],
+    "bmi": [20, 30],
+    "alcohol_grams": [0],
+    "mother_age_at_diagnosis": [None, 45],
+    "sister_age_at_diagnosis": [None],
+}
+
+POINT: dict = {
+    "age": 40,
+    "age_at_menarche": 11,
+    "age_at_first_child": 20,
+    "oral_contraception": 0,
+    "height": 160,
+    "bmi": 20,
+    "alcohol_grams": 0,
+    "mother_age_at_diagnosis": None,
+    "sister_age_at_diagnosis": None,
+}
+
+
+def known_risks(point: dict) -> np.ndarray:
+    """Risks that are linear in each input, so are interpolated exactly"""
+    risk = (
+        0.01
+        + 0.001 * (point["age"] - 40)
+        + 0.0005 * (point["age_at_menarche"] - 11)
+        + (0.0 if point["age_at_first_child"] is None else 0.0002 * point["age_at_first_child"])
+        + 0.002 * (point["bmi"] - 20)
+        + (0.0 if point["mother_age_at_diagnosis"] is None else 0.02)
+    )
+    horizons = np.arange(1, MAX_HORIZON + 1)
+    return np.array([risk * scale * horizons for scale in (1.0, 1.1, 1.25)])
+
+
+def make_grid(path: str) -> CanRiskGrid:
+    grid = CanRiskGrid.create(path, AXES)
+    indexes = np.ndindex(*(len(values) for values in AXES.values()))
+    for index, point in zip(indexes, grid_points(AXES)):
+        for mht_status, risks in zip(GRID_MHT_STATUSES, known_risks(point)):
+            grid.set_risks(index, mht_status, risks)
+    grid.flush()
+    return grid
+
+
+class TestCanRiskGrid:
+    def test_grid_point(self) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        point = grid_point(data)
+
+        assert set(point) == set(DEFAULT_AXES)
+        assert point["bmi"] == 27.0 and point["alcohol_grams"] == 16
+        assert point["sister_age_at_diagnosis"] is None
+
+        with raises(ValueError):
+            grid_point(Questionnaire(**dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=[40, 50])))
+
+    def test_grid_canrisk_file(self) -> None:
+        variants: list[dict] = [{}, {"nulliparous": True, "age_at_first_child": ""}]
+        for changes in variants:
+            data = Questionnaire(**dict(QUESTIONNAIRE, **changes))
+            today = date(data.year_of_birth + int(data.age), 6, 1)
+
+            # the same file as for the questionnaire, for a point on the grid
+            assert str(grid_canrisk_file(grid_point(data), today)) == str(
+                create_canrisk_file(data, MhtStatus.Never)
+            )
+
+    def test_interpolate(self, tmp_path) -> None:
+        make_grid(str(tmp_path / "grid"))
+        grid = CanRiskGrid.open(str(tmp_path / "grid"))
+
+        assert grid.interpolate(POINT) == approx(known_risks(POINT))
+
+        between = dict(POINT, age=43, age_at_menarche=14, age_at_first_child=27, bmi=24.5)
+        between["mother_age_at_diagnosis"] = 45
+        interpolated = grid.interpolate(between)
+        assert interpolated == approx(known_risks(between), rel=1e-5)
+        assert grid.risk(interpolated, MhtStatus.Combined, 5) == approx(
+            known_risks(between)[2, 4], rel=1e-5
+        )
+
+    def test_off_grid(self, tmp_path) -> None:
+        grid = make_grid(str(tmp_path / "grid"))
+
+        with raises(ValueError):
+            grid.interpolate(dict(POINT, age=55))
+        with raises(ValueError):
+            grid.interpolate(dict(POINT, alcohol_grams=None))
+        with raises(ValueError):
+            grid.interpolate(dict(POINT, sister_age_at_diagnosis=45))
+        with raises(ValueError):
+            grid.risk(grid.interpolate(POINT), MhtStatus.Never, MAX_HORIZON + 1)
+
+    def test_clamped(self, tmp_path) -> None:
+        grid = make_grid(str(tmp_path / "grid"))
+
+        # taken to the nearest edge
+        beyond = dict(POINT, height=185, bmi=41.5, age_at_menarche=9, mother_age_at_diagnosis=70)
+        edges = dict(POINT, height=160, bmi=30, age_at_menarche=11, mother_age_at_diagnosis=45)
+        assert grid.interpolate(beyond) == approx(known_risks(edges), rel=1e-5)
+
+        with raises(ValueError):
+            grid_brackets(AXES, beyond, clamp=False)
+
+    def test_missing_risks(self, tmp_path) -> None:
+        grid = CanRiskGrid.create(str(tmp_path / "grid"), AXES)
+        index = [values.index(POINT[name]) for name, values in AXES.items()]
+        grid.set_risks(index, MhtStatus.Never, known_risks(POINT)[0])
+
+        assert grid.missing() == math.prod(CanRiskGrid.shape(AXES)[:-1]) - 1
+        assert grid.risk(grid.interpolate(POINT), MhtStatus.Never, 5) == approx(
+            known_risks(POINT)[0, 4]
+        )
+        with raises(ValueError):
+            grid.risk(grid.interpolate(POINT), MhtStatus.Oestrogen, 5)
+
+    def test_open_errors(self, tmp_path) -> None:
+        with raises(ValueError):
+            CanRiskGrid.open(str(tmp_path / "missing"))
+
+        (tmp_path / "other").write_bytes(b"not a grid")
+        with raises(ValueError):
+            CanRiskGrid.open(str(tmp_path / "other"))
+
+    def test_open_grid_replaced(self, tmp_path) -> None:
+        path = str(tmp_path / "grid")
+        make_grid(path)
+        grid = open_grid(path)
+        assert open_grid(path) is grid
+
+        # a new grid, written elsewhere and moved into place
+        CanRiskGrid.create(str(tmp_path / "new"), AXES).flush()
+        os.replace(tmp_path / "new", path)
+        replaced = open_grid(path)
+        assert replaced is not grid
+        assert replaced.missing() == math.prod(CanRiskGrid.shape(AXES)[:-1])
+
+        with raises(ValueError):
+            open_grid(str(tmp_path / "missing"))
+
+    def test_read_only(self, tmp_path) -> None:
+        make_grid(str(tmp_path / "grid"))
+        grid = CanRiskGrid.open(str(tmp_path / "grid"))
+
+        with raises(ValueError):
+            grid.risks[0] = 1.0
+
+
+class TestGridCoverage:
+    def test_grid_coverage(self) -> None:
+        axes = dict(
+            AXES,
+            age=[40, 55],
+            height=[160, 175],
+            alcohol_grams=[0, 20],
+            mother_age_at_diagnosis=[None, 45, 70],
+            sister_age_at_diagnosis=[None, 45],
+        )
+        profiles = [
+            QUESTIONNAIRE,
+            dict(QUESTIONNAIRE, height="190"),
+            dict(QUESTIONNAIRE, date_of_birth="1960-08-20T16:48:50.823Z"),
+            dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=[40, 50]),
+            dict(QUESTIONNAIRE, height="20"),
+        ]
+
+        assert grid_coverage(axes, iter(profiles)) == {
+            "on": 1,
+            "clamped": 1,
+            "off": 2,
+            "invalid": 1,
+        }
+
+
+def build(*args) -> str:
+    stdout = StringIO()
+    call_command("build_canrisk_grid", *map(str, args), stdout=stdout)
+    return stdout.getvalue()
+
+
+class TestBuildCanRiskGrid:
+    tmp_cache: bool
+    tmp_token: str
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_cache = settings.CANRISK_API_CACHE
+        cls.tmp_token = settings.CANRISK_API_TOKEN
+        settings.CANRISK_API_CACHE = False
+        settings.CANRISK_API_TOKEN = StubConfig().token
+
+    @classmethod
+    def teardown_class(cls):
+        settings.CANRISK_API_CACHE = cls.tmp_cache
+        settings.CANRISK_API_TOKEN = cls.tmp_token
+        reset_canrisk_clients()
+
+    def setup_method(self) -> None:
+        caches[settings.CANRISK_RESULT_CACHE].clear()
+
+    def test_build(self, tmp_path) -> None:
+        axes = dict(AXES, age_at_menarche=[13], oral_contraception=[1], bmi=[25])
+        (tmp_path / "axes.json").write_text(json.dumps(axes))
+        output = tmp_path / "canrisk.grid"
+
+        with running_stub_server(StubConfig()) as base_url:
+            args = ("--axes", tmp_path / "axes.json", "--canrisk", base_url, "--rate", 1000)
+            report = build(output, *args, "--dry-run")
+            assert "12 points, 36 CanRisk requests (36 not cached)" in report
+            # the built-in profiles are 164cm, so only on the grid taken to its 160cm, and
+            # some are older than its 50
+            assert "0.0% on the grid" in report
+            assert "% off it" in report and "0.0% off it" not in report
+            assert not output.exists()
+
+            report = build(output, *args)
+            assert "Fetched 36" in report
+            assert f"Saved {output}" in report
+
+            report = build(output, *args)
+            assert "(0 not cached)" in report
+
+        grid = CanRiskGrid.open(str(output))
+        point = dict(POINT, age=47, age_at_menarche=13, oral_contraception=1, bmi=25)
+        # the stub's risks don't depend on the age, only how far on
+        assert grid.risk(grid.interpolate(point), MhtStatus.Never, 10) == approx(0.03)
+        assert grid.risk(grid.interpolate(point), MhtStatus.Combined, 10) == approx(0.0375)
+
+    def test_bad_axes(self, tmp_path) -> None:
+        for axes in (
+            {"age": [40]},
+            dict(AXES, age=[50, 40]),
+            dict(AXES, height=[None, 160]),
+            dict(AXES, bmi=[]),
+        ):
+            (tmp_path / "axes.json").write_text(json.dumps(axes))
+            with raises(CommandError):
+                build(tmp_path / "canrisk.grid", "--axes", tmp_path / "axes.json", "--dry-run")
@@ -0,0 +1,77 @@
+from pytest import approx, raises
+
+from premeno.risk_api.canrisk.hedge import HEDGE_BUDGET_BURST, Hedger
+from premeno.risk_api.metrics import COUNTERS
+
+
+class TestHedger:
+    def test_bad_settings(self) -> None:
+        with raises(ValueError):
+            Hedger("test", percentile=0)
+        with raises(ValueError):
+            Hedger("test", percentile=101)
+        with raises(ValueError):
+            Hedger("test", budget=1.5)
+
+    def test_delay(self) -> None:
+        hedger = Hedger("test", percentile=90, min_samples=10)
+        for latency in range(1, 10):
+            hedger.record(latency / 100)
+        # not enough to go on yet
+        assert hedger.delay() is None
+
+        hedger.record(0.1)
+        assert hedger.delay() == approx(0.09)
+
+        hedger = Hedger("test", percentile=100, min_delay=0.5, min_samples=10)
+        for latency in range(1, 11):
+            hedger.record(latency / 100)
+        assert hedger.delay() == 0.5
+
+    def test_window(self) -> None:
+        hedger = Hedger("test", percentile=50, window=4, min_samples=4)
+        for latency in (5.0, 5.0, 5.0, 5.0, 1.0, 1.0, 1.0):
+            hedger.record(latency)
+
+        # only the latest four count
+        assert hedger.delay() == 1.0
+
+    def test_budget(self) -> None:
+        COUNTERS.reset()
+        hedger = Hedger("test", budget=0.25)
+
+        # each call earns a quarter of a hedge
+        for _ in range(3):
+            hedger.delay()
+        assert not hedger.try_spend()
+        hedger.delay()
+        assert hedger.try_spend()
+        assert not hedger.try_spend()
+        assert COUNTERS.get("test.hedge.over_budget") == 2
+
+    def test_budget_burst(self) -> None:
+        hedger = Hedger("test", budget=1.0)
+        for _ in range(100):
+            hedger.delay()
+
+        spent = 0
+        while hedger.try_spend():
+            spent += 1
+        assert spent == HEDGE_BUDGET_BURST
+
+    def test_refund(self) -> None:
+        hedger = Hedger("test", budget=0.5)
+        hedger.delay()
+        hedger.delay()
+        assert hedger.try_spend()
+
+        hedger.refund()
+        assert hedger.try_spend()
+        assert not hedger.try_spend()
+
+    def test_no_budget(self) -> None:
+        hedger = Hedger("test", budget=0.0)
+        for _ in range(100):
+            hedger.delay()
+
+        assert not hedger.try_spend()
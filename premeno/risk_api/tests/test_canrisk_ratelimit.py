@@ -0,0 +1,253 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+from pytest import approx, raises
+from redis.exceptions import ConnectionError
+
+from premeno.risk_api.canrisk.ratelimit import (
+    TOKEN_BUCKET_SCRIPT,
+    AdaptiveConcurrencyLimit,
+    OutboundLimiter,
+    Permit,
+    RateLimiter,
+    RedisTokenBucket,
+)
+from premeno.risk_api.metrics import COUNTERS
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+
+
+def slot(limit: AdaptiveConcurrencyLimit) -> int:
+    generation = limit.acquire()
+    assert generation is not None
+    return generation
+
+
+def permit_from(limiter: OutboundLimiter) -> Permit:
+    permit = limiter.acquire()
+    assert permit is not None
+    return permit
+
+
+class TestRateLimiter:
+    def test_spaces_out_calls(self) -> None:
+        clock = FakeClock()
+        limiter = RateLimiter(2.0, clock=clock, sleep=clock.sleep)
+
+        assert limiter.acquire() == 0.0
+        assert limiter.acquire() == approx(0.5)
+        # queued behind the last one
+        assert limiter.acquire() == approx(1.0)
+        assert clock.slept == [approx(0.5), approx(1.0)]
+
+        clock.now = 10.0
+        assert limiter.acquire() == 0.0
+
+    def test_burst(self) -> None:
+        clock = FakeClock()
+        limiter = RateLimiter(1.0, burst=3, clock=clock, sleep=clock.sleep)
+
+        assert [limiter.acquire() for _ in range(4)] == [0.0, 0.0, 0.0, approx(1.0)]
+
+        # refills no further than the burst
+        clock.now = 100.0
+        assert [limiter.acquire() for _ in range(4)] == [0.0, 0.0, 0.0, approx(1.0)]
+
+    def test_max_wait(self) -> None:
+        clock = FakeClock()
+        limiter = RateLimiter(2.0, clock=clock, sleep=clock.sleep)
+
+        assert limiter.acquire(max_wait=0.1) == 0.0
+        assert limiter.acquire(max_wait=0.1) is None
+        # nothing was taken by the call that gave up
+        assert limiter.reserve(max_wait=1.0) == approx(0.5)
+        assert clock.slept == []
+
+    def test_bad_config(self) -> None:
+        with raises(ValueError):
+            RateLimiter(0)
+
+        with raises(ValueError):
+            RateLimiter(1.0, burst=0)
+
+
+class TestRedisTokenBucket:
+    def test_reserve(self) -> None:
+        connection = MagicMock()
+        script = connection.register_script.return_value
+        bucket = RedisTokenBucket(connection, "bucket", 5.0, burst=2)
+        connection.register_script.assert_called_once_with(TOKEN_BUCKET_SCRIPT)
+
+        script.return_value = [1, b"0"]
+        assert bucket.reserve() == 0.0
+        assert script.call_args.kwargs == {"keys": ["bucket"], "args": [5.0, 2, -1]}
+
+        script.return_value = [1, b"0.25"]
+        assert bucket.reserve(1.0) == 0.25
+        assert script.call_args.kwargs["args"] == [5.0, 2, 1.0]
+
+        script.return_value = [0, b"2.5"]
+        assert bucket.reserve(1.0) is None
+
+    def test_lets_calls_through_without_redis(self) -> None:
+        COUNTERS.reset()
+        connection = MagicMock()
+        connection.register_script.return_value.side_effect = ConnectionError("no redis")
+
+        assert RedisTokenBucket(connection, "bucket", 5.0).reserve(1.0) == 0.0
+        assert COUNTERS.get("rate_limit.errors") == 1
+
+
+class TestAdaptiveConcurrencyLimit:
+    def test_additive_increase(self) -> None:
+        limit = AdaptiveConcurrencyLimit("test", minimum=1, maximum=4, target_latency=1.0)
+        limit._limit = 2.0
+
+        # about one more for each limit's worth of calls
+        for _ in range(3):
+            limit.release(slot(limit), 0.1)
+        assert limit.limit == 3
+
+        # no higher than the maximum
+        for _ in range(20):
+            limit.release(slot(limit), 0.1)
+        assert limit.limit == 4
+        assert limit.in_flight == 0
+
+    def test_multiplicative_decrease(self) -> None:
+        COUNTERS.reset()
+        limit = AdaptiveConcurrencyLimit("test", minimum=2, maximum=16, target_latency=1.0)
+        generations = [slot(limit) for _ in range(4)]
+
+        limit.release(generations[0], 0.1, ok=False)
+        assert limit.limit == 8
+        # already in flight when it was cut, so doesn't cut it again
+        limit.release(generations[1], 5.0)
+        limit.release(generations[2], 0.1, ok=False)
+        assert limit.limit == 8
+
+        # too slow
+        limit.release(slot(limit), 5.0)
+        assert limit.limit == 4
+        for _ in range(3):
+            limit.release(slot(limit), 5.0)
+        assert limit.limit == 2
+        assert COUNTERS.get("test.concurrency.decreased") == 3
+
+        # not made, so says nothing about the service
+        limit.release(generations[3], None, ok=False)
+        assert limit.limit == 2
+        assert limit.in_flight == 0
+
+    def test_waits_for_slot(self) -> None:
+        limit = AdaptiveConcurrencyLimit("test", minimum=1, maximum=1)
+        generation = limit.acquire()
+        assert limit.try_acquire() is None
+        assert limit.acquire(timeout=0.01) is None
+
+        threading.Timer(0.05, limit.release, (generation, None)).start()
+        assert limit.acquire(timeout=5) is not None
+
+    def test_bad_config(self) -> None:
+        with raises(ValueError):
+            AdaptiveConcurrencyLimit("test", minimum=3, maximum=2)
+
+        with raises(ValueError):
+            AdaptiveConcurrencyLimit("test", backoff=1.5)
+
+
+class TestOutboundLimiter:
+    def setup_method(self) -> None:
+        COUNTERS.reset()
+
+    def test_no_limits(self) -> None:
+        limiter = OutboundLimiter("test")
+        permit = limiter.acquire()
+        assert permit is not None
+        limiter.release(permit)
+        assert limiter.stats() == {}
+
+    def test_rejects_when_no_slot(self) -> None:
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=1)
+        limiter = OutboundLimiter("test", concurrency=concurrency, queue_timeout=0.01)
+
+        permit = permit_from(limiter)
+        assert limiter.stats() == {"concurrency_limit": 1, "in_flight": 1}
+        assert limiter.acquire() is None
+        assert asyncio.run(limiter.acquire_async()) is None
+        assert COUNTERS.get("test.limiter.rejected") == 2
+
+        limiter.release(permit)
+        assert limiter.stats() == {"concurrency_limit": 1, "in_flight": 0}
+        assert asyncio.run(limiter.acquire_async()) is not None
+
+    def test_rejects_when_no_token(self) -> None:
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=2)
+        tokens = RateLimiter(1.0)
+        limiter = OutboundLimiter("test", tokens, concurrency, queue_timeout=0.1)
+
+        limiter.release(permit_from(limiter))
+        assert limiter.acquire() is None
+        assert COUNTERS.get("test.limiter.rejected") == 1
+        # the slot it had is given back
+        assert concurrency.in_flight == 0
+
+    def test_try_acquire(self) -> None:
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=2, maximum=2)
+        limiter = OutboundLimiter("test", RateLimiter(1.0), concurrency)
+
+        permit = limiter.try_acquire()
+        assert permit is not None
+        # a slot's free, but there's no token, so doesn't wait for one
+        assert limiter.try_acquire() is None
+        assert concurrency.in_flight == 1
+        assert COUNTERS.get("test.limiter.rejected") == 0
+
+        limiter.release(permit)
+        concurrency.acquire()
+        concurrency.acquire()
+        assert OutboundLimiter("test", concurrency=concurrency).try_acquire() is None
+
+    def test_waits_for_token(self) -> None:
+        limiter = OutboundLimiter("test", RateLimiter(20.0), queue_timeout=1.0)
+
+        limiter.acquire()
+        assert limiter.acquire() is not None
+        assert asyncio.run(limiter.acquire_async()) is not None
+        assert COUNTERS.get("test.limiter.delayed") == 2
+
+    def test_cancelled_while_waiting_for_token(self) -> None:
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=2)
+        limiter = OutboundLimiter("test", RateLimiter(1.0), concurrency, queue_timeout=5.0)
+        limiter.release(permit_from(limiter))
+
+        async def cancelled() -> None:
+            task = asyncio.ensure_future(limiter.acquire_async())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled())
+        # the slot it had is given back
+        assert concurrency.in_flight == 0
+
+    def test_release_adapts_limit(self) -> None:
+        concurrency = AdaptiveConcurrencyLimit("test", minimum=1, maximum=8)
+        limiter = OutboundLimiter("test", concurrency=concurrency)
+
+        limiter.release(permit_from(limiter), ok=False)
+        assert concurrency.limit == 4
+        limiter.release(permit_from(limiter), ok=False, sent=False)
+        assert concurrency.limit == 4
@@ -0,0 +1,158 @@
+import asyncio
+import random
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from pytest import approx, raises
+
+from premeno.risk_api.canrisk.api import (
+    AsyncCanRiskAPI,
+    CanRiskAPI,
+    CanRiskAPIError,
+    get_canrisk_api,
+    reset_canrisk_clients,
+)
+from premeno.risk_api.canrisk.file import create_canrisk_file
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.stub import (
+    StubCanRiskServer,
+    StubConfig,
+    boadicea_response,
+    latency_distribution,
+    running_stub_server,
+)
+from premeno.risk_api.canrisk.utils import extract_cancer_rates
+from premeno.risk_api.questionnaire import Questionnaire
+from premeno.risk_api.risk import CanRiskCalc
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [],
+}
+
+
+class TestLatencyDistribution:
+    def test_distributions(self) -> None:
+        rng = random.Random(1)
+        assert latency_distribution("fixed:0.25", rng)() == 0.25
+        assert all(0.1 <= latency_distribution("uniform:0.1,0.2", rng)() <= 0.2 for _ in range(50))
+        assert all(latency_distribution("lognormal:0.2,0.5", rng)() > 0 for _ in range(50))
+        assert all(latency_distribution("pareto:0.1,1.5", rng)() >= 0.1 for _ in range(50))
+
+    def test_bad_specs(self) -> None:
+        for spec in ("normal:1,2", "fixed", "fixed:a", "uniform:0.1", "pareto:-1,2"):
+            with raises(ValueError):
+                latency_distribution(spec, random.Random())
+
+
+class TestStubServer:
+    tmp_cache: bool
+    tmp_token: str
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_cache = settings.CANRISK_API_CACHE
+        cls.tmp_token = settings.CANRISK_API_TOKEN
+        settings.CANRISK_API_CACHE = False
+        settings.CANRISK_API_TOKEN = ""
+
+    @classmethod
+    def teardown_class(cls):
+        settings.CANRISK_API_CACHE = cls.tmp_cache
+        settings.CANRISK_API_TOKEN = cls.tmp_token
+        reset_canrisk_clients()
+
+    def pedigree(self, mht_status: MhtStatus = MhtStatus.Never) -> str:
+        return str(create_canrisk_file(Questionnaire(**QUESTIONNAIRE), mht_status))
+
+    def test_boadicea(self) -> None:
+        with running_stub_server(StubConfig()) as base_url:
+            canrisk = CanRiskAPI("dv21", "password123", base_url)
+            assert canrisk.api_key == "stub-token"
+
+            never = extract_cancer_rates(canrisk.boadicea(self.pedigree()))
+            combined = extract_cancer_rates(canrisk.boadicea(self.pedigree(MhtStatus.Combined)))
+
+        age = int(Questionnaire(**QUESTIONNAIRE).age)
+        assert never["age"] == list(range(age + 1, 81))
+        assert never["baseline"] == combined["baseline"]
+        assert combined["individual"][-1] == approx(never["individual"][-1] * 1.25)
+        assert extract_cancer_rates(boadicea_response(age)) == never
+
+    def test_boadicea_rates(self) -> None:
+        async def boadicea_rates(base_url: str) -> dict:
+            canrisk = AsyncCanRiskAPI("dv21", "password123", base_url)
+            rates = await canrisk.boadicea_rates(self.pedigree())
+            await canrisk.aclose()
+            return rates
+
+        with running_stub_server(StubConfig()) as base_url:
+            canrisk = CanRiskAPI("dv21", "password123", base_url)
+            expected = extract_cancer_rates(canrisk.boadicea(self.pedigree()))
+            assert canrisk.boadicea_rates(self.pedigree()) == expected
+            assert canrisk.boadicea_rates(self.pedigree()) == expected
+            assert asyncio.run(boadicea_rates(base_url)) == expected
+
+        # the streamed responses were read to the end, so their connection was kept
+        assert canrisk.connection_stats()["connections"] == 1
+
+    def test_failures(self) -> None:
+        with running_stub_server(StubConfig(error_rate=1.0)) as base_url:
+            with raises(CanRiskAPIError, match="Service Unavailable"):
+                CanRiskAPI("dv21", "password123", base_url).boadicea(self.pedigree())
+
+        with running_stub_server(StubConfig(bad_request_rate=1.0)) as base_url:
+            with raises(CanRiskAPIError, match="Bad Request"):
+                CanRiskAPI("dv21", "password123", base_url).boadicea(self.pedigree())
+
+        with running_stub_server(StubConfig()) as base_url:
+            with raises(CanRiskAPIError, match="Bad Request"):
+                CanRiskAPI("dv21", "password123", base_url).boadicea("not a pedigree")
+
+    def test_rejects_other_tokens(self) -> None:
+        settings.CANRISK_API_TOKEN = "not-the-stubs"
+        try:
+            with running_stub_server(StubConfig()) as base_url:
+                with raises(CanRiskAPIError, match="Unauthorized"):
+                    CanRiskAPI("dv21", "password123", base_url).boadicea(self.pedigree())
+        finally:
+            settings.CANRISK_API_TOKEN = ""
+
+    def test_configured_url(self) -> None:
+        tmp = settings.CANRISK_API_URL
+        reset_canrisk_clients()
+        try:
+            with running_stub_server(StubConfig()) as base_url:
+                settings.CANRISK_API_URL = base_url
+                assert get_canrisk_api().base_url == base_url
+                assert CanRiskCalc().base_url == base_url
+
+                results = CanRiskCalc().predict(Questionnaire(**QUESTIONNAIRE), 5)
+                none, oestrogen, combined = results["none"], results["e"], results["e+p"]
+                assert none is not None and oestrogen is not None and combined is not None
+                assert none < oestrogen < combined
+        finally:
+            settings.CANRISK_API_URL = tmp
+            reset_canrisk_clients()
+
+    def test_bad_config(self) -> None:
+        with raises(ValueError):
+            StubCanRiskServer(StubConfig(error_rate=0.6, bad_request_rate=0.6))
+
+        with raises(CommandError):
+            call_command("canrisk_stub", "--latency", "normal:1,2")
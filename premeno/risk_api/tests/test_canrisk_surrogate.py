@@ -0,0 +1,208 @@
+import json
+from io import StringIO
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from pytest import approx, raises
+
+from premeno.risk_api.canrisk.api import reset_canrisk_clients
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+from premeno.risk_api.canrisk.surrogate import (
+    FEATURES,
+    MAX_HORIZON,
+    CanRiskSurrogate,
+    fit_and_evaluate,
+    horizon_risks,
+    surrogate_features,
+)
+from premeno.risk_api.management.commands.warm_canrisk_cache import DEFAULT_GRID, grid_profiles
+from premeno.risk_api.questionnaire import Questionnaire
+
+GRID = {
+    "base": DEFAULT_GRID["base"],
+    "vary": {
+        "age": [46, 50, 54],
+        "alcohol_use": [0, 14],
+        "children": DEFAULT_GRID["vary"]["children"],
+    },
+}
+
+
+def grid_features() -> np.ndarray:
+    rows: list[np.ndarray] = []
+    for profile in grid_profiles(DEFAULT_GRID):
+        data = Questionnaire(**profile)
+        rows.extend(surrogate_features(data, mht_status) for mht_status in MhtStatus)
+
+    return np.array(rows)
+
+
+def known_risks(features: np.ndarray) -> np.ndarray:
+    """Risks that are linear in the features on the complementary log-log scale"""
+    weights = np.linspace(-0.05, 0.05, len(FEATURES))
+    horizons = np.arange(1, MAX_HORIZON + 1)
+    values = np.log(horizons / 500)[None, :] + (features @ weights)[:, None] / 10
+    return -np.expm1(-np.exp(values))
+
+
+class TestCanRiskSurrogate:
+    def test_features(self) -> None:
+        data = Questionnaire(**next(grid_profiles(GRID)))
+
+        features = dict(zip(FEATURES, surrogate_features(data, MhtStatus.Combined)))
+        assert features["age"] == 46
+        assert features["parous"] == 1 and features["age_at_first_child"] == 28
+        assert features["mother_diagnosed"] == 0
+        assert features["mht_oestrogen"] == 0 and features["mht_combined"] == 1
+
+    def test_horizon_risks(self) -> None:
+        rates = {"age": [51, 52, 60], "baseline": [0, 0, 0], "individual": [0.01, 0.02, 0.1]}
+
+        risks = horizon_risks(rates, 50)
+        assert risks[:3] == approx([0.01, 0.02, 0.03])
+        assert risks[9] == approx(0.1)
+        assert np.isnan(risks[10:]).all()
+
+    def test_fit(self) -> None:
+        features = grid_features()
+        risks = known_risks(features)
+
+        surrogate = CanRiskSurrogate.fit(features, risks, ridge=1e-9)
+        assert surrogate.horizons == list(range(1, MAX_HORIZON + 1))
+        for row in (0, len(features) // 2, -1):
+            assert surrogate.predict(features[row], 10) == approx(risks[row, 9], rel=1e-6)
+
+    def test_unfitted_horizon(self) -> None:
+        features = grid_features()
+        risks = known_risks(features)
+        risks[:, 20:] = np.nan
+
+        surrogate = CanRiskSurrogate.fit(features, risks)
+        assert max(surrogate.horizons) == 20
+        with raises(ValueError):
+            surrogate.predict(features[0], 21)
+        with raises(ValueError):
+            surrogate.predict(features[0], 0)
+
+    def test_evaluate(self) -> None:
+        features = grid_features()
+        risks = known_risks(features)
+        surrogate = CanRiskSurrogate.fit(features, risks)
+
+        risks[:, 4] += 0.01
+        risks[:, 5] = np.nan
+        errors = surrogate.evaluate(features, risks)
+        assert errors["count"][4] == len(features)
+        assert errors["mean"][4] == approx(0.01, abs=1e-3)
+        assert errors["max"][4] >= errors["p95"][4] >= errors["mean"][4]
+        assert errors["count"][5] == 0 and np.isnan(errors["p95"][5])
+        assert surrogate.error_bound(5) == approx(errors["p95"][4])
+        assert surrogate.error_bound(6) is None
+        assert CanRiskSurrogate.fit(features, risks).error_bound(5) is None
+
+    def test_holdout(self) -> None:
+        features = grid_features()
+        groups = [str(i // len(MhtStatus)) for i in range(len(features))]
+
+        surrogate, fitted, held_out = fit_and_evaluate(
+            features, known_risks(features), groups, 0.25, seed=1
+        )
+        assert fitted + held_out == len(features)
+        # a woman's MHT statuses are all held out, or none are
+        assert held_out % len(MhtStatus) == 0
+        assert held_out == len(MhtStatus) * (len(set(groups)) // 4)
+        assert surrogate.errors["count"][0] == held_out
+
+    def test_save_load(self, tmp_path) -> None:
+        features = grid_features()
+        surrogate = CanRiskSurrogate.fit(features, known_risks(features))
+        surrogate.evaluate(features, known_risks(features))
+        path = str(tmp_path / "surrogate.npz")
+        surrogate.save(path)
+
+        loaded = CanRiskSurrogate.load(path)
+        assert loaded.predict(features[3], 7) == surrogate.predict(features[3], 7)
+        assert loaded.error_bound(7) == surrogate.error_bound(7)
+
+    def test_load_errors(self, tmp_path) -> None:
+        with raises(ValueError):
+            CanRiskSurrogate.load(str(tmp_path / "missing.npz"))
+
+        path = tmp_path / "other.npz"
+        with open(path, "wb") as stream:
+            np.savez(stream, version=0, features=np.array(FEATURES))
+        with raises(ValueError):
+            CanRiskSurrogate.load(str(path))
+
+
+def train(*args) -> str:
+    stdout = StringIO()
+    call_command("train_canrisk_surrogate", *map(str, args), stdout=stdout)
+    return stdout.getvalue()
+
+
+class TestTrainCanRiskSurrogate:
+    tmp_cache: bool
+    tmp_token: str
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_cache = settings.CANRISK_API_CACHE
+        cls.tmp_token = settings.CANRISK_API_TOKEN
+        settings.CANRISK_API_CACHE = False
+        settings.CANRISK_API_TOKEN = StubConfig().token
+
+    @classmethod
+    def teardown_class(cls):
+        settings.CANRISK_API_CACHE = cls.tmp_cache
+        settings.CANRISK_API_TOKEN = cls.tmp_token
+        reset_canrisk_clients()
+
+    def setup_method(self) -> None:
+        caches[settings.CANRISK_RESULT_CACHE].clear()
+
+    def test_train(self, tmp_path) -> None:
+        grid = self._grid(tmp_path)
+        with running_stub_server(StubConfig()) as base_url:
+            stdout = StringIO()
+            call_command(
+                "warm_canrisk_cache",
+                "--grid",
+                grid,
+                "--canrisk",
+                base_url,
+                "--rate",
+                "1000",
+                stdout=stdout,
+            )
+
+        output = tmp_path / "surrogate.npz"
+        report = train(output, "--grid", grid, "--holdout", 0.25)
+        # 3 ages (born in either of two years), 2 amounts of alcohol, with or without children
+        assert "Fitted to 54 of 72 cached CanRisk results for 72 requests" in report
+        assert "over 18 held out results" in report
+        assert "10 years: mean" in report
+
+        surrogate = CanRiskSurrogate.load(str(output))
+        # the stub's risks only depend on the age and MHT status, so are easily fitted
+        error_bound = surrogate.error_bound(10)
+        assert error_bound is not None and error_bound < 1e-3
+
+    def test_nothing_cached(self, tmp_path) -> None:
+        with raises(CommandError):
+            train(tmp_path / "surrogate.npz", "--grid", self._grid(tmp_path))
+
+        assert not (tmp_path / "surrogate.npz").exists()
+
+    def test_bad_options(self, tmp_path) -> None:
+        with raises(CommandError):
+            train(tmp_path / "surrogate.npz", "--holdout", 1)
+
+    def _grid(self, tmp_path) -> str:
+        path = tmp_path / "grid.json"
+        path.write_text(json.dumps(GRID))
+        return str(path)
@@ -1,6 +1,25 @@
+import asyncio
+import io
+import json
+
 import pytest
 
-from premeno.risk_api.canrisk.utils import extract_cancer_rates, header_line, interpolate_rate
+from premeno.risk_api.canrisk.stub import boadicea_response
+from premeno.risk_api.canrisk.utils import (
+    extract_cancer_rates,
+    extract_cancer_rates_async_stream,
+    extract_cancer_rates_stream,
+    header_line,
+    interpolate_rate,
+)
+
+
+class AsyncBody:
+    def __init__(self, body: bytes) -> None:
+        self.body = io.BytesIO(body)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.body.read(size)
 
 
 class TestCanRiskUtils:
@@ -27,6 +46,30 @@ class TestCanRiskUtils:
         assert rates["baseline"] == [0, 0.5, 1.0]
         assert rates["individual"] == [1.0, 0.2, 0.1]
 
+    def test_cancer_rates_stream(self) -> None:
+        boadicea = boadicea_response(46, "C")
+        body = json.dumps(boadicea).encode()
+        assert extract_cancer_rates_stream(io.BytesIO(body)) == extract_cancer_rates(boadicea)
+
+        rates = asyncio.run(extract_cancer_rates_async_stream(AsyncBody(body)))
+        assert rates == extract_cancer_rates(boadicea)
+
+    def test_cancer_rates_stream_first_family(self) -> None:
+        boadicea = {
+            "version": "2.0",
+            "pedigree_result": self.TEST_DATA["pedigree_result"]
+            + boadicea_response(46)["pedigree_result"],
+        }
+        rates = extract_cancer_rates_stream(io.BytesIO(json.dumps(boadicea).encode()))
+        assert rates == extract_cancer_rates(self.TEST_DATA)
+
+    def test_cancer_rates_stream_no_family(self) -> None:
+        with pytest.raises(ValueError, match="No pedigree result"):
+            extract_cancer_rates_stream(io.BytesIO(b'{"pedigree_result": []}'))
+
+        with pytest.raises(ValueError):
+            extract_cancer_rates_stream(io.BytesIO(b'{"pedigree_result": [{"cancer'))
+
     def test_interpolate_rates(self) -> None:
         assert interpolate_rate([52, 53, 54], [0.1, 0.2, 0.3], 52) == pytest.approx(0.1)
         assert interpolate_rate([52, 53, 54], [0.1, 0.2, 0.3], 54) == pytest.approx(0.3)
@@ -22,42 +22,67 @@ class TestGailFactors:
             GailFactors(130, 0, 0, 0, 0, 1, Race.WHITE)
 
         factors = GailFactors(40, 0, 0, 0, 0, 1, Race.WHITE)
-        factors.age = 40
+        assert factors.age == 40
 
     def test_number_of_biopsies(self) -> None:
         with raises(FactorError):
             assert GailFactors(40, 3, 0, 0, 0, 1, Race.WHITE) is None
 
         factors = GailFactors(40, 2, 0, 0, 0, 1, Race.WHITE)
-        factors.number_of_biopsies = 2
+        assert factors.number_of_biopsies == 2
 
     def test_age_at_menarche(self) -> None:
         with raises(FactorError):
             assert GailFactors(40, 0, 3, 0, 0, 1, Race.WHITE) is None
 
         factors = GailFactors(40, 2, 2, 0, 0, 1, Race.WHITE)
-        factors.age_at_menarche = 2
+        assert factors.age_at_menarche == 2
 
     def test_age_at_first_child(self) -> None:
         with raises(FactorError):
             assert GailFactors(40, 0, 0, 4, 0, 1, Race.WHITE) is None
 
         factors = GailFactors(40, 2, 2, 3, 0, 1, Race.WHITE)
-        factors.age_at_first_child = 3
+        assert factors.age_at_first_child == 3
 
     def test_number_of_relatives(self) -> None:
         with raises(FactorError):
             GailFactors(40, 0, 0, 0, 3, 1, Race.WHITE)
 
         factors = GailFactors(40, 2, 2, 3, 2, 1, Race.WHITE)
-        factors.number_of_relatives = 2
+        assert factors.number_of_relatives == 2
 
     def test_relative_risk_factor(self) -> None:
         with raises(FactorError):
             GailFactors(40, 0, 0, 0, 0, 0, Race.WHITE)
 
         factors = GailFactors(40, 2, 2, 3, 2, 1, Race.WHITE)
-        factors.relative_risk_factor = 0
+        assert factors.relative_risk_factor == 1
+
+    def test_immutable(self) -> None:
+        factors = GailFactors(40, 2, 2, 3, 2, 1, Race.WHITE)
+        with raises(AttributeError):
+            factors.age = 41
+
+        with raises(AttributeError):
+            del factors.race
+
+        with raises(AttributeError):
+            factors.other = 1
+
+    def test_equality(self) -> None:
+        factors = GailFactors(40.5, 2, 2, 3, 2, 1.82, Race.WHITE)
+        assert factors == GailFactors(40.5, 2, 2, 3, 2, 1.82, Race.WHITE)
+        assert hash(factors) == hash(GailFactors(40.5, 2, 2, 3, 2, 1.82, Race.WHITE))
+        assert factors != GailFactors(40.5, 2, 2, 3, 2, 1.82, Race.CHINESE)
+        assert factors != GailFactors(40.5, 1, 2, 3, 2, 1.82, Race.WHITE)
+        assert factors != "GailFactors"
+        assert len({factors, GailFactors(40.5, 2, 2, 3, 2, 1.82, Race.WHITE)}) == 1
+
+    def test_age_rounding(self) -> None:
+        factors = GailFactors(40.1 + 0.2, 0, 0, 0, 0, 1, Race.WHITE)
+        assert factors.age == 40.3
+        assert factors == GailFactors(40.3, 0, 0, 0, 0, 1, Race.WHITE)
 
     def test_from_questionnaire(self) -> None:
         data = {
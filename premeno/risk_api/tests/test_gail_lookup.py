@@ -0,0 +1,61 @@
+from itertools import product
+
+import numpy as np
+from pytest import approx
+
+from premeno.risk_api.gail.factors import HYPERPLASIA_RELATIVE_RISKS, GailFactors, factors_to_array
+from premeno.risk_api.gail.lookup import (
+    FACTOR_LEVELS,
+    RELATIVE_RISKS,
+    UNATTRIB_RELATIVE_RISKS,
+    factor_code,
+    factor_codes,
+)
+from premeno.risk_api.gail.model import GailModel
+from premeno.risk_api.gail.parameters import UNATTRIBUTABLE_RISK
+from premeno.risk_api.gail.race import RACES_TO_RACE_CATEGORY, Race
+
+ALL_FACTORS = [
+    GailFactors(40, biopsies, menarche, first_child, relatives, rr_factor, race)
+    for race, rr_factor, biopsies, menarche, first_child, relatives in product(
+        Race, HYPERPLASIA_RELATIVE_RISKS, range(3), range(3), range(4), range(3)
+    )
+]
+
+
+class TestLookup:
+    def test_table_size(self) -> None:
+        assert len(RELATIVE_RISKS) == np.prod(list(FACTOR_LEVELS.values()))
+        assert len(ALL_FACTORS) * 2 == len(RELATIVE_RISKS)
+
+    def test_every_entry_matches_formula(self) -> None:
+        codes = set()
+        for factors in ALL_FACTORS:
+            code = factor_code(factors)
+            assert code is not None
+            model = GailModel(factors)
+            unattrib_risks = UNATTRIBUTABLE_RISK[RACES_TO_RACE_CATEGORY[factors.race]]
+            for at_age, age_fac in ((40, 0), (60, 1)):
+                expected = model._relative_risk_formula(at_age)
+                assert RELATIVE_RISKS[code + age_fac] == approx(expected, rel=1e-15)
+                assert UNATTRIB_RELATIVE_RISKS[code + age_fac] == approx(
+                    unattrib_risks[age_fac] * expected, rel=1e-15
+                )
+                codes.add(code + age_fac)
+
+        assert codes == set(range(len(RELATIVE_RISKS)))
+
+    def test_factor_codes(self) -> None:
+        expected = [factor_code(factors) for factors in ALL_FACTORS]
+        assert factor_codes(factors_to_array(ALL_FACTORS)).tolist() == expected
+
+    def test_not_in_table(self) -> None:
+        factors = GailFactors(45.2, 1, 0, 0, 1, 1.5, Race.WHITE)
+        assert factor_code(factors) is None
+        assert factor_codes(factors_to_array([factors])).tolist() == [-1]
+
+        model = GailModel(factors)
+        assert model.relative_risk(45.2) == model._relative_risk_formula(45.2)
+        assert GailModel.predict_batch(factors_to_array([factors]), 5) == approx(
+            [model.predict(5)], rel=1e-12
+        )
@@ -1,9 +1,37 @@
-from pytest import approx
-
-from premeno.risk_api.gail.factors import GailFactors
-from premeno.risk_api.gail.model import GailModel, age_factor
+import os
+import subprocess
+import sys
+
+import numpy as np
+from pytest import approx, raises
+
+from premeno.risk_api.gail.errors import FactorError
+from premeno.risk_api.gail.factors import GailFactors, factors_to_array
+from premeno.risk_api.gail.model import (
+    DEFAULT_PREDICTION_CACHE_SIZE,
+    GailModel,
+    age_factor,
+    prediction_cache_info,
+    set_prediction_cache_size,
+)
 from premeno.risk_api.gail.race import Race
 
+EXAMPLE_FACTORS = [
+    GailFactors(45.2, 0, 0, 1, 1, 1.0, Race.HISPANIC_AMERICAN_US),
+    GailFactors(45.2, 1, 2, 1, 1, 1.0, Race.WHITE_OTHER),
+    GailFactors(45.2, 1, 0, 0, 1, 1.0, Race.HISPANIC_AMERICAN_FOREIGN),
+    GailFactors(45.2, 0, 0, 0, 1, 1.0, Race.CHINESE),
+    GailFactors(45.2, 1, 0, 0, 1, 0.93, Race.HAWAIIAN),
+    GailFactors(45.2, 1, 0, 0, 1, 1.82, Race.JAPANESE),
+    GailFactors(45.2, 1, 1, 0, 1, 0.93, Race.AFRICAN_AMERICAN),
+    GailFactors(35, 1, 2, 1, 0, 1.0, Race.HISPANIC_AMERICAN_US),
+    GailFactors(35, 2, 2, 2, 0, 1.0, Race.WHITE_OTHER),
+    GailFactors(27, 0, 1, 1, 0, 1.0, Race.JAPANESE),
+    GailFactors(27, 0, 1, 1, 0, 1.0, Race.FILIPINO),
+    GailFactors(49.5, 2, 1, 3, 2, 1.82, Race.WHITE),
+    GailFactors(62.01, 0, 1, 2, 0, 1.0, Race.AFRICAN_AMERICAN),
+]
+
 
 class TestModel:
     def test_age_fac(self):
@@ -97,3 +125,106 @@ class TestModel:
     def test_absolute_risk_one_interval(self):
         factors = GailFactors(45.2, 0, 0, 1, 1, 1.0, Race.HISPANIC_AMERICAN_US)
         assert GailModel(factors).predict(0.8) == approx(0.00169613151)
+
+    def test_band_integration_matches_intervals(self):
+        for factors in EXAMPLE_FACTORS:
+            model = GailModel(factors)
+            for years in (0, 0.3, 0.8, 1, 4.8, 5, 8.1, 10, 25, 90 - factors.age):
+                assert model.predict(years) == approx(
+                    model._predict_by_interval(years), rel=0, abs=1e-12
+                )
+
+    def test_projection_beyond_tables(self):
+        factors = GailFactors(45.2, 0, 0, 1, 1, 1.0, Race.HISPANIC_AMERICAN_US)
+        with raises(FactorError):
+            GailModel(factors).predict(45)
+
+
+class TestBatchModel:
+    def test_predict_batch_matches_predict(self):
+        factors = factors_to_array(EXAMPLE_FACTORS)
+        for years in (0, 0.8, 1, 5, 8.1, 10, 12.75):
+            expected = [GailModel(fac).predict(years) for fac in EXAMPLE_FACTORS]
+            assert GailModel.predict_batch(factors, years) == approx(expected, rel=1e-12)
+
+    def test_predict_batch_years_per_row(self):
+        factors = factors_to_array(EXAMPLE_FACTORS)
+        years = np.linspace(0.5, 20, len(EXAMPLE_FACTORS))
+        expected = [GailModel(fac).predict(yrs) for fac, yrs in zip(EXAMPLE_FACTORS, years)]
+        assert GailModel.predict_batch(factors, years) == approx(expected, rel=1e-12)
+
+    def test_predict_batch_empty(self):
+        assert len(GailModel.predict_batch(factors_to_array([]), 5)) == 0
+
+    def test_predict_batch_invalid(self):
+        factors = factors_to_array(EXAMPLE_FACTORS)
+        factors["number_of_biopsies"][0] = 3
+        with raises(FactorError):
+            GailModel.predict_batch(factors, 5)
+
+        with raises(FactorError):
+            GailModel.predict_batch(factors_to_array(EXAMPLE_FACTORS), 70)
+
+
+class TestCurve:
+    def test_curve_matches_predict(self):
+        for factors in EXAMPLE_FACTORS:
+            model = GailModel(factors)
+            horizons = [10, 1, 0, 5, 2.75, 90 - factors.age, 8.1]
+            expected = [model.predict(years) for years in horizons]
+            assert model.predict_curve(horizons) == approx(expected, rel=1e-12, abs=1e-15)
+
+    def test_curve_band_edges(self):
+        model = GailModel(GailFactors(45, 1, 1, 1, 1, 1.0, Race.WHITE))
+        horizons = [0, 5, 5, 10, 45]
+        expected = [model._predict_by_interval(years) for years in horizons]
+        assert model.predict_curve(horizons) == approx(expected, rel=0, abs=1e-12)
+
+    def test_curve_empty(self):
+        assert len(GailModel(EXAMPLE_FACTORS[0]).predict_curve([])) == 0
+
+    def test_curve_invalid(self):
+        with raises(FactorError):
+            GailModel(EXAMPLE_FACTORS[0]).predict_curve([5, -1])
+
+        with raises(FactorError):
+            GailModel(EXAMPLE_FACTORS[0]).predict_curve([5, 50])
+
+
+class TestPredictionCache:
+    def teardown_method(self):
+        set_prediction_cache_size(DEFAULT_PREDICTION_CACHE_SIZE)
+
+    def test_repeats_are_cached(self):
+        set_prediction_cache_size(2)
+        first = GailModel(EXAMPLE_FACTORS[0]).predict(5)
+        # same factors, different instances
+        factors = GailFactors(45.2, 0, 0, 1, 1, 1.0, Race.HISPANIC_AMERICAN_US)
+        assert GailModel(factors).predict(5) == first
+        assert prediction_cache_info().hits == 1
+        assert prediction_cache_info().misses == 1
+
+        GailModel(EXAMPLE_FACTORS[1]).predict(5)
+        GailModel(EXAMPLE_FACTORS[0]).predict(8.1)
+        assert prediction_cache_info().currsize == 2
+        assert prediction_cache_info().misses == 3
+
+    def test_cache_off(self):
+        set_prediction_cache_size(0)
+        model = GailModel(EXAMPLE_FACTORS[0])
+        assert model.predict(5) == model.predict(5)
+        assert prediction_cache_info().hits == 0
+        assert prediction_cache_info().misses == 2
+
+
+def test_import_without_django() -> None:
+    code = (
+        "import sys\n"
+        "import premeno.risk_api.gail.model, premeno.risk_api.gail.mht\n"
+        "print(' '.join(m for m in sys.modules if m.split('.')[0] in ('django', 'pydantic')))\n"
+    )
+    env = {k: v for k, v in os.environ.items() if k != "DJANGO_SETTINGS_MODULE"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    assert result.stdout.strip() == ""
@@ -0,0 +1,176 @@
+import json
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+
+from premeno.risk_api.jobs import (
+    QUEUE_KEY,
+    get_job,
+    job_events,
+    requeue_unfinished_jobs,
+    run_job,
+    run_next_job,
+    submit_job,
+)
+from premeno.risk_api.metrics import COUNTERS
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [],
+}
+
+PREDICTIONS = {"breast_cancer": {"none": 0.1, "e": 0.2, "e+p": 0.3}}
+
+
+def events(job_id: str) -> list[tuple[str, dict]]:
+    parsed = []
+    for event in job_events(job_id):
+        name, data = event.strip().split("\n")
+        parsed.append((name.split(": ", 1)[1], json.loads(data.split(": ", 1)[1])))
+    return parsed
+
+
+def status(job_id: str) -> Optional[str]:
+    job = get_job(job_id)
+    return job["status"] if job is not None else None
+
+
+class TestJobs:
+    def setup_method(self) -> None:
+        caches["default"].clear()
+        COUNTERS.reset()
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    def test_eager(self, mock) -> None:
+        mock.return_value = PREDICTIONS
+        job_id = submit_job(QUESTIONNAIRE, 5)
+
+        assert get_job(job_id) == {"id": job_id, "status": "done", "result": PREDICTIONS}
+        data, proj_years = mock.call_args.args
+        assert data.age_at_menarche == 12
+        assert proj_years == 5
+        assert COUNTERS.get("risk_jobs.done") == 1
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    def test_failed(self, mock) -> None:
+        mock.side_effect = Exception("BIG OL EXCEPTION")
+        job_id = submit_job(QUESTIONNAIRE, 5)
+
+        assert get_job(job_id) == {"id": job_id, "status": "failed", "error": "BIG OL EXCEPTION"}
+        assert COUNTERS.get("risk_jobs.failed") == 1
+
+    def test_unknown(self) -> None:
+        assert get_job("nope") is None
+        assert events("nope") == [("expired", {"id": "nope"})]
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    @patch("premeno.risk_api.jobs.redis_connection")
+    def test_queued(self, mock_redis, mock_predictions) -> None:
+        mock_predictions.return_value = PREDICTIONS
+        settings.RISK_JOBS_EAGER = False
+        try:
+            job_id = submit_job(QUESTIONNAIRE, 5)
+        finally:
+            settings.RISK_JOBS_EAGER = True
+
+        assert get_job(job_id) == {"id": job_id, "status": "queued"}
+        mock_predictions.assert_not_called()
+
+        # a worker takes it off the queue, keeping it in its processing list while it runs
+        key, job = mock_redis().lpush.call_args.args
+        assert key == QUEUE_KEY
+        connection = MagicMock()
+        connection.brpoplpush.return_value = job.encode()
+        assert run_next_job(connection, 1, "worker1")
+
+        assert connection.brpoplpush.call_args.args == (QUEUE_KEY, "risk-jobs:processing:worker1")
+        connection.lrem.assert_called_once_with("risk-jobs:processing:worker1", 1, job.encode())
+        assert get_job(job_id) == {"id": job_id, "status": "done", "result": PREDICTIONS}
+
+        connection.brpoplpush.return_value = None
+        assert not run_next_job(connection, 1, "worker1")
+
+    def test_requeue_unfinished_jobs(self) -> None:
+        job = json.dumps({"id": "abc", "questionnaire": QUESTIONNAIRE, "proj_years": 5})
+        caches["default"].set("risk-job:abc", {"id": "abc", "status": "running"})
+        connection = MagicMock()
+        connection.rpoplpush.side_effect = [job.encode(), None]
+
+        assert requeue_unfinished_jobs(connection, "worker1") == 1
+        assert connection.rpoplpush.call_args.args == ("risk-jobs:processing:worker1", QUEUE_KEY)
+        assert status("abc") == "queued"
+        assert COUNTERS.get("risk_jobs.requeued") == 1
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    def test_events(self, mock) -> None:
+        mock.return_value = PREDICTIONS
+        job_id = submit_job(QUESTIONNAIRE, 5)
+        assert events(job_id) == [
+            ("done", {"id": job_id, "status": "done", "result": PREDICTIONS}),
+        ]
+
+    @patch("premeno.risk_api.jobs.time.sleep")
+    def test_events_follow_status(self, mock_sleep) -> None:
+        job = {"id": "abc", "questionnaire": QUESTIONNAIRE, "proj_years": 5}
+        caches["default"].set("risk-job:abc", {"id": "abc", "status": "queued"})
+
+        # the job runs while the stream waits
+        with patch("premeno.risk_api.jobs.risk_predictions", return_value=PREDICTIONS):
+            mock_sleep.side_effect = lambda _: run_job(json.dumps(job))
+            assert [name for name, _ in events("abc")] == ["queued", "done"]
+
+    @patch("premeno.risk_api.jobs.time.sleep")
+    def test_events_timeout(self, mock_sleep) -> None:
+        caches["default"].set("risk-job:abc", {"id": "abc", "status": "running"})
+        tmp = settings.RISK_JOB_EVENTS_TIMEOUT
+        settings.RISK_JOB_EVENTS_TIMEOUT = 0
+        try:
+            assert events("abc") == [
+                ("running", {"id": "abc", "status": "running"}),
+                ("timeout", {"id": "abc"}),
+            ]
+        finally:
+            settings.RISK_JOB_EVENTS_TIMEOUT = tmp
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    @patch("premeno.risk_api.management.commands.risk_worker.redis_connection")
+    def test_worker(self, mock_redis, mock_predictions) -> None:
+        mock_predictions.return_value = PREDICTIONS
+        # taken from the end, like the queue's tail
+        jobs = [
+            json.dumps({"id": f"job{i}", "questionnaire": QUESTIONNAIRE, "proj_years": 5}).encode()
+            for i in range(3)
+        ]
+        # one was left unfinished by the last worker of the name
+        unfinished = [jobs.pop()]
+
+        def requeue(source: str, destination: str) -> Optional[bytes]:
+            if not unfinished:
+                return None
+            jobs.insert(0, unfinished[0])
+            return unfinished.pop()
+
+        mock_redis().rpoplpush.side_effect = requeue
+        mock_redis().brpoplpush.side_effect = lambda *args, **kwargs: jobs.pop() if jobs else None
+
+        call_command("risk_worker", "--burst", "--concurrency", "2", "--name", "worker1")
+
+        assert [status(f"job{i}") for i in range(3)] == ["done"] * 3
+        assert mock_redis().rpoplpush.call_args.args[0] == "risk-jobs:processing:worker1"
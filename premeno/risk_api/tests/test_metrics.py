@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from premeno.risk_api.metrics import Counters
+
+
+class TestCounters:
+    def test_counters(self) -> None:
+        counters = Counters()
+        counters.increment("a")
+        counters.increment("a", 2)
+        counters.increment("b")
+
+        assert counters.get("a") == 3
+        assert counters.get("c") == 0
+        assert counters.snapshot() == {"a": 3, "b": 1}
+
+        counters.reset()
+        assert counters.snapshot() == {}
+
+    def test_threads(self) -> None:
+        counters = Counters()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(1000):
+                executor.submit(counters.increment, "a")
+
+        assert counters.get("a") == 1000
@@ -8,6 +8,7 @@ from premeno.risk_api.questionnaire import (
     HyperplasiaStatus,
     Questionnaire,
     age_from_date,
+    replace_field,
 )
 
 
@@ -268,3 +269,30 @@ class TestQuestionnaire:
         data["sisters_ages_at_diagnosis"] = ["56", "56", "56"]
         questionnaire = Questionnaire(**data)
         assert questionnaire.number_of_relatives_with_cancer == 4
+
+    def test_replace_field(self) -> None:
+        data = dict(self.data, nulliparous=False, age_at_first_child="25")
+        questionnaire = Questionnaire(**data)
+
+        changed = replace_field(questionnaire, data, "age_at_menarche", "14")
+        assert changed.age_at_menarche == 14
+        assert changed.age_at_first_child == 25
+        assert questionnaire.age_at_menarche == 13
+        assert changed == Questionnaire(**dict(data, age_at_menarche="14"))
+
+        assert replace_field(questionnaire, data, "number_of_biopsies", "").number_of_biopsies == (
+            BiopsyStatus.UNKNOWN
+        )
+
+        with raises(ValidationError):
+            replace_field(questionnaire, data, "height", "20")
+
+        # later fields checked against the changed one are checked again
+        with raises(ValidationError):
+            replace_field(questionnaire, data, "age_at_menarche", "30")
+
+        with raises(ValidationError):
+            replace_field(questionnaire, data, "nulliparous", True)
+
+        with raises(ValueError):
+            replace_field(questionnaire, data, "shoe_size", "7")
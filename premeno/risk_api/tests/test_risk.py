@@ -1,36 +1,78 @@
+import asyncio
+import threading
 from unittest.mock import MagicMock, patch
 
-from pytest import approx
+import numpy as np
+from django.core.cache import caches
+from pytest import approx, raises
 
-from premeno.risk_api.questionnaire import MhtType
+from premeno.risk_api.canrisk.grid import GRID_MHT_STATUSES, CanRiskGrid, grid_point
+from premeno.risk_api.canrisk.risk_factors import MhtStatus
+from premeno.risk_api.canrisk.surrogate import FEATURES, MAX_HORIZON, CanRiskSurrogate
+from premeno.risk_api.gail.errors import FactorError
+from premeno.risk_api.gail.factors import GailFactors
+from premeno.risk_api.metrics import COUNTERS
+from premeno.risk_api.questionnaire import MhtType, Questionnaire
 from premeno.risk_api.risk import (
     CanRiskCalc,
+    CanRiskGridCalc,
+    CanRiskSurrogateCalc,
     FakeCalc,
     GailRiskCalc,
     Risk,
     RiskCalc,
     risk_predictions,
+    risk_predictions_async,
+    sensitivity_predictions,
 )
 
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [],
+}
+
+
+RATES = {"age": [50, 51, 52], "baseline": [0.05, 0.1, 0.15], "individual": [0.1, 0.2, 0.3]}
+
+
+def fake_cache_keys(canrisk_file, mht_statuses) -> dict:
+    return {mht_status: f"test:{mht_status.value}" for mht_status in mht_statuses}
+
 
 class TestRiskModels:
+    def setup_method(self) -> None:
+        caches["default"].clear()
+        COUNTERS.reset()
+
     @patch("premeno.risk_api.risk.Questionnaire")
     def test_fake_model(self, mock_q) -> None:
         mock_q = MagicMock()
         assert FakeCalc().predict_mht_type(mock_q, 5, MhtType.NONE) == approx(0.05)
         pass
 
+    @patch("premeno.risk_api.risk.result_cache_keys", fake_cache_keys)
     @patch("premeno.risk_api.risk.Questionnaire")
-    @patch("premeno.risk_api.risk.extract_cancer_rates")
     @patch("premeno.risk_api.risk.create_canrisk_file")
-    @patch("premeno.risk_api.risk.CanRiskAPI")
-    def test_canrisk_calc(self, mock_api, mock_ccf, mock_ecr, mock_q) -> None:
+    @patch("premeno.risk_api.risk.get_canrisk_api")
+    def test_canrisk_calc(self, mock_api, mock_ccf, mock_q) -> None:
         mock_q = MagicMock()
         mock_q.age = 46
-        mock_ccf.return_value = "FakeFile"
-        mock_api = MagicMock()
-        mock_api.boadicea.return_value = {}
-        mock_ecr.return_value = {"age": [50, 51, 52], "individual": [0.1, 0.2, 0.3]}
+        mock_ccf.return_value = MagicMock()
+        mock_api.return_value.boadicea_rates.return_value = RATES
 
         assert CanRiskCalc().predict_mht_type(mock_q, 5, MhtType.NONE) == 0.2
 
@@ -50,14 +92,85 @@ class TestRiskModels:
         assert mock_gail.predict.called_once_with(5)
         assert model.predict_mht_type(mock_q, 5, MhtType.NONE) == approx(0.1)
 
+    @patch("premeno.risk_api.risk.collab_relative_risk")
+    @patch("premeno.risk_api.risk.GailFactors.from_questionnaire")
+    @patch("premeno.risk_api.risk.GailModel.predict_curve")
+    def test_gail_calc_curve(self, mock_curve, mock_fac, mock_collab) -> None:
+        mock_curve.return_value = np.array([0.01, 0.05, 0.1])
+        mock_collab.return_value = 2
+
+        curves = GailRiskCalc().predict_curve(MagicMock(), [1, 5, 10])
+        mock_curve.assert_called_with([1, 5, 10])
+        assert curves == {
+            "none": approx([0.02, 0.1, 0.2]),
+            "e": approx([0.02, 0.1, 0.2]),
+            "e+p": approx([0.02, 0.1, 0.2]),
+        }
+
+        mock_curve.side_effect = Exception("BIG OL EXCEPTION")
+        curves = GailRiskCalc().predict_curve(MagicMock(), [1, 5, 10])
+        assert curves == {"none": None, "e": None, "e+p": None}
+
     @patch("premeno.risk_api.risk.Questionnaire")
-    @patch("premeno.risk_api.risk.CanRiskCalc")
-    def test_risk_predictions(self, mock, mock_data) -> None:
+    def test_risk_predictions(self, mock_data) -> None:
         fake_results = {"none": 0.5, "e": 0.2, "e+p": 0.3}
+        mock = MagicMock()
         mock().predict.return_value = fake_results
+        mock().name = "Mock"
+        mock().error_bound.return_value = None
         mock_data = MagicMock()
 
-        assert risk_predictions(mock_data, 5) == {"breast_cancer": fake_results}
+        with patch.dict("premeno.risk_api.risk.RISK_MODELS", {Risk.BREAST_CANCER: mock}):
+            assert risk_predictions(mock_data, 5) == {
+                "breast_cancer": fake_results,
+                "sources": {"breast_cancer": "Mock"},
+            }
+
+    def test_risk_predictions_async(self) -> None:
+        with patch.dict("premeno.risk_api.risk.RISK_MODELS", {Risk.BREAST_CANCER: FakeCalc}):
+            assert asyncio.run(risk_predictions_async(MagicMock(), 5)) == {
+                "breast_cancer": {"none": 0.05, "e": 0.04, "e+p": 0.04},
+                "sources": {"breast_cancer": "Fakeo"},
+            }
+
+    def test_risk_predictions_fallback(self) -> None:
+        class BrokenCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "Broken"
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                if mht_type == MhtType.COMBINED:
+                    raise Exception("BIG OL EXCEPTION")
+                return 0.1
+
+        class UnavailableCalc(FakeCalc):
+            name: str = "Unavailable"
+
+            def available(self) -> bool:
+                return False
+
+        with patch.dict("premeno.risk_api.risk.RISK_MODELS", {Risk.BREAST_CANCER: BrokenCalc}):
+            # tried in turn, until one gives every prediction
+            with patch.dict(
+                "premeno.risk_api.risk.FALLBACK_MODELS",
+                {Risk.BREAST_CANCER: (UnavailableCalc, BrokenCalc, FakeCalc, BrokenCalc)},
+            ):
+                expected = {
+                    "breast_cancer": {"none": 0.05, "e": 0.04, "e+p": 0.04},
+                    "sources": {"breast_cancer": "Fakeo"},
+                }
+                assert risk_predictions(MagicMock(), 5) == expected
+                assert asyncio.run(risk_predictions_async(MagicMock(), 5)) == expected
+                assert COUNTERS.get("breast_cancer.fallbacks") == 2
+
+            # a fallback that can't do better isn't used
+            with patch.dict(
+                "premeno.risk_api.risk.FALLBACK_MODELS", {Risk.BREAST_CANCER: (BrokenCalc,)}
+            ):
+                assert risk_predictions(MagicMock(), 5) == {
+                    "breast_cancer": {"none": 0.1, "e": 0.1, "e+p": None},
+                    "sources": {"breast_cancer": "Broken"},
+                }
 
     @patch("premeno.risk_api.risk.Questionnaire")
     def test_risk_calc_predict(self, mock) -> None:
@@ -72,6 +185,13 @@ class TestRiskModels:
         faker = FakerCalc()
         assert faker.predict(mock, 5) == {"none": 0.1, "e": 0.1, "e+p": 0.1}
 
+    def test_risk_calc_defines_prediction(self) -> None:
+        with raises(TypeError):
+
+            class LazyCalc(RiskCalc):
+                risk: Risk = Risk.BREAST_CANCER
+                name: str = "Lazy"
+
     @patch("premeno.risk_api.risk.Questionnaire")
     def test_risk_calc_predict_error(self, mock) -> None:
         class FakerCalc(RiskCalc):
@@ -84,3 +204,333 @@ class TestRiskModels:
 
         faker = FakerCalc()
         assert faker.predict(mock, 5) == {"none": None, "e": None, "e+p": None}
+
+    @patch("premeno.risk_api.risk.Questionnaire")
+    def test_risk_calc_prepare_once(self, mock) -> None:
+        class FakerCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "FAKER"
+            prepare_calls = 0
+
+            def prepare(self, data, proj_years) -> float:
+                self.prepare_calls += 1
+                return 0.1
+
+            def predict_prepared(self, prepared, data, proj_years, mht_type) -> float:
+                return prepared * {"none": 1, "e": 2, "e+p": 3}[mht_type.value]
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                raise NotImplementedError
+
+        faker = FakerCalc()
+        assert faker.predict(mock, 5) == {"none": 0.1, "e": 0.2, "e+p": approx(0.3)}
+        assert faker.prepare_calls == 1
+
+    @patch("premeno.risk_api.risk.Questionnaire")
+    def test_risk_calc_prepare_error(self, mock) -> None:
+        class FakerCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "FAKER"
+
+            def prepare(self, data, proj_years) -> None:
+                raise Exception("BIG OL EXCEPTION")
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                return 0.1
+
+        faker = FakerCalc()
+        assert faker.predict(mock, 5) == {"none": None, "e": None, "e+p": None}
+
+    @patch("premeno.risk_api.risk.collab_relative_risk")
+    @patch("premeno.risk_api.risk.GailFactors.from_questionnaire")
+    @patch("premeno.risk_api.risk.GailModel.predict")
+    def test_gail_calc_predicts_once(self, mock_gail, mock_fac, mock_collab) -> None:
+        mock_gail.return_value = 0.05
+        mock_collab.side_effect = lambda mht_type: {"none": 1, "e": 2, "e+p": 3}[mht_type.value]
+
+        results = GailRiskCalc().predict(MagicMock(), 5)
+        assert results == {"none": approx(0.05), "e": approx(0.1), "e+p": approx(0.15)}
+        mock_fac.assert_called_once()
+        mock_gail.assert_called_once_with(5)
+
+    @patch("premeno.risk_api.risk.result_cache_keys", fake_cache_keys)
+    @patch("premeno.risk_api.risk.create_canrisk_file")
+    @patch("premeno.risk_api.risk.get_canrisk_api")
+    def test_canrisk_calc_prepares_once(self, mock_api, mock_ccf) -> None:
+        mock_q = MagicMock()
+        mock_q.age = 46
+        mock_ccf.return_value.mht_variants.return_value = {
+            MhtStatus.Never: "never",
+            MhtStatus.Oestrogen: "oestrogen",
+            MhtStatus.Combined: "combined",
+        }
+        mock_api.return_value.boadicea_rates.return_value = RATES
+
+        assert CanRiskCalc().predict(mock_q, 5) == {"none": 0.2, "e": 0.2, "e+p": 0.2}
+        mock_api.assert_called_once()
+        mock_ccf.assert_called_once_with(mock_q, MhtStatus.Never)
+        boadicea_args = [args[0] for args, _ in mock_api().boadicea_rates.call_args_list]
+        # made concurrently, so in any order
+        assert sorted(boadicea_args) == ["combined", "never", "oestrogen"]
+
+    def test_gail_predict_many(self) -> None:
+        datas = [
+            Questionnaire(**QUESTIONNAIRE),
+            Questionnaire(**dict(QUESTIONNAIRE, ethnic_group="other")),
+            Questionnaire(**dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=[50, 52])),
+        ]
+
+        results = GailRiskCalc().predict_many(datas, 5)
+        for data, result in zip(datas, results):
+            expected = GailRiskCalc().predict(data, 5)
+            assert result == {mht: approx(risk, rel=1e-12) for mht, risk in expected.items()}
+
+    def test_gail_predict_many_errors(self) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        factors = GailFactors.from_questionnaire(data)
+
+        with patch("premeno.risk_api.risk.GailFactors.from_questionnaire") as mock_fac:
+            mock_fac.side_effect = [factors, FactorError("bad"), factors]
+            results = GailRiskCalc().predict_many([data, data, data], 5)
+
+        assert results[0] == results[2]
+        assert results[0]["none"] is not None
+        assert results[1] == {"none": None, "e": None, "e+p": None}
+
+    def test_canrisk_predict_many(self) -> None:
+        def prepare(self, data, years):
+            if data == 2:
+                raise Exception("BIG OL EXCEPTION")
+            return data * 10
+
+        def predict_prepared(self, prepared, data, years, mht_type):
+            return prepared + {"none": 1, "e": 2, "e+p": 3}[mht_type.value]
+
+        with patch.multiple(CanRiskCalc, prepare=prepare, predict_prepared=predict_prepared):
+            # prepare and predict_prepared are patched, so any data will do
+            datas: list = [1, 2, 3]
+            assert CanRiskCalc().predict_many(datas, 5) == [
+                {"none": 11, "e": 12, "e+p": 13},
+                {"none": None, "e": None, "e+p": None},
+                {"none": 31, "e": 32, "e+p": 33},
+            ]
+
+    def test_concurrent_predictions(self) -> None:
+        """Every MHT type is predicted at once, and a failure only loses its own prediction"""
+        barrier = threading.Barrier(len(MhtType), timeout=5)
+
+        class ConcurrentCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "Concurrent"
+            concurrent: bool = True
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                barrier.wait()
+                if mht_type == MhtType.COMBINED:
+                    raise Exception("BIG OL EXCEPTION")
+                return 0.1
+
+        assert ConcurrentCalc().predict(MagicMock(), 5) == {"none": 0.1, "e": 0.1, "e+p": None}
+
+    def test_latency_budget(self) -> None:
+        """Predictions not made within the budget are None, and predict doesn't wait for them"""
+        release = threading.Event()
+
+        class SlowCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "Slow"
+            concurrent: bool = True
+            latency_budget: float = 0.1
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                if mht_type == MhtType.COMBINED:
+                    release.wait(5)
+                return 0.1
+
+        try:
+            assert SlowCalc().predict(MagicMock(), 5) == {"none": 0.1, "e": 0.1, "e+p": None}
+            assert COUNTERS.get("slow.budget_exceeded") == 1
+        finally:
+            release.set()
+
+    @patch("premeno.risk_api.risk.result_cache_keys", fake_cache_keys)
+    @patch("premeno.risk_api.risk.create_canrisk_file")
+    @patch("premeno.risk_api.risk.get_async_canrisk_api")
+    def test_canrisk_predict_async_budget(self, mock_api, mock_ccf) -> None:
+        mock_q = MagicMock()
+        mock_q.age = 46
+        mock_ccf.return_value.mht_variants.return_value = {
+            MhtStatus.Never: "never",
+            MhtStatus.Oestrogen: "oestrogen",
+            MhtStatus.Combined: "combined",
+        }
+
+        async def boadicea(pedigree_data):
+            if pedigree_data == "combined":
+                await asyncio.sleep(5)
+            return RATES
+
+        mock_api.return_value.boadicea_rates = boadicea
+        calc = CanRiskCalc()
+        calc.latency_budget = 0.1
+        results = asyncio.run(calc.predict_async(mock_q, 5))
+        assert results == {"none": 0.2, "e": 0.2, "e+p": None}
+
+    @patch("premeno.risk_api.risk.result_cache_keys", fake_cache_keys)
+    @patch("premeno.risk_api.risk.create_canrisk_file")
+    @patch("premeno.risk_api.risk.get_async_canrisk_api")
+    def test_canrisk_predict_async(self, mock_api, mock_ccf) -> None:
+        mock_q = MagicMock()
+        mock_q.age = 46
+        mock_ccf.return_value.mht_variants.return_value = {
+            MhtStatus.Never: "never",
+            MhtStatus.Oestrogen: "oestrogen",
+            MhtStatus.Combined: "combined",
+        }
+
+        async def boadicea(pedigree_data):
+            if pedigree_data == "combined":
+                raise Exception("BIG OL EXCEPTION")
+            return RATES
+
+        mock_api.return_value.boadicea_rates = boadicea
+        results = asyncio.run(CanRiskCalc().predict_async(mock_q, 5))
+        assert results == {"none": 0.2, "e": 0.2, "e+p": None}
+
+        mock_api.side_effect = Exception("BIG OL EXCEPTION")
+        results = asyncio.run(CanRiskCalc().predict_async(mock_q, 5))
+        assert results == {"none": None, "e": None, "e+p": None}
+
+    @patch("premeno.risk_api.risk.result_cache_keys", fake_cache_keys)
+    @patch("premeno.risk_api.risk.create_canrisk_file")
+    @patch("premeno.risk_api.risk.get_canrisk_api")
+    def test_canrisk_calc_cached(self, mock_api, mock_ccf) -> None:
+        mock_q = MagicMock()
+        mock_q.age = 46
+        mock_api.return_value.boadicea_rates.return_value = RATES
+
+        assert CanRiskCalc().predict(mock_q, 5) == {"none": 0.2, "e": 0.2, "e+p": 0.2}
+        assert mock_api().boadicea_rates.call_count == 3
+
+        # cached as float32s
+        cached = CanRiskCalc().predict(mock_q, 5)
+        assert cached == {"none": approx(0.2), "e": approx(0.2), "e+p": approx(0.2)}
+        assert mock_api().boadicea_rates.call_count == 3
+
+    def test_canrisk_surrogate_calc(self, tmp_path) -> None:
+        # a risk of 10% for any horizon, raised by combined MHT
+        coefficients = np.zeros((MAX_HORIZON, len(FEATURES) + 1))
+        coefficients[:, 0] = np.log(-np.log(0.9))
+        coefficients[:, 1 + FEATURES.index("mht_combined")] = 0.5
+        errors = {"p95": np.full(MAX_HORIZON, 0.01)}
+        path = str(tmp_path / "surrogate.npz")
+        CanRiskSurrogate(
+            np.zeros(len(FEATURES)), np.ones(len(FEATURES)), coefficients, errors
+        ).save(path)
+
+        calc = CanRiskSurrogateCalc(path)
+        predictions = calc.predict(Questionnaire(**QUESTIONNAIRE), 5)
+        assert predictions["none"] == approx(0.1)
+        assert predictions["e"] == approx(0.1)
+        assert predictions["e+p"] is not None and predictions["e+p"] > 0.1
+        assert calc.error_bound(5) == approx(0.01)
+
+        class DownCalc(RiskCalc):
+            risk: Risk = Risk.BREAST_CANCER
+            name: str = "Down"
+
+            def predict_mht_type(self, data, proj_years, mht_type) -> float:
+                raise Exception("BIG OL EXCEPTION")
+
+        # a fallback, whose error bound is given with its predictions
+        with patch.dict("premeno.risk_api.risk.RISK_MODELS", {Risk.BREAST_CANCER: DownCalc}):
+            with patch("premeno.risk_api.risk.settings.CANRISK_SURROGATE_PATH", path):
+                results = risk_predictions(Questionnaire(**QUESTIONNAIRE), 5)
+        assert results["breast_cancer"] == predictions
+        assert results["sources"] == {"breast_cancer": "CanRisk surrogate"}
+        assert results["error_bounds"] == {"breast_cancer": approx(0.01)}
+
+    def test_canrisk_surrogate_calc_missing(self, tmp_path) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        expected = {"none": None, "e": None, "e+p": None}
+
+        with patch("premeno.risk_api.risk.settings.CANRISK_SURROGATE_PATH", ""):
+            assert CanRiskSurrogateCalc().predict(data, 5) == expected
+        assert CanRiskSurrogateCalc(str(tmp_path / "missing.npz")).predict(data, 5) == expected
+
+    def test_canrisk_grid_calc(self, tmp_path) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        point = grid_point(data)
+        # a grid of just her, and someone five years older
+        age = point["age"]
+        assert age is not None
+        axes: dict[str, list] = {name: [value] for name, value in point.items()}
+        axes["age"] = [age, age + 5]
+        path = str(tmp_path / "canrisk.grid")
+        grid = CanRiskGrid.create(path, axes)
+        for older in (0, 1):
+            index = [older] + [0] * (len(axes) - 1)
+            for mht_status, scale in zip(GRID_MHT_STATUSES, (1.0, 1.1, 1.25)):
+                grid.set_risks(index, mht_status, np.full(MAX_HORIZON, 0.1 * scale * (1 + older)))
+        grid.flush()
+
+        predictions = CanRiskGridCalc(path).predict(data, 5)
+        assert predictions == {"none": approx(0.1), "e": approx(0.11), "e+p": approx(0.125)}
+
+        # off the grid
+        off_grid = Questionnaire(**dict(QUESTIONNAIRE, date_of_birth="1965-08-20T16:48:50.823Z"))
+        assert CanRiskGridCalc(path).predict(off_grid, 5) == {"none": None, "e": None, "e+p": None}
+
+    def test_canrisk_grid_calc_missing(self, tmp_path) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        expected = {"none": None, "e": None, "e+p": None}
+
+        with patch("premeno.risk_api.risk.settings.CANRISK_GRID_PATH", ""):
+            assert not CanRiskGridCalc().available()
+            assert CanRiskGridCalc().predict(data, 5) == expected
+        assert CanRiskGridCalc(str(tmp_path / "missing")).predict(data, 5) == expected
+
+
+class TestSensitivity:
+    @patch("premeno.risk_api.risk.SENSITIVITY_MODELS", {"gail": GailRiskCalc})
+    def test_sensitivity_predictions(self) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        perturbations: list[dict] = [
+            {"field": "mht", "value": "e+p"},
+            {"field": "sisters_ages_at_diagnosis", "value": [50]},
+            {"field": "height", "value": "20"},
+        ]
+
+        results = sensitivity_predictions(data, QUESTIONNAIRE, perturbations, 5)
+
+        risks = GailRiskCalc().predict(data, 5)
+        with_sister = GailRiskCalc().predict(
+            Questionnaire(**dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=[50])), 5
+        )
+        assert risks["e"] is not None and risks["e+p"] is not None
+        assert results["baseline"] == {"gail": approx(risks["e"])}
+
+        mht, sister, height = results["perturbations"]
+        assert mht["field"] == "mht"
+        assert mht["value"] == "e+p"
+        assert mht["risk"] == {"gail": approx(risks["e+p"])}
+        assert mht["delta"] == {"gail": approx(risks["e+p"] - risks["e"])}
+        assert sister["risk"] == {"gail": approx(with_sister["e"])}
+        assert sister["delta"]["gail"] > 0
+        assert "Height must be between" in height["error"]
+        assert "risk" not in height
+
+    @patch("premeno.risk_api.risk.SENSITIVITY_MODELS", {"fake": FakeCalc})
+    def test_sensitivity_scores_each_variant_once(self) -> None:
+        data = Questionnaire(**QUESTIONNAIRE)
+        perturbations = [{"field": "mht", "value": mht.value} for mht in MhtType]
+
+        with patch.object(FakeCalc, "predict_many", wraps=FakeCalc().predict_many) as mock:
+            results = sensitivity_predictions(data, QUESTIONNAIRE, perturbations, 5)
+
+        assert len(mock.call_args.args[0]) == 1
+        assert [result["delta"]["fake"] for result in results["perturbations"]] == [
+            approx(0.01),
+            approx(0.0),
+            approx(0.0),
+        ]
@@ -0,0 +1,153 @@
+import csv
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.core.management import call_command
+from pytest import approx, raises
+
+from premeno.risk_api.management.commands.score_cohort import CommandError
+from premeno.risk_api.questionnaire import Questionnaire
+from premeno.risk_api.risk import GailRiskCalc
+
+QUESTIONNAIRE = {
+    "date_of_birth": "1975-08-20T16:48:50.823Z",
+    "height": "165.1",
+    "weight": "70.34",
+    "ethnic_group": "white",
+    "education": "uni",
+    "alcohol_use": "7",
+    "smoking": "never",
+    "mht": "e",
+    "age_at_menarche": "12",
+    "nulliparous": False,
+    "age_at_first_child": "28",
+    "oral_contraception_use": "y",
+    "number_of_biopsies": "1",
+    "biopsies_with_hyperplasia": "0",
+    "mother_age_at_diagnosis": "61",
+    "sisters_ages_at_diagnosis": [52],
+}
+
+
+def write_jsonl(path, rows) -> None:
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def score(*args, **options) -> str:
+    stderr = StringIO()
+    call_command("score_cohort", *map(str, args), stderr=stderr, **options)
+    return stderr.getvalue()
+
+
+class TestScoreCohort:
+    def test_jsonl_to_csv(self, tmp_path) -> None:
+        write_jsonl(
+            tmp_path / "in.jsonl",
+            [
+                dict(QUESTIONNAIRE, id="a"),
+                dict(QUESTIONNAIRE, height="20"),
+                QUESTIONNAIRE,
+            ],
+        )
+
+        report = score(tmp_path / "in.jsonl", tmp_path / "out.csv", processes=1)
+
+        with open(tmp_path / "out.csv", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+        expected = GailRiskCalc().predict(Questionnaire(**QUESTIONNAIRE), 5)
+        assert [row["id"] for row in rows] == ["a", "2", "3"]
+        assert list(rows[0]) == ["id", "gail_none", "gail_e", "gail_e+p", "error"]
+        assert float(rows[0]["gail_e"]) == approx(expected["e"])
+        assert float(rows[2]["gail_none"]) == approx(expected["none"])
+        assert rows[0]["error"] == ""
+        assert rows[1]["gail_none"] == ""
+        assert rows[1]["error"].startswith("height: Height must be between")
+        assert "3 rows scored (1 with errors)" in report
+        assert "rows/sec" in report
+
+    def test_csv_to_jsonl_with_pool(self, tmp_path) -> None:
+        with open(tmp_path / "in.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, QUESTIONNAIRE)
+            writer.writeheader()
+            for _ in range(5):
+                writer.writerow(dict(QUESTIONNAIRE, sisters_ages_at_diagnosis="[52]"))
+            writer.writerow(dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=""))
+
+        score(tmp_path / "in.csv", tmp_path / "out.jsonl", processes=2, chunk_size=2)
+
+        records = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()]
+        expected = GailRiskCalc().predict(Questionnaire(**QUESTIONNAIRE), 5)
+        no_sisters = GailRiskCalc().predict(
+            Questionnaire(**dict(QUESTIONNAIRE, sisters_ages_at_diagnosis=[])), 5
+        )
+        assert [record["id"] for record in records] == ["1", "2", "3", "4", "5", "6"]
+        assert records[4]["gail_e+p"] == approx(expected["e+p"])
+        assert records[5]["gail_e+p"] == approx(no_sisters["e+p"])
+        assert all(record["error"] == "" for record in records)
+
+    def test_csv_blank_cells(self, tmp_path) -> None:
+        blanks = {
+            "nulliparous": True,
+            "age_at_first_child": "",
+            "number_of_biopsies": "",
+            "biopsies_with_hyperplasia": "",
+            "mother_age_at_diagnosis": "",
+            "sisters_ages_at_diagnosis": "",
+        }
+        with open(tmp_path / "in.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, QUESTIONNAIRE)
+            writer.writeheader()
+            writer.writerow(dict(QUESTIONNAIRE, **blanks))
+
+        score(tmp_path / "in.csv", tmp_path / "out.jsonl", processes=1)
+
+        (record,) = [
+            json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()
+        ]
+        expected = GailRiskCalc().predict(
+            Questionnaire(**dict(QUESTIONNAIRE, **dict(blanks, sisters_ages_at_diagnosis=[]))), 5
+        )
+        assert record["error"] == ""
+        assert record["gail_none"] == approx(expected["none"])
+
+    @patch("premeno.risk_api.risk.interpolate_rate")
+    @patch("premeno.risk_api.risk.get_canrisk_api")
+    def test_canrisk(self, mock_api, mock_ir, tmp_path) -> None:
+        caches["default"].clear()
+        mock_api.return_value.boadicea_rates.return_value = {
+            "age": [50, 51],
+            "baseline": [0.1, 0.1],
+            "individual": [0.1, 0.2],
+        }
+        mock_ir.side_effect = [0.1, 0.2, ValueError("no rates")]
+        write_jsonl(tmp_path / "in.jsonl", [QUESTIONNAIRE])
+
+        score(
+            tmp_path / "in.jsonl",
+            tmp_path / "out.jsonl",
+            processes=1,
+            canrisk="http://localhost:8001",
+        )
+
+        record = json.loads((tmp_path / "out.jsonl").read_text())
+        assert mock_api.call_args.args[0] == "http://localhost:8001"
+        assert record["canrisk_none"] == 0.1
+        assert record["canrisk_e"] == 0.2
+        assert record["canrisk_e+p"] is None
+        assert record["gail_e+p"] is not None
+        assert record["error"] == "CanRisk: no rates"
+
+    def test_unknown_format(self, tmp_path) -> None:
+        write_jsonl(tmp_path / "in.txt", [QUESTIONNAIRE])
+
+        with raises(CommandError):
+            score(tmp_path / "in.txt", tmp_path / "out.csv")
+
+    def test_bad_json(self, tmp_path) -> None:
+        (tmp_path / "in.jsonl").write_text('{"height": \n')
+
+        with raises(CommandError, match="Line 1"):
+            score(tmp_path / "in.jsonl", tmp_path / "out.csv", processes=1)
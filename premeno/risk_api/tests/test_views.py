@@ -1,7 +1,14 @@
+import asyncio
 import json
+import time
 from unittest.mock import patch
 
 import pytest
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import caches
+
+from premeno.risk_api.asgi import EventLoopASGIHandler
+from premeno.risk_api.metrics import COUNTERS
 
 
 class TestView:
@@ -38,3 +45,179 @@ class TestView:
         assert response.data["breast_cancer"]["none"] == 0.1
         assert response.data["breast_cancer"]["e"] == 0.2
         assert response.data["breast_cancer"]["e+p"] == 0.3
+
+    @patch("premeno.risk_api.views.sensitivity_predictions")
+    @pytest.mark.django_db
+    def test_sensitivity_view(self, mock, client) -> None:
+        mock.return_value = {"baseline": {"gail": 0.1}, "perturbations": []}
+        perturbations = [{"field": "mht", "value": "e+p"}]
+
+        response = client.post(
+            "/api/risk/sensitivity/",
+            data=json.dumps({"questionnaire": self.data, "perturbations": perturbations}),
+            content_type="application/json",
+        )
+
+        assert response.status_code == 200
+        assert response.data == mock.return_value
+        data, raw, perturbations_arg, years = mock.call_args.args
+        assert data.age_at_menarche == 13
+        assert raw == self.data
+        assert [dict(p) for p in perturbations_arg] == perturbations
+
+    @pytest.mark.django_db
+    def test_sensitivity_view_bad_request(self, client) -> None:
+        response = client.post(
+            "/api/risk/sensitivity/",
+            data=json.dumps({"questionnaire": self.data, "perturbations": [{"value": 1}]}),
+            content_type="application/json",
+        )
+
+        assert response.status_code == 400
+
+    @pytest.mark.django_db
+    def test_invalid_questionnaire(self, client) -> None:
+        """Every endpoint answers an invalid questionnaire with a 400, not a 500"""
+        invalid = dict(self.data, height="20")
+        requests = [
+            ("/api/risk/", invalid),
+            ("/api/risk/sensitivity/", {"questionnaire": invalid, "perturbations": []}),
+            ("/api/risk/jobs/", invalid),
+            ("/api/risk/async/", invalid),
+        ]
+
+        for url, data in requests:
+            response = client.post(url, data=json.dumps(data), content_type="application/json")
+            assert response.status_code == 400, url
+            assert response.json()["detail"][0]["loc"] == ["height"], url
+
+    @pytest.mark.django_db
+    def test_metrics_view(self, client, admin_client) -> None:
+        assert client.get("/api/risk/metrics/").status_code == 403
+
+        COUNTERS.reset()
+        COUNTERS.increment("test.metrics")
+        COUNTERS.increment("canrisk.result_cache.hits", 3)
+        COUNTERS.increment("canrisk.result_cache.misses")
+        response = admin_client.get("/api/risk/metrics/")
+
+        assert response.status_code == 200
+        assert response.data["counters"]["test.metrics"] == 1
+        assert response.data["canrisk_result_cache_hit_ratio"] == 0.75
+        assert "canrisk_connections" in response.data
+        assert "canrisk_circuits" in response.data
+        assert "canrisk_limits" in response.data
+
+    @patch("premeno.risk_api.views.risk_predictions_async")
+    @pytest.mark.django_db
+    def test_async_view(self, mock, async_client) -> None:
+        async def predictions(data, proj_years):
+            return {"breast_cancer": {"none": 0.1, "e": 0.2, "e+p": 0.3}}
+
+        mock.side_effect = predictions
+        response = asyncio.run(
+            async_client.post(
+                "/api/risk/async/", data=json.dumps(self.data), content_type="application/json"
+            )
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"breast_cancer": {"none": 0.1, "e": 0.2, "e+p": 0.3}}
+
+        response = asyncio.run(
+            async_client.post(
+                "/api/risk/async/",
+                data=json.dumps(dict(self.data, height="20")),
+                content_type="application/json",
+            )
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"][0]["loc"] == ["height"]
+
+        assert asyncio.run(async_client.get("/api/risk/async/")).status_code == 405
+
+    @patch("premeno.risk_api.jobs.risk_predictions")
+    @pytest.mark.django_db
+    def test_job_views(self, mock, client) -> None:
+        mock.return_value = {"breast_cancer": {"none": 0.1, "e": 0.2, "e+p": 0.3}}
+
+        response = client.post(
+            "/api/risk/jobs/", data=json.dumps(self.data), content_type="application/json"
+        )
+
+        assert response.status_code == 202
+        job_id = response.data["id"]
+        assert response["Location"] == f"/api/risk/jobs/{job_id}/"
+
+        response = client.get(f"/api/risk/jobs/{job_id}/")
+        assert response.status_code == 200
+        assert response.data["status"] == "done"
+        assert response.data["result"] == mock.return_value
+
+        response = client.get(f"/api/risk/jobs/{job_id}/events/", HTTP_ACCEPT="text/event-stream")
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/event-stream"
+        events = b"".join(response.streaming_content).decode()
+        assert events.startswith("event: done\ndata: ")
+
+        assert client.get("/api/risk/jobs/nope/").status_code == 404
+        assert client.get("/api/risk/jobs/nope/events/").status_code == 404
+
+    @pytest.mark.django_db(transaction=True)
+    def test_job_events_under_asgi(self, settings) -> None:
+        settings.RISK_JOB_EVENTS_TIMEOUT = 0.3
+        settings.RISK_JOB_EVENTS_POLL_INTERVAL = 0.1
+        caches["default"].set("risk-job:abc", {"id": "abc", "status": "running"})
+        ticks = []
+
+        async def tick() -> None:
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def events() -> tuple[dict, bytes]:
+            ticker = asyncio.ensure_future(tick())
+            application = EventLoopASGIHandler()
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": "/api/risk/jobs/abc/events/",
+                "query_string": b"",
+                "headers": [(b"host", b"testserver"), (b"origin", b"http://localhost:3000")],
+            }
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input({"type": "http.request", "body": b""})
+            start = await communicator.receive_output(5)
+            body = b""
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            # a loop held up to the end would otherwise never tick again
+            ticks.append(time.monotonic())
+            ticker.cancel()
+            return start, body
+
+        start, body = asyncio.run(events())
+
+        assert start["status"] == 200
+        headers = dict(start["headers"])
+        assert headers[b"Content-Type"] == b"text/event-stream"
+        # through the middleware
+        assert headers[b"Access-Control-Allow-Origin"] == b"http://localhost:3000"
+        assert body.decode().startswith("event: running\n")
+        assert body.decode().endswith('event: timeout\ndata: {"id": "abc"}\n\n')
+        # the loop carried on while the stream waited on the job
+        assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < 0.08
+
+    @pytest.mark.django_db
+    def test_job_view_bad_request(self, client) -> None:
+        response = client.post(
+            "/api/risk/jobs/",
+            data=json.dumps(dict(self.data, height="20")),
+            content_type="application/json",
+        )
+
+        assert response.status_code == 400
+        assert response.data["detail"][0]["loc"] == ("height",)
@@ -0,0 +1,148 @@
+import json
+from datetime import date, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from pytest import raises
+
+from premeno.risk_api.canrisk.api import reset_canrisk_clients
+from premeno.risk_api.canrisk.stub import StubConfig, running_stub_server
+from premeno.risk_api.management.commands.warm_canrisk_cache import (
+    DEFAULT_GRID,
+    WarmingPlan,
+    dates_of_birth,
+    grid_profiles,
+)
+from premeno.risk_api.metrics import COUNTERS
+from premeno.risk_api.questionnaire import Questionnaire, age_from_date
+
+GRID = {
+    "base": DEFAULT_GRID["base"],
+    "vary": {
+        "age": [47],
+        "children": [
+            {"nulliparous": False, "age_at_first_child": 28},
+            {"nulliparous": True, "age_at_first_child": ""},
+        ],
+    },
+}
+
+
+def warm(*args, **options) -> str:
+    stdout = StringIO()
+    call_command("warm_canrisk_cache", *map(str, args), stdout=stdout, **options)
+    return stdout.getvalue()
+
+
+class TestGrid:
+    def test_dates_of_birth(self) -> None:
+        for today in (date(2022, 1, 1), date(2022, 6, 15), date(2024, 2, 29), date(2022, 12, 31)):
+            dobs = dates_of_birth(47, today)
+            assert all(int(age_from_date(dob, today)) == 47 for dob in dobs)
+            assert len({dob.year for dob in dobs}) == len(dobs)
+
+        # born either side of new year
+        today = date(2022, 6, 15)
+        youngest, oldest = dates_of_birth(47, today)
+        assert int(age_from_date(youngest + timedelta(days=1), today)) == 46
+        assert int(age_from_date(oldest - timedelta(days=1), today)) == 48
+
+    def test_grid_profiles(self) -> None:
+        profiles = list(grid_profiles(GRID, date(2022, 6, 15)))
+
+        assert len(profiles) == 4
+        assert {profile["nulliparous"] for profile in profiles} == {True, False}
+        assert all(Questionnaire(**profile) for profile in profiles)
+
+    def test_default_grid(self) -> None:
+        plan = WarmingPlan()
+        for profile in grid_profiles(DEFAULT_GRID):
+            plan.add(profile)
+
+        # 11 ages (born in either of two years), 3 amounts of alcohol, with or without children
+        assert plan.invalid == 0
+        assert len(plan.pedigrees) == 11 * 2 * 3 * 2 * 3
+
+
+class TestWarmCanRiskCache:
+    tmp_cache: bool
+    tmp_token: str
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_cache = settings.CANRISK_API_CACHE
+        cls.tmp_token = settings.CANRISK_API_TOKEN
+        settings.CANRISK_API_CACHE = False
+        settings.CANRISK_API_TOKEN = StubConfig().token
+
+    @classmethod
+    def teardown_class(cls):
+        settings.CANRISK_API_CACHE = cls.tmp_cache
+        settings.CANRISK_API_TOKEN = cls.tmp_token
+        reset_canrisk_clients()
+
+    def setup_method(self) -> None:
+        caches[settings.CANRISK_RESULT_CACHE].clear()
+        COUNTERS.reset()
+
+    def test_warms_grid(self, tmp_path) -> None:
+        (tmp_path / "grid.json").write_text(json.dumps(GRID))
+
+        with running_stub_server(StubConfig()) as base_url:
+            report = warm("--grid", tmp_path / "grid.json", "--canrisk", base_url, "--rate", 1000)
+            assert "Before: 0 of 12 distinct CanRisk requests cached" in report
+            assert "Warmed 12" in report
+            assert "After: 12 of 12" in report
+            assert "projected hit rate 100.0%" in report
+            assert COUNTERS.get("canrisk.requests") == 12
+
+            report = warm("--grid", tmp_path / "grid.json", "--canrisk", base_url, "--rate", 1000)
+            assert "Before: 12 of 12" in report
+            assert "Warmed" not in report
+            assert COUNTERS.get("canrisk.requests") == 12
+
+    def test_replay(self, tmp_path) -> None:
+        profiles = list(grid_profiles(GRID))
+        # the common profile comes up three times, and one isn't valid
+        rows = [profiles[0], profiles[0], profiles[0], profiles[1], dict(profiles[1], height=20)]
+        (tmp_path / "in.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+        with running_stub_server(StubConfig()) as base_url:
+            warm(
+                "--grid", self._grid(tmp_path, profiles[0]), "--canrisk", base_url, "--rate", 1000
+            )
+            report = warm("--replay", tmp_path / "in.jsonl", "--dry-run")
+
+        assert "Before: 3 of 6 distinct CanRisk requests cached (50.0% coverage)" in report
+        assert "projected hit rate 75.0% over 12 lookups (1 invalid profiles skipped)" in report
+
+    def test_failures(self, tmp_path) -> None:
+        with running_stub_server(StubConfig(error_rate=1.0)) as base_url:
+            reset_canrisk_clients()
+            profile = next(grid_profiles(GRID))
+            report = warm(
+                "--grid", self._grid(tmp_path, profile), "--canrisk", base_url, "--rate", 1000
+            )
+
+        assert "Warmed 0" in report
+        assert "After: 0 of 3" in report
+        reset_canrisk_clients()
+
+    def test_bad_options(self, tmp_path) -> None:
+        with raises(CommandError):
+            warm("--rate", 0)
+
+        with raises(CommandError):
+            warm("--grid", tmp_path / "missing.json")
+
+        (tmp_path / "in.txt").write_text("")
+        with raises(CommandError):
+            warm("--replay", tmp_path / "in.txt")
+
+    def _grid(self, tmp_path, profile: dict) -> str:
+        path = tmp_path / "one.json"
+        path.write_text(json.dumps({"base": profile, "vary": {}}))
+        return str(path)
@@ -1,15 +1,40 @@
-from rest_framework import viewsets
+import json
+
+from django.db import transaction
+from django.http import HttpRequest, HttpResponseNotAllowed, JsonResponse
+from django.urls import reverse
+from pydantic import ValidationError
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from premeno.risk_api.asgi import AsyncStreamingHttpResponse
+from premeno.risk_api.canrisk.api import canrisk_clients
+from premeno.risk_api.jobs import (
+    get_job,
+    job_events,
+    job_events_async,
+    server_sent_event,
+    submit_job,
+)
+from premeno.risk_api.metrics import COUNTERS
 from premeno.risk_api.questionnaire import Questionnaire
-from premeno.risk_api.risk import risk_predictions
+from premeno.risk_api.risk import risk_predictions, risk_predictions_async, sensitivity_predictions
+from premeno.risk_api.serializers import SensitivitySerializer
+
+
+def _invalid_questionnaire(err: ValidationError) -> Response:
+    return Response({"detail": err.errors()}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RiskPredictionsViewSet(viewsets.ViewSet):
     """API endpoint for risk predictions"""
 
-    authentication_classes = []
-    permission_classes = []
+    authentication_classes: list = []
+    permission_classes: list = []
 
     def create(self, request):
         """
@@ -17,5 +42,147 @@ class RiskPredictionsViewSet(viewsets.ViewSet):
         data
         """
 
-        data = Questionnaire(**request.data)
+        try:
+            data = Questionnaire(**request.data)
+        except ValidationError as err:
+            return _invalid_questionnaire(err)
+
         return Response(risk_predictions(data, 5))
+
+    @action(detail=False, methods=["post"])
+    def sensitivity(self, request):
+        """
+        Posting a questionnaire and a list of perturbations (a field and a new value
+        for it) returns the risk for the questionnaire, and the risk and change in
+        risk for each perturbation
+        """
+        serializer = SensitivitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        raw = serializer.validated_data["questionnaire"]
+        perturbations = serializer.validated_data["perturbations"]
+        try:
+            data = Questionnaire(**raw)
+        except ValidationError as err:
+            return _invalid_questionnaire(err)
+
+        return Response(sensitivity_predictions(data, raw, perturbations, 5))
+
+    @action(
+        detail=False,
+        authentication_classes=api_settings.DEFAULT_AUTHENTICATION_CLASSES,
+        permission_classes=[IsAdminUser],
+    )
+    def metrics(self, request):
+        """
+        Counters for the process serving the request, the share of CanRisk
+        results it found in the cache, how many connections its CanRisk
+        clients have opened for the requests they've made, the state of
+        their circuit breakers, and their concurrency limits
+        """
+        counters = COUNTERS.snapshot()
+        hits = counters.get("canrisk.result_cache.hits", 0)
+        lookups = hits + counters.get("canrisk.result_cache.misses", 0)
+
+        return Response(
+            {
+                "counters": counters,
+                "canrisk_result_cache_hit_ratio": hits / lookups if lookups else None,
+                "canrisk_connections": {
+                    base_url: api.connection_stats() for base_url, api in canrisk_clients().items()
+                },
+                "canrisk_circuits": {
+                    base_url: api.breaker.state.value
+                    for base_url, api in canrisk_clients().items()
+                },
+                "canrisk_limits": {
+                    base_url: api.limiter.stats() for base_url, api in canrisk_clients().items()
+                },
+            }
+        )
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renders a response (e.g. an error) as a server-sent event"""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return server_sent_event("error", data)
+
+
+class RiskJobViewSet(viewsets.ViewSet):
+    """
+    API endpoint for risk predictions as jobs, run by risk workers so requests
+    don't wait on CanRisk
+    """
+
+    authentication_classes: list = []
+    permission_classes: list = []
+
+    def create(self, request):
+        """
+        Posting questionnaire data queues the risk predictions for it, and
+        returns the job (with its URL in the Location header) straight away
+        """
+        try:
+            Questionnaire(**request.data)
+        except ValidationError as err:
+            return _invalid_questionnaire(err)
+
+        job_id = submit_job(request.data, 5)
+        return Response(
+            get_job(job_id),
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("api:risk-jobs-detail", args=[job_id])},
+        )
+
+    def retrieve(self, request, pk=None):
+        """The job's status, and its result (the risk predictions) once done"""
+        job = get_job(pk)
+        if job is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(job)
+
+    @action(detail=True, renderer_classes=[EventStreamRenderer])
+    def events(self, request, pk=None):
+        """
+        Server-sent events for the job's status, ending once it's finished.
+        Streamed from job_events_async under ASGI, so waiting between looks
+        at the job doesn't block the event loop
+        """
+        if get_job(pk) is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        response = AsyncStreamingHttpResponse(
+            job_events(pk), job_events_async(pk), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # so proxies pass events on as they come
+        return response
+
+
+@transaction.non_atomic_requests  # ATOMIC_REQUESTS can't wrap async views (nor do we need it)
+async def risk_predictions_async_view(request: HttpRequest):
+    """
+    Async version of RiskPredictionsViewSet.create, for running under ASGI:
+    the CanRisk calls are made with the async client, so a worker can wait on
+    many requests' calls at once
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    try:
+        data = Questionnaire(**json.loads(request.body))
+    except json.JSONDecodeError as err:
+        return JsonResponse({"detail": f"JSON parse error - {err}"}, status=400)
+    except ValidationError as err:
+        return JsonResponse({"detail": err.errors()}, status=400)
+
+    return JsonResponse(await risk_predictions_async(data, 5))
+
+
+# like csrf_exempt, which in this Django version would hide that the view is async
+risk_predictions_async_view.csrf_exempt = True  # type: ignore[attr-defined]